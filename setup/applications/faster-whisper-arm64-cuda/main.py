@@ -41,7 +41,27 @@ model: Optional[WhisperModel] = None
 class ModelConfig(BaseModel):
     model_size: Literal["tiny", "base", "small", "medium", "large-v2", "large-v3", "distil-large-v3"] = "distil-large-v3"
     device: Literal["cpu", "cuda"] = "cuda"
-    compute_type: Literal["int8", "int8_float16", "float16", "float32"] = "float16"
+    compute_type: Literal[
+        "int8", "int8_float16", "int8_float32", "int8_bfloat16", "int16", "float16", "bfloat16", "float32"
+    ] = "float16"
+
+# "auto" picks CUDA when a device is visible, and the fastest compute type it supports (float16 is wrong on CPU)
+model_size = os.environ.get('MODEL_SIZE', 'distil-large-v3')
+model_device = os.environ.get('MODEL_DEVICE', 'auto')
+model_compute_type = os.environ.get('MODEL_COMPUTE_TYPE', 'auto')
+
+def detect_config() -> ModelConfig:
+    import ctranslate2
+
+    device = model_device
+    if device == "auto":
+        device = "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
+    compute_type = model_compute_type
+    if compute_type == "auto":
+        supported = ctranslate2.get_supported_compute_types(device)
+        preferred = ["float16", "int8_float16", "int8", "float32"] if device == "cuda" else ["int8", "int8_float32", "float32"]
+        compute_type = next(c for c in preferred if c in supported)
+    return ModelConfig(model_size=model_size, device=device, compute_type=compute_type)
 
 class TranscriptionResponse(BaseModel):
     text: str
@@ -53,8 +73,8 @@ class TranscriptionResponse(BaseModel):
 async def startup_event():
     """Load the model on startup"""
     global model
-    config = ModelConfig()
-    logger.info(f"Loading Whisper model: {config.model_size} on {config.device}")
+    config = detect_config()
+    logger.info(f"Loading Whisper model: {config.model_size} on {config.device} ({config.compute_type})")
     try:
         model = WhisperModel(
             config.model_size,
@@ -90,6 +110,7 @@ async def model_info():
     
     import ctranslate2
     return {
+        "model_size": model_size,
         "device": model.device,
         "compute_type": model.compute_type,
         "cuda_available": ctranslate2.get_cuda_device_count() > 0,
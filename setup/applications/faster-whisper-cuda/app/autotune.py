@@ -0,0 +1,348 @@
+"""
+Hardware autotuning of the model settings.
+
+The compute type, CPU threads, CTranslate2 workers and beam size used to be
+fixed (float16 on CUDA), which is wrong or slow on CPU-only nodes and leaves
+speed on the table on GPUs that run int8_float16 faster. With AUTOTUNE set to
+"latency" or "throughput", the first boot on a host measures the candidates on
+a sample clip and keeps the best one for that objective:
+
+- latency: median seconds to transcribe the clip, one request at a time
+- throughput: audio seconds transcribed per second with `num_workers`
+  requests in flight
+
+The search is staged rather than a full grid, since every compute type and
+thread count means loading the model again: compute type first, then CPU
+threads (CPU only), then workers (throughput only), then beam size on the
+model that was kept. The beam size stage needs real speech: on the synthetic
+clip the decoder's output, and so its cost per beam, says nothing about real
+requests, so without AUTOTUNE_SAMPLE that stage is skipped and the first
+(default) beam size kept. The result is saved in a JSON file keyed by a fingerprint
+of the host (CPU, GPUs, CTranslate2 version), the model and the search space,
+so later startups reuse it and a different node or model is tuned again.
+"""
+
+import gc
+import hashlib
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+from faster_whisper import WhisperModel
+
+from startup import SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+OBJECTIVES = ("latency", "throughput")
+
+
+@dataclass(frozen=True)
+class TunedConfig:
+    compute_type: str
+    cpu_threads: int
+    num_workers: int
+    beam_size: int
+
+
+def default_compute_types(device: str) -> List[str]:
+    """Candidates in order of preference; the first measured is the baseline"""
+    return ["float16", "int8_float16", "int8"] if device == "cuda" else ["int8", "int8_float32", "float32"]
+
+
+def default_cpu_threads(cpu_threads: int) -> List[int]:
+    """All threads, half and a quarter of them"""
+    return sorted({max(cpu_threads // d, 1) for d in (1, 2, 4)}, reverse=True)
+
+
+def parse_candidates(value: Optional[str], cast=str) -> Optional[list]:
+    """Comma-separated list from the environment, None when unset"""
+    if not value:
+        return None
+    return [cast(v.strip()) for v in value.split(",") if v.strip()]
+
+
+def supported_compute_types(device: str, device_index: int, candidates: Sequence[str]) -> List[str]:
+    import ctranslate2
+
+    try:
+        supported = ctranslate2.get_supported_compute_types(device, device_index)
+    except Exception:
+        return list(candidates)
+    return [c for c in candidates if c in supported]
+
+
+def _cpu_model() -> str:
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name") or line.startswith("Model"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor()
+
+
+def _gpu_names() -> List[str]:
+    try:
+        output = subprocess.run(
+            ["nvidia-smi", "--query-gpu=name", "--format=csv,noheader"],
+            capture_output=True, text=True, timeout=10,
+        ).stdout
+    except (OSError, subprocess.SubprocessError):
+        return []
+    return [line.strip() for line in output.splitlines() if line.strip()]
+
+
+def host_fingerprint(device: str, model_path: str, **search) -> dict:
+    """What the measurements depend on; changing any of it invalidates a saved result"""
+    import ctranslate2
+
+    return {
+        "machine": platform.machine(),
+        "cpu": _cpu_model(),
+        "cpu_count": os.cpu_count(),
+        "gpus": _gpu_names() if device == "cuda" else [],
+        "ctranslate2": ctranslate2.__version__,
+        "device": device,
+        "model": os.path.realpath(model_path),
+        **search,
+    }
+
+
+def fingerprint_key(fingerprint: dict) -> str:
+    return hashlib.sha256(json.dumps(fingerprint, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def load_result(path: str, key: str) -> Optional[dict]:
+    try:
+        with open(path) as f:
+            return json.load(f).get(key)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable autotune file {path}: {e}")
+        return None
+
+
+def save_result(path: str, key: str, result: dict):
+    """Add a result to the file, keeping those of other hosts (the file may sit on a shared volume)"""
+    try:
+        with open(path) as f:
+            results = json.load(f)
+    except (OSError, ValueError):
+        results = {}
+    results[key] = result
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(results, f, indent=2)
+    os.replace(tmp, path)
+
+
+def load_sample(path: Optional[str], seconds: float) -> np.ndarray:
+    """The clip to benchmark on: an audio file if given, else the synthetic warmup signal (not for beam sizes)"""
+    if path:
+        from faster_whisper.audio import decode_audio
+
+        return decode_audio(path)
+    from startup import synthetic_speech
+
+    return synthetic_speech(seconds)
+
+
+class Autotuner:
+    def __init__(
+        self,
+        model_path: str,
+        device: str,
+        objective: str,
+        audio: np.ndarray,
+        compute_types: Sequence[str],
+        cpu_threads: Sequence[int],
+        num_workers: Sequence[int],
+        beam_sizes: Sequence[int],
+        device_index: int = 0,
+        runs: int = 3,
+        loader: Optional[Callable[[str, int, int], WhisperModel]] = None,
+    ):
+        if objective not in OBJECTIVES:
+            raise ValueError(f"Unknown autotune objective {objective!r}, expected one of {OBJECTIVES}")
+        self.model_path = model_path
+        self.device = device
+        self.objective = objective
+        self.audio = audio
+        self.compute_types = list(compute_types)
+        self.cpu_threads = list(cpu_threads)
+        self.num_workers = list(num_workers)
+        self.beam_sizes = list(beam_sizes)
+        self.device_index = device_index
+        self.runs = max(runs, 1)
+        self.loader = loader or (
+            lambda compute_type, threads, workers: WhisperModel(
+                model_path,
+                device=device,
+                device_index=device_index,
+                compute_type=compute_type,
+                cpu_threads=threads,
+                num_workers=workers,
+            )
+        )
+        self.measurements: List[dict] = []
+        self._loaded: Optional[tuple] = None
+        self._model: Optional[WhisperModel] = None
+
+    def _model_for(self, config: TunedConfig) -> WhisperModel:
+        """Keep one model loaded at a time; beam sizes reuse it"""
+        key = (config.compute_type, config.cpu_threads, config.num_workers)
+        if self._loaded != key:
+            self._model = None
+            gc.collect()
+            self._model = self.loader(*key)
+            self._loaded = key
+        return self._model
+
+    def _transcribe(self, model: WhisperModel, beam_size: int) -> float:
+        started = time.perf_counter()
+        # No temperature fallback: every candidate decodes the clip exactly once, so timings compare
+        segments, _ = model.transcribe(self.audio, beam_size=beam_size, vad_filter=False, temperature=0.0)
+        for _ in segments:
+            pass
+        return time.perf_counter() - started
+
+    def measure(self, config: TunedConfig) -> dict:
+        """Transcribe the clip `runs` times per concurrent request after a warmup pass"""
+        entry = {**asdict(config)}
+        try:
+            model = self._model_for(config)
+            self._transcribe(model, config.beam_size)
+            concurrency = config.num_workers if self.objective == "throughput" else 1
+            durations: List[float] = []
+            lock = threading.Lock()
+
+            def worker():
+                for _ in range(self.runs):
+                    seconds = self._transcribe(model, config.beam_size)
+                    with lock:
+                        durations.append(seconds)
+
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                for future in [pool.submit(worker) for _ in range(concurrency)]:
+                    future.result()
+            wall = time.perf_counter() - started
+        except Exception as e:
+            # e.g. a compute type the device claims but cannot run, or out of memory
+            logger.warning(f"Autotune candidate {config} failed: {e}")
+            entry["error"] = str(e)
+            self._loaded = None
+            self._model = None
+            self.measurements.append(entry)
+            return entry
+        audio_seconds = self.audio.size / SAMPLE_RATE
+        entry.update(
+            latency_seconds=round(statistics.median(durations), 4),
+            throughput=round(len(durations) * audio_seconds / wall, 3),
+            real_time_factor=round(statistics.median(durations) / audio_seconds, 4),
+        )
+        logger.info(f"Autotune {config}: {entry['latency_seconds']:.3f}s per clip, {entry['throughput']:.1f} audio s/s")
+        self.measurements.append(entry)
+        return entry
+
+    def _score(self, entry: dict) -> float:
+        if "error" in entry:
+            return float("-inf")
+        return -entry["latency_seconds"] if self.objective == "latency" else entry["throughput"]
+
+    def _measured(self, config: TunedConfig) -> Optional[dict]:
+        return next((m for m in self.measurements if all(m[k] == v for k, v in asdict(config).items())), None)
+
+    def _best(self, configs: List[TunedConfig]) -> TunedConfig:
+        # The stage's baseline was measured by the previous stage
+        scored = [(self._score(self._measured(c) or self.measure(c)), i, c) for i, c in enumerate(configs)]
+        score, _, best = max(scored, key=lambda s: (s[0], -s[1]))
+        if score == float("-inf"):
+            raise RuntimeError("Every autotune candidate failed")
+        return best
+
+    def tune(self) -> dict:
+        started = time.monotonic()
+        best = TunedConfig(
+            compute_type=self.compute_types[0],
+            cpu_threads=self.cpu_threads[0],
+            num_workers=self.num_workers[0],
+            beam_size=self.beam_sizes[0],
+        )
+        stages = [
+            ("compute_type", self.compute_types),
+            ("cpu_threads", self.cpu_threads if self.device == "cpu" else self.cpu_threads[:1]),
+            # More workers cannot lower single-request latency, they only cost memory
+            ("num_workers", self.num_workers if self.objective == "throughput" else self.num_workers[:1]),
+            ("beam_size", self.beam_sizes),
+        ]
+        for field, values in stages:
+            if len(values) > 1:
+                best = self._best([TunedConfig(**{**asdict(best), field: v}) for v in values])
+        chosen = self._measured(best) or self.measure(best)
+        self._model = None
+        gc.collect()
+        return {
+            "objective": self.objective,
+            "config": asdict(best),
+            "chosen": chosen,
+            "measurements": self.measurements,
+            "audio_seconds": round(self.audio.size / SAMPLE_RATE, 2),
+            "tuning_seconds": round(time.monotonic() - started, 1),
+            "tuned_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        }
+
+
+def autotune(
+    model_path: str,
+    device: str,
+    objective: str,
+    cache_path: str,
+    sample: Optional[str] = None,
+    sample_seconds: float = 10.0,
+    **candidates,
+) -> dict:
+    """Return the saved result for this host, model and search space, or tune and save one (blocking)"""
+    search = {k: v for k, v in candidates.items() if k not in ("loader", "runs")}
+    fingerprint = host_fingerprint(
+        device, model_path, objective=objective, sample=sample or f"synthetic:{sample_seconds:g}s", **search
+    )
+    key = fingerprint_key(fingerprint)
+    saved = load_result(cache_path, key)
+    if saved is not None:
+        logger.info(f"Using autotuned config {saved['config']} for host {key}")
+        return {**saved, "fingerprint": key, "source": "saved"}
+
+    logger.info(f"Autotuning for {objective} on host {key}, this runs once per host and model")
+    skipped = []
+    beam_sizes = candidates.get("beam_sizes") or []
+    if sample is None and len(beam_sizes) > 1:
+        logger.warning(
+            f"Skipping the beam size stage of autotuning, it needs real speech: set AUTOTUNE_SAMPLE to an "
+            f"audio file to tune beam sizes {beam_sizes}. Keeping beam size {beam_sizes[0]}"
+        )
+        candidates = {**candidates, "beam_sizes": beam_sizes[:1]}
+        skipped.append("beam_size")
+    tuner = Autotuner(model_path, device, objective, load_sample(sample, sample_seconds), **candidates)
+    result = tuner.tune()
+    result["skipped_stages"] = skipped
+    result["host"] = fingerprint
+    try:
+        save_result(cache_path, key, result)
+    except OSError as e:
+        logger.warning(f"Could not save autotune result to {cache_path}: {e}")
+    logger.info(f"Autotuned config {result['config']} in {result['tuning_seconds']}s")
+    return {**result, "fingerprint": key, "source": "measured"}
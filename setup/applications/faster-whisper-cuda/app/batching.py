@@ -0,0 +1,326 @@
+"""
+Dynamic micro-batching for Whisper transcription.
+
+Concurrent /transcribe requests are collected into batches that close after
+`max_wait_ms` or once `max_batch_size` requests are waiting. Each batch is run
+through faster-whisper's BatchedInferencePipeline: the audio of every request
+is laid end to end and its speech regions are passed as clip timestamps, so the
+chunks of several requests share the same encoder/decoder forward passes.
+Segments are mapped back to their request by time range afterwards.
+
+Models come from a ModelRegistry, so requests for different models can share
+a batching window and are simply run as separate groups. For CPU testing:
+ModelRegistry({"tiny": "tiny"}, "tiny", device="cpu", compute_type="int8").
+
+With model replicas, up to `concurrency` batches run at the same time, each
+on whichever replica is least loaded; the next batch starts collecting as
+soon as a slot is free.
+"""
+
+import asyncio
+import bisect
+import logging
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+
+import numpy as np
+from faster_whisper import BatchedInferencePipeline, WhisperModel
+from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+from metrics import StageTimings, current_timings, record, stage
+
+if TYPE_CHECKING:
+    from executor import InferenceExecutor
+    from registry import ModelRegistry
+
+logger = logging.getLogger(__name__)
+
+SAMPLING_RATE = 16000
+CHUNK_LENGTH = 30  # seconds, Whisper's input window
+OFFSET_TOLERANCE = SAMPLING_RATE // 2000 + 1  # samples: half a millisecond, plus float truncation
+
+
+@dataclass
+class BatchRequest:
+    model: str
+    audio: np.ndarray
+    language: Optional[str]
+    task: str
+    beam_size: int
+    vad_filter: bool
+    future: asyncio.Future
+    enqueued_at: float
+    timings: Optional[StageTimings] = None
+
+
+class BatchScheduler:
+    """Collects concurrent transcription requests and runs them in batches"""
+
+    def __init__(
+        self,
+        registry: "ModelRegistry",
+        max_batch_size: int = 8,
+        max_wait_ms: float = 50,
+        chunk_batch_size: int = 16,
+        executor: Optional["InferenceExecutor"] = None,
+        concurrency: int = 1,
+    ):
+        self.registry = registry
+        self.executor = executor
+        self.concurrency = max(concurrency, 1)
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.chunk_batch_size = chunk_batch_size
+        self.queue: "asyncio.Queue[BatchRequest]" = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        self._running: set = set()
+        # Stats
+        self.batches_run = 0
+        self.requests_served = 0
+        self.batch_sizes: Counter = Counter()
+        self.total_wait = 0.0
+
+    def start(self):
+        """Start the background batching loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the batching loop and fail any request still waiting"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for task in list(self._running):
+            task.cancel()
+        await asyncio.gather(*self._running, return_exceptions=True)
+        while not self.queue.empty():
+            request = self.queue.get_nowait()
+            if not request.future.done():
+                request.future.set_exception(RuntimeError("Scheduler stopped"))
+
+    async def submit(
+        self,
+        audio: np.ndarray,
+        model: str,
+        language: Optional[str] = None,
+        task: str = "transcribe",
+        beam_size: int = 5,
+        vad_filter: bool = True,
+    ) -> dict:
+        """Queue a decoded 16 kHz mono waveform and wait for its transcription"""
+        loop = asyncio.get_running_loop()
+        request = BatchRequest(
+            model=model,
+            audio=audio,
+            language=language,
+            task=task,
+            beam_size=beam_size,
+            vad_filter=vad_filter,
+            future=loop.create_future(),
+            enqueued_at=time.monotonic(),
+            timings=current_timings.get(),
+        )
+        await self.queue.put(request)
+        return await request.future
+
+    def stats(self) -> dict:
+        """Queue depth and batch-size statistics"""
+        return {
+            "queue_depth": self.queue.qsize(),
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches_run": self.batches_run,
+            "requests_served": self.requests_served,
+            "avg_batch_size": self.requests_served / self.batches_run if self.batches_run else 0.0,
+            "avg_queue_wait_ms": 1000 * self.total_wait / self.requests_served if self.requests_served else 0.0,
+            "batch_size_histogram": dict(sorted(self.batch_sizes.items())),
+        }
+
+    async def _collect(self) -> List[BatchRequest]:
+        """Wait for one request, then keep collecting until the window closes or the batch is full"""
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        slots = asyncio.Semaphore(self.concurrency)
+        while True:
+            await slots.acquire()
+            batch = await self._collect()
+            task = asyncio.create_task(self._run_batch(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+            task.add_done_callback(lambda _: slots.release())
+
+    async def _run_batch(self, batch: List[BatchRequest]):
+        started = time.monotonic()
+        self.batches_run += 1
+        self.requests_served += len(batch)
+        self.batch_sizes[len(batch)] += 1
+        self.total_wait += sum(started - r.enqueued_at for r in batch)
+        for request in batch:
+            record("queue_wait", started - request.enqueued_at, request.timings)
+
+        # Stages of the batched pass are shared by every request in the batch
+        batch_timings = StageTimings()
+        token = current_timings.set(batch_timings)
+        try:
+            if self.executor is not None:
+                results = await self.executor.call(self._transcribe_batch, batch)
+            else:
+                results = await asyncio.to_thread(self._transcribe_batch, batch)
+        except Exception as e:
+            logger.error(f"Batch transcription error: {e}")
+            results = [e] * len(batch)
+        finally:
+            current_timings.reset(token)
+
+        for request, result in zip(batch, results):
+            if request.timings is not None:
+                request.timings.merge(batch_timings)
+            if request.future.done():
+                continue
+            if isinstance(result, Exception):
+                request.future.set_exception(result)
+            else:
+                request.future.set_result(result)
+        logger.info(f"Batch of {len(batch)} transcribed in {time.monotonic() - started:.2f}s")
+
+    def _transcribe_batch(self, batch: List[BatchRequest]) -> List[object]:
+        """Transcribe a batch, one model at a time"""
+        results: List[object] = [None] * len(batch)
+        by_model: Dict[str, List[int]] = {}
+        for i, request in enumerate(batch):
+            by_model.setdefault(request.model, []).append(i)
+
+        for name, indices in by_model.items():
+            try:
+                with self.registry.use(name) as model:
+                    model_results = self._transcribe_with_model(model, [batch[i] for i in indices])
+            except Exception as e:
+                logger.error(f"Transcription error for model {name}: {e}")
+                model_results = [e] * len(indices)
+            for i, result in zip(indices, model_results):
+                results[i] = result
+        return results
+
+    def _transcribe_with_model(self, model: WhisperModel, batch: List[BatchRequest]) -> List[object]:
+        """Requests are grouped by decoding options since the pipeline shares one tokenizer"""
+        results: List[object] = [None] * len(batch)
+        groups: Dict[Tuple[str, str, int], List[int]] = {}
+        probabilities: List[float] = [1.0] * len(batch)
+
+        for i, request in enumerate(batch):
+            try:
+                if request.language:
+                    language = request.language
+                else:
+                    language, probabilities[i] = self._detect_language(model, request)
+            except Exception as e:
+                results[i] = e
+                continue
+            groups.setdefault((language, request.task, request.beam_size), []).append(i)
+
+        pipeline = BatchedInferencePipeline(model=model)
+        for (language, task, beam_size), indices in groups.items():
+            try:
+                group_results = self._transcribe_group(
+                    pipeline, [batch[i] for i in indices], [probabilities[i] for i in indices],
+                    language, task, beam_size
+                )
+            except Exception as e:
+                logger.error(f"Transcription error for batch group ({language}, {task}): {e}")
+                group_results = [e] * len(indices)
+            for i, result in zip(indices, group_results):
+                results[i] = result
+        return results
+
+    def _detect_language(self, model: WhisperModel, request: BatchRequest) -> Tuple[str, float]:
+        if not model.model.is_multilingual:
+            return "en", 1.0
+        language, probability, _ = model.detect_language(audio=request.audio, vad_filter=request.vad_filter)
+        return language, probability
+
+    def _transcribe_group(
+        self,
+        pipeline: BatchedInferencePipeline,
+        requests: List[BatchRequest],
+        probabilities: List[float],
+        language: str,
+        task: str,
+        beam_size: int,
+    ) -> List[dict]:
+        # Lay the waveforms end to end and describe each request's speech as clip timestamps
+        offsets = []  # in samples: the seconds reported back are rounded, so compare with a tolerance
+        clips = []
+        position = 0
+        for request in requests:
+            offsets.append(position)
+            for clip in speech_clips(request.audio, request.vad_filter):
+                clips.append({
+                    "start": (position + clip["start"]) / SAMPLING_RATE,
+                    "end": (position + clip["end"]) / SAMPLING_RATE,
+                })
+            position += len(request.audio)
+
+        segment_lists: List[List[dict]] = [[] for _ in requests]
+        if clips:
+            audio = np.concatenate([r.audio for r in requests])
+            segments, _ = pipeline.transcribe(
+                audio,
+                language=language,
+                task=task,
+                beam_size=beam_size,
+                clip_timestamps=clips,
+                batch_size=self.chunk_batch_size,
+            )
+            for segment in segments:
+                # faster-whisper rounds to the millisecond, so a segment at the very start of a request
+                # can be reported up to half a millisecond before its offset
+                owner = bisect.bisect_right(offsets, round(segment.start * SAMPLING_RATE) + OFFSET_TOLERANCE) - 1
+                offset = offsets[owner] / SAMPLING_RATE
+                segment_lists[owner].append({
+                    "start": max(round(segment.start - offset, 3), 0.0),
+                    "end": round(segment.end - offset, 3),
+                    "text": segment.text,
+                })
+
+        return [
+            {
+                "text": " ".join(s["text"] for s in segment_list),
+                "language": language,
+                # 1.0 where the language was given rather than detected, as faster-whisper reports it
+                "language_probability": probability,
+                "segments": segment_list,
+            }
+            for segment_list, probability in zip(segment_lists, probabilities)
+        ]
+
+
+def speech_clips(audio: np.ndarray, vad_filter: bool) -> List[dict]:
+    """Split a waveform into clips (in samples) no longer than one Whisper window"""
+    if vad_filter:
+        with stage("vad"):
+            return get_speech_timestamps(
+                audio,
+                VadOptions(max_speech_duration_s=CHUNK_LENGTH, min_silence_duration_ms=160),
+            )
+    window = CHUNK_LENGTH * SAMPLING_RATE
+    return [
+        {"start": start, "end": min(start + window, len(audio))}
+        for start in range(0, len(audio), window)
+    ]
@@ -0,0 +1,141 @@
+"""
+Content-addressed transcription cache.
+
+Results are keyed on the SHA-256 of the uploaded bytes plus every parameter that
+changes the output (decoding options, model and compute type) and the version
+of the result layout, so entries written by an older release are misses rather
+than results with fields missing. Entries live in an in-memory LRU bounded by
+encoded size and, optionally, in a SQLite file so they survive restarts. Disk
+hits are promoted to memory.
+"""
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import BinaryIO, Optional
+
+logger = logging.getLogger(__name__)
+
+READ_CHUNK = 1024 * 1024
+# Bump when the fields of a cached result change
+RESULT_VERSION = 2
+
+
+def upload_digest(stream: BinaryIO) -> str:
+    """SHA-256 of a file-like object, read in chunks and rewound afterwards"""
+    digest = hashlib.sha256()
+    stream.seek(0)
+    while chunk := stream.read(READ_CHUNK):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+def cache_key(audio_digest: str, **params) -> str:
+    """Combine the audio digest with the decoding parameters"""
+    encoded = json.dumps({**params, "result_version": RESULT_VERSION}, sort_keys=True, default=str)
+    return hashlib.sha256(f"{audio_digest}:{encoded}".encode()).hexdigest()
+
+
+class TranscriptionCache:
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, db_path: Optional[str] = None, disk_max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, accessed REAL NOT NULL)"
+            )
+            logger.info(f"Transcription cache persisted to {db_path}")
+        # Stats
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return json.loads(value)
+
+            if self._db is not None:
+                row = self._db.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    self._db.execute("UPDATE results SET accessed = ? WHERE key = ?", (time.time(), key))
+                    self._store(key, row[0])
+                    self.disk_hits += 1
+                    return json.loads(row[0])
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, result: dict):
+        value = json.dumps(result).encode()
+        with self._lock:
+            self._store(key, value)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO results (key, value, accessed) VALUES (?, ?, ?)",
+                    (key, value, time.time()),
+                )
+                self._prune_disk()
+
+    def _store(self, key: str, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old)
+        self._entries[key] = value
+        self._bytes += len(value)
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+
+    def _prune_disk(self):
+        if not self.disk_max_bytes:
+            return
+        (size,) = self._db.execute("SELECT COALESCE(SUM(LENGTH(value)), 0) FROM results").fetchone()
+        while size > self.disk_max_bytes:
+            row = self._db.execute("SELECT key, LENGTH(value) FROM results ORDER BY accessed LIMIT 1").fetchone()
+            if row is None:
+                break
+            self._db.execute("DELETE FROM results WHERE key = ?", (row[0],))
+            size -= row[1]
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        stats = {
+            "memory_entries": len(self._entries),
+            "memory_bytes": self._bytes,
+            "memory_max_bytes": self.max_bytes,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "disk_enabled": self._db is not None,
+        }
+        if self._db is not None:
+            with self._lock:
+                count, size = self._db.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM results"
+                ).fetchone()
+            stats.update({"disk_entries": count, "disk_bytes": size})
+        return stats
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,244 @@
+"""
+Decode stage on a process pool.
+
+Decoding a container (mp3, m4a, ogg...) to 16 kHz float32 is CPU work that
+used to run on the inference executor's threads, so a worker decoding request
+N+1 was a worker not feeding the GPU, and the decoder and the Python side of
+inference contended for the GIL. Uploads are now decoded in separate
+processes, concurrently with inference on earlier requests.
+
+Neither the upload nor the decoded waveform travels through a pipe. The worker
+opens the upload by path: a spooled upload that spilled to disk through
+/proc/<pid>/fd, one still in memory after it is written to a file in shared
+memory (/dev/shm) straight from the spool's buffer. The worker writes the
+waveform to another shared memory file and returns its name, and the server
+maps it copy-on-write and unlinks it right away. The pages are freed once the
+array is garbage collected, and nothing is left behind if either side crashes
+later or the request is cancelled while the worker runs. If shared memory is
+full (Docker's default /dev/shm is 64 MB, see --shm-size), an upload that
+cannot be staged is decoded on a thread, and a waveform that cannot be
+written comes back through the pipe. Everything is decoded on threads when
+the pool is disabled.
+
+A worker that dies (e.g. a decoder crash on a hostile upload) breaks the whole
+process pool. The pool is then replaced, the request that hit it is decoded on
+a thread, and /readyz reports not-ready until the new workers have started.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple, Union
+
+import numpy as np
+from fastapi import UploadFile
+
+from ingest import PeakRss, decode_upload, spilled_to_disk
+from metrics import observe_decode_memory, record
+
+logger = logging.getLogger(__name__)
+
+
+def _start_worker() -> int:
+    """Worker: import the decoder ahead of the first upload"""
+    import faster_whisper.audio  # noqa: F401
+
+    return os.getpid()
+
+
+def _decode_to_shm(source: str, directory: str) -> Tuple[Optional[str], Union[int, np.ndarray], Optional[float]]:
+    """
+    Worker: decode an audio file into a shared memory file.
+    Returns its path and sample count, or (None, waveform) when shared memory is full,
+    and the decode's peak memory growth in MB.
+    """
+    from faster_whisper.audio import decode_audio
+
+    with PeakRss() as memory:
+        audio = decode_audio(source)
+    if not audio.size:
+        return None, audio, memory.growth_mb
+    path = os.path.join(directory, f"whisper-pcm-{uuid.uuid4().hex}")
+    try:
+        # A plain write, not a memory map: a full tmpfs fails it with ENOSPC instead of SIGBUS
+        with open(path, "xb") as f:
+            f.write(memoryview(audio))
+    except OSError:
+        _unlink(path)
+        return None, audio, memory.growth_mb
+    return path, audio.size, memory.growth_mb
+
+
+def _unlink(path: str):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def _discard(future: Future):
+    """Done-callback of a decode nobody waits for any more: remove the waveform it wrote"""
+    if not future.cancelled() and future.exception() is None:
+        path, _, _ = future.result()
+        if path is not None:
+            _unlink(path)
+
+
+def _stage_upload(file: UploadFile, directory: str) -> Tuple[Optional[str], bool]:
+    """
+    A path a worker can open the upload by, and whether it is a staged copy to unlink afterwards.
+    None when the upload is neither on disk nor fits in shared memory.
+    """
+    if spilled_to_disk(file):
+        # The spool file is unlinked; the worker opens it through the server's descriptor
+        path = f"/proc/{os.getpid()}/fd/{file.file.fileno()}"
+        return (path, False) if os.path.exists(path) else (None, False)
+    getbuffer = getattr(getattr(file.file, "_file", None), "getbuffer", None)
+    if getbuffer is None:
+        return None, False
+    path = os.path.join(directory, f"whisper-upload-{uuid.uuid4().hex}")
+    try:
+        # The spool's own buffer: no copy of the upload on the heap
+        with open(path, "xb") as f, getbuffer() as buffer:
+            f.write(buffer)
+    except OSError:
+        _unlink(path)
+        return None, False
+    return path, True
+
+
+def _attach(path: str, samples: int) -> np.ndarray:
+    """Map a decoded waveform (copy-on-write, so inference may modify it) and unlink its file"""
+    try:
+        return np.memmap(path, dtype=np.float32, mode="c", shape=(samples,))
+    finally:
+        _unlink(path)
+
+
+class DecodePool:
+    def __init__(self, workers: int = 2, directory: str = "/dev/shm"):
+        self.workers = workers
+        self.directory = directory
+        self._pool: Optional[ProcessPoolExecutor] = None
+        if workers > 0 and os.path.isdir(directory):
+            self._pool = self._new_pool()
+        elif workers > 0:
+            logger.warning(f"Shared memory directory {directory} not found, decoding on threads")
+        # Set while a pool whose worker died is being replaced
+        self.broken = False
+        # Stats
+        self.pool_decodes = 0
+        self.thread_decodes = 0
+        self.fallbacks = 0
+        self.restarts = 0
+
+    def _new_pool(self) -> ProcessPoolExecutor:
+        # Spawned, not forked: the server process holds CUDA state that must not be inherited
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    async def decode_upload(self, file: UploadFile) -> np.ndarray:
+        """Decode an upload to a 16 kHz mono float32 waveform without blocking the event loop"""
+        if self._pool is None:
+            return await self._on_thread(decode_upload, file)
+        path, staged = await asyncio.to_thread(_stage_upload, file, self.directory)
+        if path is None:
+            self.fallbacks += 1
+            return await self._on_thread(decode_upload, file)
+        try:
+            return await self._in_pool(path, decode_upload, file)
+        finally:
+            if staged:
+                _unlink(path)
+
+    async def decode_path(self, path: str) -> np.ndarray:
+        """Decode an audio file on disk"""
+        from faster_whisper.audio import decode_audio
+
+        if self._pool is None:
+            return await self._on_thread(decode_audio, path)
+        return await self._in_pool(path, decode_audio, path)
+
+    async def _in_pool(self, source: str, fallback, *args) -> np.ndarray:
+        """Decode `source` in a worker; `fallback(*args)` decodes it on a thread if the pool is broken"""
+        started = time.perf_counter()
+        pool = self._pool
+        try:
+            future = pool.submit(_decode_to_shm, source, self.directory)
+            try:
+                path, result, growth_mb = await asyncio.wrap_future(future)
+            except asyncio.CancelledError:
+                # The worker carries on: its shared memory file must not outlive the request
+                future.add_done_callback(_discard)
+                raise
+        except BrokenProcessPool:
+            self._replace(pool)
+            return await self._on_thread(fallback, *args)
+        if path is not None:
+            audio = _attach(path, result)
+        else:
+            audio = result
+            if audio.size:
+                self.fallbacks += 1
+        record("decode", time.perf_counter() - started)
+        observe_decode_memory(growth_mb)
+        self.pool_decodes += 1
+        return audio
+
+    def _replace(self, broken: ProcessPoolExecutor):
+        """Swap a pool whose worker died for a new one, started in the background"""
+        if self._pool is not broken:
+            # A concurrent request already replaced it
+            return
+        logger.error("A decode worker died, restarting the decode pool")
+        self.broken = True
+        self.restarts += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+        self._pool = self._new_pool()
+        asyncio.get_running_loop().run_in_executor(None, self._recover, self._pool)
+
+    def _recover(self, pool: ProcessPoolExecutor):
+        try:
+            self._warm(pool)
+        except Exception as e:
+            logger.error(f"Decode pool failed to restart: {e}")
+            return
+        if self._pool is pool:
+            self.broken = False
+            logger.info("Decode pool restarted")
+
+    async def _on_thread(self, fn, *args) -> np.ndarray:
+        started = time.perf_counter()
+        audio = await asyncio.to_thread(fn, *args)
+        record("decode", time.perf_counter() - started)
+        self.thread_decodes += 1
+        return audio
+
+    def warm(self):
+        """Start the worker processes now instead of on the first upload (blocking)"""
+        if self._pool is not None:
+            self._warm(self._pool)
+
+    def _warm(self, pool: ProcessPoolExecutor):
+        for future in [pool.submit(_start_worker) for _ in range(self.workers)]:
+            future.result()
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers if self._pool is not None else 0,
+            "shm_directory": self.directory,
+            "pool_decodes": self.pool_decodes,
+            "thread_decodes": self.thread_decodes,
+            # Uploads or waveforms that did not fit in shared memory
+            "pipe_fallbacks": self.fallbacks,
+            "broken": self.broken,
+            "restarts": self.restarts,
+        }
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,202 @@
+"""
+Bounded worker pool for blocking inference.
+
+faster-whisper calls (decoding, model.transcribe and iterating its lazy segment
+generator) block for seconds, so they run on a dedicated thread pool instead of
+the asyncio event loop. Requests are admitted up to `max_workers + max_queue`;
+anything beyond that is rejected immediately so clients get fast backpressure
+instead of piling up behind a long file.
+"""
+
+import asyncio
+import contextvars
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Deque, Iterable, Iterator, Optional, Tuple
+
+_DONE = object()
+
+
+class Overloaded(Exception):
+    """Raised when the admission queue is full"""
+
+
+class ShuttingDown(Exception):
+    """Raised when work is submitted after shutdown"""
+
+
+class InferenceExecutor:
+    def __init__(self, max_workers: int = 2, max_queue: int = 32):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="inference")
+        self._lock = threading.Lock()
+        self._closed = False
+        self.admitted = 0
+        self.running = 0
+        self.rejected = 0
+
+    def try_admit(self):
+        """Reserve a request slot or raise Overloaded/ShuttingDown"""
+        with self._lock:
+            if self._closed:
+                raise ShuttingDown("Inference executor is shutting down")
+            if self.admitted >= self.max_workers + self.max_queue:
+                self.rejected += 1
+                raise Overloaded(f"{self.admitted} requests already admitted")
+            self.admitted += 1
+
+    def _reserve(self) -> bool:
+        """Take a slot if one is free, without counting a rejection"""
+        with self._lock:
+            if self._closed:
+                raise ShuttingDown("Inference executor is shutting down")
+            if self.admitted < self.max_workers + self.max_queue:
+                self.admitted += 1
+                return True
+            return False
+
+    async def wait_admit(self, poll_interval: float = 0.05):
+        """Reserve a request slot, waiting for one to free up instead of raising Overloaded"""
+        while not self._reserve():
+            await asyncio.sleep(poll_interval)
+
+    def release(self):
+        with self._lock:
+            self.admitted -= 1
+
+    @asynccontextmanager
+    async def admission(self):
+        """Hold a request slot for the duration of the block"""
+        self.try_admit()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def _tracked(self, fn: Callable, *args, **kwargs) -> Any:
+        with self._lock:
+            self.running += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self.running -= 1
+
+    async def call(self, fn: Callable, *args, **kwargs) -> Any:
+        """Run a blocking function on the pool and await its result"""
+        if self._closed:
+            raise ShuttingDown("Inference executor is shutting down")
+        loop = asyncio.get_running_loop()
+        # Carry context variables (e.g. the request's stage timings) into the worker thread
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self._pool, lambda: context.run(self._tracked, fn, *args, **kwargs))
+
+    async def iterate(self, fn: Callable[..., Iterable], *args, **kwargs) -> AsyncIterator:
+        """
+        Run a blocking generator on the pool and yield its items as they are produced.
+
+        Items are handed over through an asyncio.Queue; closing the async iterator
+        (e.g. on client disconnect) stops the worker at the next item.
+        """
+        if self._closed:
+            raise ShuttingDown("Inference executor is shutting down")
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+
+        def put(item, error=None):
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, (item, error))
+            except RuntimeError:
+                # Event loop already closed
+                stop.set()
+
+        def produce():
+            try:
+                for item in fn(*args, **kwargs):
+                    if stop.is_set():
+                        return
+                    put(item)
+            except BaseException as e:
+                put(_DONE, e)
+            else:
+                put(_DONE)
+
+        context = contextvars.copy_context()
+        worker = loop.run_in_executor(self._pool, lambda: context.run(self._tracked, produce))
+        try:
+            while True:
+                item, error = await queue.get()
+                if item is _DONE:
+                    if error is not None:
+                        raise error
+                    break
+                yield item
+        finally:
+            stop.set()
+            if worker.done():
+                worker.result()
+
+    def map_ordered(self, fn: Callable, items: Iterable, parallel: int) -> Iterator:
+        """
+        Blocking, for use on a worker: yield fn(item) for each item, in order.
+
+        Up to `parallel` items ahead are handed to the pool, each taking an
+        admission slot while it is queued or running, so fanned-out work counts
+        against the same limits as requests. Without a free slot an item runs on
+        the calling thread instead, as does any item whose turn comes before a
+        worker picked it up: the caller never waits on work queued behind it.
+        """
+        context = contextvars.copy_context()
+        items = iter(items)
+        window: Deque[Tuple[Any, Optional[Future]]] = deque()
+
+        def submit(item) -> Optional[Future]:
+            if self._closed or not self._reserve():
+                return None
+            try:
+                future = self._pool.submit(context.copy().run, self._tracked, fn, item)
+            except RuntimeError:
+                # Shut down in the meantime
+                self.release()
+                return None
+            future.add_done_callback(lambda _: self.release())
+            return future
+
+        def fill():
+            while len(window) < max(parallel, 1):
+                item = next(items, _DONE)
+                if item is _DONE:
+                    return
+                window.append((item, submit(item)))
+
+        fill()
+        try:
+            while window:
+                item, future = window.popleft()
+                fill()
+                if future is None or future.cancel():
+                    yield fn(item)
+                else:
+                    yield future.result()
+        finally:
+            for _, future in window:
+                if future is not None:
+                    future.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "running": self.running,
+            "admitted": self.admitted,
+            "queued": max(self.admitted - self.running, 0),
+            "rejected": self.rejected,
+        }
+
+    def shutdown(self):
+        self._closed = True
+        self._pool.shutdown(wait=False, cancel_futures=True)
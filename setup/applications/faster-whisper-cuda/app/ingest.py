@@ -0,0 +1,120 @@
+"""
+Audio ingestion without temporary files.
+
+Starlette already spools every multipart upload into a SpooledTemporaryFile that
+stays in memory up to a size threshold and rolls over to disk beyond it.
+Decoding straight from that file object avoids reading the upload into a bytes
+object and writing a second copy to a NamedTemporaryFile, and does not depend on
+the filename having an extension (PyAV probes the container from its content).
+
+The peak memory of each decode is measured with PeakRss: Linux keeps one peak
+RSS per process (VmHWM), and writing 5 to /proc/self/clear_refs restarts it
+from the current RSS, so the peak read afterwards belongs to that decode alone.
+That is exact in a decode pool worker, which decodes one file at a time; on a
+server thread, concurrent decodes and inference share the reading.
+"""
+
+import logging
+from typing import BinaryIO, Optional
+
+import av
+import numpy as np
+from fastapi import UploadFile
+from faster_whisper.audio import decode_audio
+from starlette.formparsers import MultiPartParser
+
+from metrics import observe_decode_memory
+
+logger = logging.getLogger(__name__)
+
+
+def configure_upload_spooling(max_bytes: int):
+    """Set how large an upload may grow in memory before it is spilled to disk"""
+    # The attribute was renamed from max_file_size to spool_max_size in newer Starlette
+    for attr in ("spool_max_size", "max_file_size"):
+        if hasattr(MultiPartParser, attr):
+            setattr(MultiPartParser, attr, max_bytes)
+
+
+def upload_stream(file: UploadFile) -> BinaryIO:
+    """Rewind the spooled upload and return it as a file-like object for the decoder"""
+    file.file.seek(0)
+    return file.file
+
+
+def spilled_to_disk(file: UploadFile) -> bool:
+    return bool(getattr(file.file, "_rolled", False))
+
+
+def decode_upload(file: UploadFile) -> np.ndarray:
+    """Decode an upload to a 16 kHz mono float32 waveform (blocking)"""
+    with PeakRss() as memory:
+        audio = decode_audio(upload_stream(file))
+    observe_decode_memory(memory.growth_mb)
+    logger.info(
+        f"Decoded {file.filename or 'upload'}: {file.size or 0} bytes "
+        f"({'disk' if spilled_to_disk(file) else 'memory'}), {audio.shape[0] / 16000:.1f}s audio, "
+        f"peak RSS +{memory.growth_mb if memory.growth_mb is not None else float('nan'):.1f} MB"
+    )
+    return audio
+
+
+def decode_head(stream: BinaryIO, seconds: float, sampling_rate: int = 16000) -> np.ndarray:
+    """Decode only the first `seconds` of a file to a mono float32 waveform (blocking)"""
+    limit = int(seconds * sampling_rate)
+    resampler = av.audio.resampler.AudioResampler(format="s16", layout="mono", rate=sampling_rate)
+    chunks = []
+    total = 0
+    stream.seek(0)
+    with av.open(stream, mode="r", metadata_errors="ignore") as container:
+        frames = container.decode(audio=0)
+        while total < limit:
+            try:
+                frame = next(frames)
+            except StopIteration:
+                frame = None  # flush the resampler
+            except av.error.InvalidDataError:
+                continue
+            if frame is not None:
+                frame.pts = None
+            for resampled in resampler.resample(frame):
+                array = resampled.to_ndarray().reshape(-1)
+                chunks.append(array)
+                total += array.size
+            if frame is None:
+                break
+    if not chunks:
+        return np.zeros(0, dtype=np.float32)
+    return np.concatenate(chunks)[:limit].astype(np.float32) / 32768.0
+
+
+def _status_mb(field: str) -> Optional[float]:
+    """A memory field of /proc/self/status (in kB there) in MB"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class PeakRss:
+    """How far RSS rose above its starting value during a `with` block, in MB; None where unsupported"""
+
+    def __enter__(self) -> "PeakRss":
+        self.growth_mb: Optional[float] = None
+        self._before = _status_mb("VmRSS")
+        try:
+            with open("/proc/self/clear_refs", "w") as f:
+                f.write("5")
+            self._reset = True
+        except OSError:
+            self._reset = False
+        return self
+
+    def __exit__(self, *exc_info):
+        peak = _status_mb("VmHWM") if self._reset else None
+        if peak is not None and self._before is not None:
+            self.growth_mb = max(peak - self._before, 0.0)
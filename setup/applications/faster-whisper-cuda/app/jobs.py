@@ -0,0 +1,343 @@
+"""
+Durable job queue for bulk transcription.
+
+Clients submit a file with POST /jobs and poll or subscribe for the result
+instead of holding a connection open for the whole transcription. Jobs and
+their uploaded audio are stored under a local directory (SQLite + one file per
+job), so queued work survives restarts; jobs that were running when the process
+died are put back in the queue on startup.
+
+Jobs are claimed in priority order: the "interactive" lane always goes before
+the "bulk" lane, and bulk jobs can be capped to fewer workers than the total so
+a large backfill leaves room for interactive work.
+
+Completed and failed jobs, results included, are deleted once they have been
+finished for longer than the retention period, so nightly backfills of
+thousands of files do not grow the table without bound.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Awaitable, BinaryIO, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+LANES = {"interactive": 0, "bulk": 1}
+TERMINAL = ("completed", "failed")
+
+JobHandler = Callable[[dict, Callable[[float], Awaitable[None]]], Awaitable[dict]]
+
+
+class JobQueue:
+    """SQLite-backed job table plus a directory holding each job's audio"""
+
+    def __init__(self, directory: str):
+        self.audio_dir = os.path.join(directory, "audio")
+        os.makedirs(self.audio_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            os.path.join(directory, "jobs.db"), check_same_thread=False, isolation_level=None
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, status TEXT NOT NULL, lane TEXT NOT NULL, priority INTEGER NOT NULL, "
+            "filename TEXT, params TEXT NOT NULL, cache_key TEXT, progress REAL NOT NULL DEFAULT 0, "
+            "result BLOB, error TEXT, created REAL NOT NULL, started REAL, finished REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (status, priority, created)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished)")
+        logger.info(f"Job queue stored in {directory}")
+
+    def audio_path(self, job_id: str) -> str:
+        return os.path.join(self.audio_dir, job_id)
+
+    def create(
+        self,
+        stream: BinaryIO,
+        params: dict,
+        lane: str = "bulk",
+        filename: Optional[str] = None,
+        cache_key: Optional[str] = None,
+        result: Optional[dict] = None,
+    ) -> dict:
+        """Store the audio and enqueue a job; a known result completes it immediately (blocking)"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        if result is None:
+            stream.seek(0)
+            with open(self.audio_path(job_id), "wb") as f:
+                shutil.copyfileobj(stream, f)
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, status, lane, priority, filename, params, cache_key, progress, result, "
+                "created, started, finished) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job_id,
+                    "queued" if result is None else "completed",
+                    lane,
+                    LANES[lane],
+                    filename,
+                    json.dumps(params),
+                    cache_key,
+                    0.0 if result is None else 1.0,
+                    None if result is None else json.dumps(result).encode(),
+                    now,
+                    None if result is None else now,
+                    None if result is None else now,
+                ),
+            )
+        return self.get(job_id)
+
+    def claim(self, lanes: Tuple[str, ...]) -> Optional[dict]:
+        """Mark the oldest queued job of the highest-priority allowed lane as running"""
+        placeholders = ",".join("?" * len(lanes))
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT id FROM jobs WHERE status = 'queued' AND lane IN ({placeholders}) "
+                "ORDER BY priority, created LIMIT 1",
+                lanes,
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute(
+                "UPDATE jobs SET status = 'running', started = ? WHERE id = ?", (time.time(), row[0])
+            )
+        return self.get(row[0])
+
+    def set_progress(self, job_id: str, progress: float):
+        with self._lock:
+            self._db.execute("UPDATE jobs SET progress = ? WHERE id = ?", (progress, job_id))
+
+    def complete(self, job_id: str, result: dict):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = 'completed', progress = 1, result = ?, finished = ? WHERE id = ?",
+                (json.dumps(result).encode(), time.time(), job_id),
+            )
+        self._discard_audio(job_id)
+
+    def fail(self, job_id: str, error: str):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished = ? WHERE id = ?",
+                (error, time.time(), job_id),
+            )
+        self._discard_audio(job_id)
+
+    def recover(self) -> int:
+        """Requeue jobs left running by a previous process"""
+        with self._lock:
+            return self._db.execute(
+                "UPDATE jobs SET status = 'queued', started = NULL, progress = 0 WHERE status = 'running'"
+            ).rowcount
+
+    def purge(self, finished_before: float) -> int:
+        """Delete completed and failed jobs finished before a timestamp; returns how many (blocking)"""
+        with self._lock:
+            ids = [
+                row[0]
+                for row in self._db.execute(
+                    "SELECT id FROM jobs WHERE finished < ? AND status IN (?, ?)", (finished_before, *TERMINAL)
+                ).fetchall()
+            ]
+            self._db.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in ids])
+        # Normally removed when the job finished; a crash in between may have left it
+        for job_id in ids:
+            self._discard_audio(job_id)
+        return len(ids)
+
+    def get(self, job_id: str, with_result: bool = True) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, status, lane, filename, params, cache_key, progress, error, created, started, "
+                f"finished{', result' if with_result else ''} FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        job = {
+            "id": row[0],
+            "status": row[1],
+            "lane": row[2],
+            "filename": row[3],
+            "params": json.loads(row[4]),
+            "cache_key": row[5],
+            "progress": round(row[6], 3),
+            "error": row[7],
+            "created": row[8],
+            "started": row[9],
+            "finished": row[10],
+        }
+        if with_result:
+            job["result"] = json.loads(row[11]) if row[11] is not None else None
+        return job
+
+    def counts(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            rows = self._db.execute("SELECT lane, status, COUNT(*) FROM jobs GROUP BY lane, status").fetchall()
+        counts: Dict[str, Dict[str, int]] = {lane: {} for lane in LANES}
+        for lane, status, count in rows:
+            counts.setdefault(lane, {})[status] = count
+        return counts
+
+    def _discard_audio(self, job_id: str):
+        try:
+            os.remove(self.audio_path(job_id))
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class JobRunner:
+    """Drains a JobQueue with a fixed number of asyncio workers"""
+
+    def __init__(
+        self,
+        queue: JobQueue,
+        handler: JobHandler,
+        concurrency: int = 1,
+        bulk_concurrency: Optional[int] = None,
+        poll_interval: float = 1.0,
+        progress_interval: float = 1.0,
+        retention_s: float = 0.0,
+        cleanup_interval: float = 3600.0,
+    ):
+        self.queue = queue
+        self.handler = handler
+        self.concurrency = concurrency
+        self.bulk_concurrency = min(bulk_concurrency or concurrency, concurrency)
+        self.poll_interval = poll_interval
+        self.progress_interval = progress_interval
+        # Finished jobs are deleted after this many seconds, 0 keeps them forever
+        self.retention_s = retention_s
+        self.cleanup_interval = cleanup_interval
+        self.running: Counter = Counter()
+        self._workers: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+        self._claim_lock = asyncio.Lock()
+        self._changed = asyncio.Condition()
+        # Stats
+        self.completed = 0
+        self.failed = 0
+        self.purged = 0
+
+    def start(self):
+        recovered = self.queue.recover()
+        if recovered:
+            logger.info(f"Requeued {recovered} interrupted jobs")
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.concurrency)]
+        if self.retention_s > 0:
+            self._workers.append(asyncio.create_task(self._clean_up()))
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def notify(self):
+        """Wake idle workers after a job was enqueued"""
+        self._wakeup.set()
+
+    async def wait_changed(self, timeout: float) -> bool:
+        """Wait until any job changes state or progress; False on timeout"""
+        async with self._changed:
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+                return True
+            except asyncio.TimeoutError:
+                return False
+
+    async def _publish(self):
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def _claim(self) -> Optional[dict]:
+        async with self._claim_lock:
+            lanes = tuple(LANES)
+            if self.running["bulk"] >= self.bulk_concurrency:
+                lanes = tuple(lane for lane in LANES if lane != "bulk")
+            job = await asyncio.to_thread(self.queue.claim, lanes)
+            if job is not None:
+                self.running[job["lane"]] += 1
+            return job
+
+    async def _work(self):
+        while True:
+            job = await self._claim()
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+            try:
+                await self._run(job)
+            finally:
+                self.running[job["lane"]] -= 1
+
+    async def _clean_up(self):
+        """Delete expired jobs now and then every cleanup_interval"""
+        while True:
+            try:
+                purged = await asyncio.to_thread(self.queue.purge, time.time() - self.retention_s)
+            except Exception as e:
+                logger.error(f"Job cleanup failed: {e}")
+            else:
+                self.purged += purged
+                if purged:
+                    logger.info(f"Deleted {purged} jobs finished more than {self.retention_s / 3600:g}h ago")
+            await asyncio.sleep(self.cleanup_interval)
+
+    async def _run(self, job: dict):
+        logger.info(f"Job {job['id']} started ({job['lane']}, {job['filename']})")
+        await self._publish()
+        last_saved = 0.0
+
+        async def report(progress: float):
+            nonlocal last_saved
+            now = time.monotonic()
+            if now - last_saved >= self.progress_interval:
+                last_saved = now
+                await asyncio.to_thread(self.queue.set_progress, job["id"], progress)
+                await self._publish()
+
+        job["audio_path"] = self.queue.audio_path(job["id"])
+        try:
+            result = await self.handler(job, report)
+        except asyncio.CancelledError:
+            raise  # shutting down: the job stays running and is requeued on the next start
+        except Exception as e:
+            logger.error(f"Job {job['id']} failed: {e}")
+            await asyncio.to_thread(self.queue.fail, job["id"], str(e))
+            self.failed += 1
+        else:
+            await asyncio.to_thread(self.queue.complete, job["id"], result)
+            self.completed += 1
+            logger.info(f"Job {job['id']} completed")
+        await self._publish()
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "bulk_concurrency": self.bulk_concurrency,
+            "running": dict(self.running),
+            "completed": self.completed,
+            "failed": self.failed,
+            "retention_seconds": self.retention_s,
+            "purged": self.purged,
+            "jobs": self.queue.counts(),
+        }
@@ -0,0 +1,64 @@
+"""
+Language detection from the head of a file.
+
+Only the first few windows of audio are decoded (see ingest.decode_head), so the
+cost does not grow with file length. The windows are encoded in one batch and
+scored with the model's language-detection head; the text decoder never runs.
+With several windows the per-window probabilities are averaged (probability
+voting), which is more robust than trusting the first 30 seconds alone.
+"""
+
+from typing import Dict
+
+import numpy as np
+from faster_whisper import WhisperModel
+from faster_whisper.audio import pad_or_trim
+from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+from metrics import stage
+
+
+def detect_language_probs(
+    model: WhisperModel,
+    audio: np.ndarray,
+    windows: int = 1,
+    vad_filter: bool = True,
+    top_k: int = 5,
+) -> dict:
+    """Return the most likely language and the top-k language probabilities (blocking)"""
+    if not model.model.is_multilingual:
+        return {
+            "language": "en",
+            "language_probability": 1.0,
+            "top_languages": [{"language": "en", "probability": 1.0}],
+            "windows": 0,
+        }
+
+    if vad_filter:
+        with stage("vad"):
+            speech = get_speech_timestamps(audio, VadOptions(min_silence_duration_ms=500))
+        if speech:
+            audio = np.concatenate([audio[s["start"]:s["end"]] for s in speech])
+
+    window_samples = model.feature_extractor.n_samples
+    chunks = [audio[i:i + window_samples] for i in range(0, len(audio), window_samples)][:windows]
+    if not chunks:
+        chunks = [audio]
+    features = np.stack([pad_or_trim(model.feature_extractor(chunk)) for chunk in chunks])
+
+    encoder_output = model.encode(features)
+    with stage("language_detection"):
+        detected = model.model.detect_language(encoder_output)
+    votes: Dict[str, float] = {}
+    for window_probs in detected:
+        for token, probability in window_probs:
+            language = token[2:-2]  # strip the <|..|> markers
+            votes[language] = votes.get(language, 0.0) + probability / len(chunks)
+
+    ranked = sorted(votes.items(), key=lambda item: item[1], reverse=True)
+    return {
+        "language": ranked[0][0],
+        "language_probability": ranked[0][1],
+        "top_languages": [{"language": lang, "probability": prob} for lang, prob in ranked[:top_k]],
+        "windows": len(chunks),
+    }
@@ -0,0 +1,108 @@
+"""
+Load reporting and load-aware readiness.
+
+/health only says whether the model is loaded, so a gateway cannot tell a
+saturated replica from an idle one and keeps sending traffic to a pod whose
+queue is already half a minute deep. Completed requests are kept in a sliding
+window; from it and the executor's queue we estimate how long a new request
+would wait (queued requests divided by recent throughput, Little's law).
+/readyz turns not-ready while the estimate or the queue depth is above its
+threshold, and ready again only once both have dropped below a fraction of it,
+so the pod does not flap in and out of the load balancer.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Deque, List, Tuple
+
+import numpy as np
+
+
+class RecentRequests:
+    """Sliding window of completed requests: (finished, seconds, audio seconds)"""
+
+    def __init__(self, window_s: float = 60.0):
+        self.window_s = window_s
+        self._entries: Deque[Tuple[float, float, float]] = deque()
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float, audio_seconds: float = 0.0):
+        now = time.monotonic()
+        with self._lock:
+            self._entries.append((now, seconds, audio_seconds))
+            self._expire(now)
+
+    def _expire(self, now: float):
+        while self._entries and self._entries[0][0] < now - self.window_s:
+            self._entries.popleft()
+
+    def summary(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entries = list(self._entries)
+        if not entries:
+            return {"requests": 0, "throughput": 0.0, "latency_p50": None, "latency_p95": None, "real_time_factor": None}
+        latencies = np.array([seconds for _, seconds, _ in entries])
+        audio = sum(audio_seconds for _, _, audio_seconds in entries)
+        span = max(now - entries[0][0], 1.0)
+        return {
+            "requests": len(entries),
+            "throughput": len(entries) / span,
+            "latency_p50": float(np.percentile(latencies, 50)),
+            "latency_p95": float(np.percentile(latencies, 95)),
+            "real_time_factor": sum(seconds for _, seconds, audio_seconds in entries if audio_seconds) / audio
+            if audio else None,
+        }
+
+
+def estimate_wait(queued: int, workers: int, recent: dict) -> float:
+    """Seconds a newly admitted request would wait before a worker picks it up"""
+    if queued <= 0:
+        return 0.0
+    if recent["throughput"]:
+        return queued / recent["throughput"]
+    # Nothing finished lately (e.g. right after startup): assume the typical latency per worker
+    return queued * (recent["latency_p50"] or 0.0) / max(workers, 1)
+
+
+class Readiness:
+    """Saturation thresholds with hysteresis; 0 disables a threshold"""
+
+    def __init__(self, max_queued: int = 0, max_wait_s: float = 0.0, recover: float = 0.8):
+        self.max_queued = max_queued
+        self.max_wait_s = max_wait_s
+        self.recover = recover
+        self.saturated = False
+        self.transitions = 0
+
+    def update(self, queued: int, wait_s: float) -> List[str]:
+        """Re-evaluate saturation; returns the thresholds currently exceeded"""
+        reasons = []
+        if self.max_queued and queued > self.max_queued:
+            reasons.append(f"queued {queued} > {self.max_queued}")
+        if self.max_wait_s and wait_s > self.max_wait_s:
+            reasons.append(f"estimated wait {wait_s:.1f}s > {self.max_wait_s:.1f}s")
+        if reasons:
+            saturated = True
+        elif self.saturated:
+            # Stay out of rotation until the load is well below the thresholds
+            saturated = (
+                (self.max_queued and queued > self.max_queued * self.recover)
+                or (self.max_wait_s and wait_s > self.max_wait_s * self.recover)
+            )
+            if saturated:
+                reasons.append("recovering")
+        else:
+            saturated = False
+        if bool(saturated) != self.saturated:
+            self.transitions += 1
+        self.saturated = bool(saturated)
+        return reasons
+
+    def thresholds(self) -> dict:
+        return {"max_queued": self.max_queued, "max_wait_seconds": self.max_wait_s, "recover": self.recover}
+
+
+recent_requests = RecentRequests()
@@ -0,0 +1,157 @@
+"""
+Chunked parallel transcription for long recordings.
+
+The audio is cut into chunks of at most one Whisper window, preferably in the
+silence between VAD speech regions. Chunks are then transcribed concurrently:
+on CUDA as batched passes through BatchedInferencePipeline, elsewhere by fanning
+out to the shared InferenceExecutor's threads, taking one of its admission slots
+per chunk (CTranslate2 runs them in parallel when the model was loaded with
+num_workers > 1). Results are merged back in chunk order with timestamps shifted
+to the original timeline. When chunks had to be cut inside speech they overlap
+by OVERLAP_S: segments that belong to the previous chunk are dropped, and so is
+a sentence decoded on both sides of the cut.
+"""
+
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Tuple, TYPE_CHECKING
+
+import numpy as np
+from faster_whisper import BatchedInferencePipeline, WhisperModel
+from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+from metrics import stage
+
+if TYPE_CHECKING:
+    from executor import InferenceExecutor
+
+SAMPLING_RATE = 16000
+MAX_CHUNK_S = 30
+OVERLAP_S = 1.0
+
+
+@dataclass
+class Chunk:
+    start: int  # samples, including overlap
+    end: int
+    keep_from: float  # seconds; segments centred before this belong to the previous chunk
+
+
+def plan_chunks(audio: np.ndarray, vad_filter: bool = True, max_chunk_s: float = MAX_CHUNK_S) -> List[Chunk]:
+    """Cut audio into chunks of at most max_chunk_s"""
+    max_samples = int(max_chunk_s * SAMPLING_RATE)
+    if not vad_filter:
+        overlap = int(OVERLAP_S * SAMPLING_RATE)
+        step = max_samples - overlap
+        return [
+            Chunk(start=max(0, s - overlap), end=min(s + step, len(audio)), keep_from=s / SAMPLING_RATE)
+            for s in range(0, len(audio), step)
+        ]
+
+    # Pack consecutive speech regions, only cutting in the silence between them
+    with stage("vad"):
+        speech = get_speech_timestamps(
+            audio, VadOptions(max_speech_duration_s=max_chunk_s, min_silence_duration_ms=500)
+        )
+    chunks: List[Chunk] = []
+    for region in speech:
+        if chunks and region["end"] - chunks[-1].start <= max_samples:
+            chunks[-1].end = region["end"]
+        else:
+            chunks.append(Chunk(start=region["start"], end=region["end"], keep_from=region["start"] / SAMPLING_RATE))
+    return chunks
+
+
+def transcribe_long(
+    model: WhisperModel,
+    audio: np.ndarray,
+    language: Optional[str] = None,
+    task: str = "transcribe",
+    beam_size: int = 5,
+    vad_filter: bool = True,
+    workers: int = 4,
+    batch_size: int = 16,
+    executor: Optional["InferenceExecutor"] = None,
+) -> Tuple[dict, Iterator[dict]]:
+    """
+    Return language info and an iterator over merged segments, in order (blocking).
+
+    Off CUDA, up to `workers` chunks run on `executor` at a time; without one
+    the chunks run one after another on the calling thread.
+    """
+    chunks = plan_chunks(audio, vad_filter=vad_filter)
+
+    language_probability = 1.0
+    if language is None:
+        if model.model.is_multilingual and chunks:
+            first = chunks[0]
+            language, language_probability, _ = model.detect_language(audio=audio[first.start:first.end])
+        else:
+            language = "en"
+    info = {"language": language, "language_probability": language_probability, "chunks": len(chunks)}
+
+    if model.model.device == "cuda":
+        segments = _batched(model, audio, chunks, language, task, beam_size, batch_size)
+    else:
+        segments = _threaded(model, audio, chunks, language, task, beam_size, workers, executor)
+    return info, _deduplicate(segments)
+
+
+def _batched(model, audio, chunks, language, task, beam_size, batch_size) -> Iterator[Tuple[Chunk, dict]]:
+    if not chunks:
+        return
+    # Batched clips are decoded independently, so overlap is not needed there
+    clips = [{"start": c.keep_from, "end": c.end / SAMPLING_RATE} for c in chunks]
+    segments, _ = BatchedInferencePipeline(model=model).transcribe(
+        audio,
+        language=language,
+        task=task,
+        beam_size=beam_size,
+        clip_timestamps=clips,
+        batch_size=batch_size,
+    )
+    for segment in segments:
+        yield None, {"start": segment.start, "end": segment.end, "text": segment.text}
+
+
+def _threaded(model, audio, chunks, language, task, beam_size, workers, executor) -> Iterator[Tuple[Chunk, dict]]:
+    def run(chunk: Chunk) -> List[dict]:
+        offset = chunk.start / SAMPLING_RATE
+        segments, _ = model.transcribe(
+            audio[chunk.start:chunk.end],
+            language=language,
+            task=task,
+            beam_size=beam_size,
+            vad_filter=False,
+            condition_on_previous_text=False,
+        )
+        return [
+            {"start": round(offset + s.start, 3), "end": round(offset + s.end, 3), "text": s.text}
+            for s in segments
+        ]
+
+    # Ordered merge: emit chunk i as soon as it and everything before it is done
+    results = executor.map_ordered(run, chunks, workers) if executor is not None else map(run, chunks)
+    for chunk, segments in zip(chunks, results):
+        for segment in segments:
+            yield chunk, segment
+
+
+def _deduplicate(segments: Iterator[Tuple[Optional[Chunk], dict]]) -> Iterator[dict]:
+    previous: Optional[Tuple[Chunk, dict]] = None
+    for chunk, segment in segments:
+        if chunk is None:
+            # Batched clips do not overlap
+            yield segment
+            continue
+        if (segment["start"] + segment["end"]) / 2 < chunk.keep_from:
+            continue  # lies in the overlap, already covered by the previous chunk
+        if (
+            previous is not None
+            and previous[0] is not chunk
+            and segment["start"] < previous[1]["end"]
+            and segment["text"].strip()
+            and segment["text"].strip() == previous[1]["text"].strip()
+        ):
+            continue  # same sentence decoded on both sides of a cut
+        previous = chunk, segment
+        yield segment
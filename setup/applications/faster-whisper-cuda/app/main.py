@@ -3,16 +3,49 @@ Faster Whisper Streaming API
 A simple FastAPI wrapper for faster-whisper with audio and text streaming support.
 """
 
-from fastapi import FastAPI, File, UploadFile, HTTPException, Query
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse, JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-from faster_whisper import WhisperModel
 from pydantic import BaseModel
 from typing import Optional, Literal
-import tempfile
 import os
 import json
 import logging
+import asyncio
+import time
+
+from batching import BatchScheduler
+from decodepool import DecodePool
+from executor import InferenceExecutor, Overloaded, ShuttingDown
+from ingest import configure_upload_spooling, decode_head, upload_stream
+from langid import detect_language_probs
+from realtime import RealtimeSession
+from cache import TranscriptionCache, cache_key, upload_digest
+from registry import ModelRegistry, parse_model_sources, resolve_model_path
+from longform import transcribe_long
+from jobs import TERMINAL, JobQueue, JobRunner
+from startup import StartupTracker, synthetic_speech
+from autotune import (
+    autotune,
+    default_compute_types,
+    default_cpu_threads,
+    parse_candidates,
+    supported_compute_types,
+)
+from load import Readiness, estimate_wait, recent_requests
+from serialize import stream_event, stream_media_type, transcript_response
+from faster_whisper.vad import get_vad_model
+from metrics import (
+    BATCH_QUEUE_DEPTH,
+    READY,
+    REQUESTS_IN_FLIGHT,
+    RequestTimingMiddleware,
+    finish_request,
+    instrument_faster_whisper,
+    render,
+    staged,
+    start_request,
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -34,136 +67,479 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Global model instance
+# Per-stage latency metrics (upload, decode, VAD, encoder, decoder, queue wait)
+app.add_middleware(RequestTimingMiddleware)
+instrument_faster_whisper()
+
+# Model registry: MODELS is "name=path_or_size,..."; the default model is pinned
 model_path = os.environ.get('MODEL_PATH', '/opt/app/model/distil-large-v3')
-model: Optional[WhisperModel] = None
+model_sources = parse_model_sources(os.environ.get('MODELS', f'distil-large-v3={model_path}'))
+default_model = os.environ.get('DEFAULT_MODEL', next(iter(model_sources)))
+model_memory_budget_mb = float(os.environ.get('MODEL_MEMORY_BUDGET_MB', '0'))
+model_num_workers = int(os.environ.get('MODEL_NUM_WORKERS', '1'))
+model_cache_dir = os.environ.get('MODEL_CACHE_DIR') or None
+model_device = os.environ.get('MODEL_DEVICE', 'cuda')
+model_compute_type = os.environ.get('MODEL_COMPUTE_TYPE', 'float16' if model_device == 'cuda' else 'int8')
+# Replicas per model, spread over MODEL_DEVICE_INDEX on CUDA or splitting MODEL_CPU_THREADS on CPU
+model_replicas = int(os.environ.get('MODEL_REPLICAS', '1'))
+model_device_indexes = [int(i) for i in os.environ.get('MODEL_DEVICE_INDEX', '0').split(',') if i.strip()]
+model_cpu_threads = int(os.environ.get('MODEL_CPU_THREADS', str(os.cpu_count() or 1)))
+registry: Optional[ModelRegistry] = None
+# Default for requests that do not pass beam_size
+default_beam_size = int(os.environ.get('DEFAULT_BEAM_SIZE', '5'))
+
+# Autotuning: "latency" or "throughput" benchmarks the settings above on first boot and saves them per host
+autotune_objective = os.environ.get('AUTOTUNE', 'off')
+autotune_path = os.environ.get('AUTOTUNE_PATH', os.path.join(model_cache_dir or '/opt/app', 'autotune.json'))
+autotune_sample = os.environ.get('AUTOTUNE_SAMPLE') or None
+autotune_audio_seconds = float(os.environ.get('AUTOTUNE_AUDIO_SECONDS', '10'))
+autotune_runs = int(os.environ.get('AUTOTUNE_RUNS', '3'))
+autotune_result: Optional[dict] = None
+
+# Long-form mode: chunks transcribed concurrently (threads on CPU, batched passes on CUDA)
+longform_workers = int(os.environ.get('LONGFORM_WORKERS', '4'))
+
+# Micro-batching scheduler for /transcribe
+batch_max_size = int(os.environ.get('BATCH_MAX_SIZE', '8'))
+batch_max_wait_ms = float(os.environ.get('BATCH_MAX_WAIT_MS', '50'))
+batch_chunk_size = int(os.environ.get('BATCH_CHUNK_SIZE', '16'))
+scheduler: Optional[BatchScheduler] = None
+
+# Bounded worker pool for blocking inference
+inference_workers = int(os.environ.get('INFERENCE_WORKERS', str(max(2, model_replicas * model_num_workers))))
+inference_queue_size = int(os.environ.get('INFERENCE_QUEUE_SIZE', '32'))
+executor: Optional[InferenceExecutor] = None
+
+# Upload decoding runs on a process pool, handing waveforms over through shared memory; 0 decodes on threads
+decode_workers = int(os.environ.get('DECODE_WORKERS', '2'))
+decode_shm_dir = os.environ.get('DECODE_SHM_DIR', '/dev/shm')
+decode_pool: Optional[DecodePool] = None
+
+# Uploads stay in memory up to this size, larger ones are spooled to disk
+upload_spool_max_bytes = int(os.environ.get('UPLOAD_SPOOL_MAX_BYTES', str(64 * 1024 * 1024)))
+configure_upload_spooling(upload_spool_max_bytes)
+
+# Content-addressed result cache, optionally persisted to SQLite
+cache = TranscriptionCache(
+    max_bytes=int(os.environ.get('CACHE_MAX_BYTES', str(256 * 1024 * 1024))),
+    db_path=os.environ.get('CACHE_DB_PATH') or None,
+    disk_max_bytes=int(os.environ.get('CACHE_DISK_MAX_BYTES', '0')),
+)
+
+# Durable job queue for bulk transcription (POST /jobs)
+jobs_dir = os.environ.get('JOBS_DIR', '/opt/app/jobs')
+jobs_concurrency = int(os.environ.get('JOBS_CONCURRENCY', '1'))
+jobs_bulk_concurrency = int(os.environ.get('JOBS_BULK_CONCURRENCY', str(jobs_concurrency)))
+# Completed and failed jobs (and their results) are deleted this long after they finished, 0 keeps them
+jobs_retention_hours = float(os.environ.get('JOBS_RETENTION_HOURS', '168'))
+jobs_cleanup_interval_s = float(os.environ.get('JOBS_CLEANUP_INTERVAL_SECONDS', '3600'))
+job_queue: Optional[JobQueue] = None
+job_runner: Optional[JobRunner] = None
+
+# Startup runs in the background; requests get 503 until the warmup workload has run
+warmup_audio_seconds = float(os.environ.get('WARMUP_AUDIO_SECONDS', '5'))
+warmup_runs = int(os.environ.get('WARMUP_RUNS', '1'))
+startup = StartupTracker()
+startup_task: Optional[asyncio.Task] = None
+
+# /readyz turns not-ready above these (0 disables), so the gateway stops routing to a saturated pod
+readiness = Readiness(
+    max_queued=int(os.environ.get('READY_MAX_QUEUED', str(inference_queue_size // 2))),
+    max_wait_s=float(os.environ.get('READY_MAX_WAIT_SECONDS', '10')),
+)
 
 # Configuration
 class ModelConfig(BaseModel):
     model_size: Literal["tiny", "base", "small", "medium", "large-v2", "large-v3", "distil-large-v3"] = "distil-large-v3"
     device: Literal["cpu", "cuda"] = "cuda"
-    compute_type: Literal["int8", "int8_float16", "float16", "float32"] = "float16"
+    compute_type: Literal[
+        "int8", "int8_float16", "int8_float32", "int8_bfloat16", "int16", "float16", "bfloat16", "float32"
+    ] = "float16"
 
 class TranscriptionResponse(BaseModel):
     text: str
     language: Optional[str] = None
     segments: list = []
 
+def admit():
+    """Reserve an inference slot, translating a full queue into HTTP backpressure"""
+    try:
+        executor.try_admit()
+    except Overloaded:
+        raise HTTPException(status_code=429, detail="Too many requests in flight", headers={"Retry-After": "1"})
+    except ShuttingDown:
+        raise HTTPException(status_code=503, detail="Server shutting down")
+
+def resolve_model(name: Optional[str]) -> str:
+    """Validate the per-request model parameter"""
+    if registry is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    try:
+        return registry.resolve(name)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def lookup_cache(file: UploadFile, model_name: str, **params):
+    """Hash the upload with the decoding parameters; returns the cache key and any cached result"""
+    digest = await asyncio.to_thread(staged("cache_lookup", upload_digest), file.file)
+    key = cache_key(
+        digest,
+        model=registry.sources[model_name],
+        compute_type=registry.compute_type,
+        **params
+    )
+    return key, await asyncio.to_thread(cache.get, key)
+
 # Startup/Shutdown events
 @app.on_event("startup")
 async def startup_event():
-    """Load the model on startup"""
-    global model
-    config = ModelConfig()
-    logger.info(f"Loading Whisper model: {config.model_size} on {config.device}")
+    """Start loading in the background so /health and /startup answer while the model loads"""
+    global startup_task
+    startup_task = asyncio.create_task(start_service())
+
+async def start_service():
+    """Load the default model, VAD model and job table concurrently, then warm up; other models load on first use"""
+    global registry, scheduler, executor, job_queue, job_runner, decode_pool, autotune_result
+    if autotune_objective != 'off':
+        try:
+            autotune_result = await startup.run("autotune", run_autotune)
+            apply_tuned_config(autotune_result["config"])
+        except Exception as e:
+            # Tuning is an optimization: serve with the configured settings rather than not at all
+            logger.warning(f"Autotuning failed, using the configured settings: {e}")
+            autotune_result = {"objective": autotune_objective, "error": str(e)}
     try:
-        model = WhisperModel(
-            # config.model_size,
-            model_path,
+        # Validates MODEL_DEVICE and MODEL_COMPUTE_TYPE: a bad value fails startup rather than hanging it
+        config = ModelConfig(device=model_device, compute_type=model_compute_type)
+        logger.info(f"Loading Whisper model: {default_model} on {config.device}")
+        models = ModelRegistry(
+            model_sources,
+            default_model,
             device=config.device,
             compute_type=config.compute_type,
-            # local_files_only=True
+            memory_budget_mb=model_memory_budget_mb,
+            num_workers=model_num_workers,
+            cache_dir=model_cache_dir,
+            replicas=model_replicas,
+            device_indexes=model_device_indexes,
+            cpu_threads=model_cpu_threads,
+        )
+        decode_pool = DecodePool(workers=decode_workers, directory=decode_shm_dir)
+        _, _, job_queue, _ = await asyncio.gather(
+            startup.run("load_model", preload_model, models),
+            startup.run("load_vad", get_vad_model),
+            startup.run("open_jobs", JobQueue, jobs_dir),
+            startup.run("start_decoders", decode_pool.warm),
         )
         logger.info("Model loaded successfully")
     except Exception as e:
-        logger.error(f"Failed to load model: {e}")
-        raise
+        startup.fail(e)
+        return
+
+    executor = InferenceExecutor(max_workers=inference_workers, max_queue=inference_queue_size)
+    scheduler = BatchScheduler(
+        models,
+        max_batch_size=batch_max_size,
+        max_wait_ms=batch_max_wait_ms,
+        chunk_batch_size=batch_chunk_size,
+        executor=executor,
+        concurrency=model_replicas,
+    )
+    scheduler.start()
+    REQUESTS_IN_FLIGHT.set_function(lambda: executor.admitted if executor else 0)
+    BATCH_QUEUE_DEPTH.set_function(lambda: scheduler.queue.qsize() if scheduler else 0)
+
+    if warmup_audio_seconds > 0 and warmup_runs > 0:
+        startup.mark("warming")
+        try:
+            await startup.wait("warmup", warmup(models, scheduler))
+        except Exception as e:
+            # A model that loaded but failed its warmup still gets to serve
+            logger.warning(f"Warmup failed: {e}")
+
+    registry = models
+    job_runner = JobRunner(
+        job_queue,
+        run_job,
+        concurrency=jobs_concurrency,
+        bulk_concurrency=jobs_bulk_concurrency,
+        retention_s=jobs_retention_hours * 3600,
+        cleanup_interval=jobs_cleanup_interval_s,
+    )
+    job_runner.start()
+    startup.mark("ready")
+
+def autotune_candidates() -> dict:
+    """Search space: settings given explicitly stay fixed, AUTOTUNE_* lists replace the default candidates"""
+    env = os.environ
+    # Threads are tuned per replica; the replicas then share MODEL_CPU_THREADS as before
+    threads = max(model_cpu_threads // max(model_replicas, 1), 1)
+    compute_types = [model_compute_type] if 'MODEL_COMPUTE_TYPE' in env else supported_compute_types(
+        model_device,
+        model_device_indexes[0],
+        parse_candidates(env.get('AUTOTUNE_COMPUTE_TYPES')) or default_compute_types(model_device),
+    ) or [model_compute_type]
+    return {
+        "compute_types": compute_types,
+        "cpu_threads": [threads] if 'MODEL_CPU_THREADS' in env
+        else parse_candidates(env.get('AUTOTUNE_CPU_THREADS'), int) or default_cpu_threads(threads),
+        "num_workers": [model_num_workers] if 'MODEL_NUM_WORKERS' in env
+        else parse_candidates(env.get('AUTOTUNE_NUM_WORKERS'), int) or [1, 2],
+        # Only the default: a smaller beam is faster but less accurate, so it must be opted into.
+        # The default goes first, it is the one kept when the stage is skipped for want of a sample
+        "beam_sizes": sorted(
+            parse_candidates(env.get('AUTOTUNE_BEAM_SIZES'), int) or [default_beam_size],
+            key=lambda beam_size: beam_size != default_beam_size,
+        ),
+    }
+
+def run_autotune() -> dict:
+    path = resolve_model_path(model_sources[default_model], model_cache_dir)
+    return autotune(
+        path,
+        model_device,
+        autotune_objective,
+        autotune_path,
+        sample=autotune_sample,
+        sample_seconds=autotune_audio_seconds,
+        device_index=model_device_indexes[0],
+        runs=autotune_runs,
+        **autotune_candidates(),
+    )
+
+def apply_tuned_config(tuned: dict):
+    global model_compute_type, model_cpu_threads, model_num_workers, default_beam_size, inference_workers
+    model_compute_type = tuned["compute_type"]
+    model_cpu_threads = tuned["cpu_threads"] * max(model_replicas, 1)
+    model_num_workers = tuned["num_workers"]
+    default_beam_size = tuned["beam_size"]
+    if 'INFERENCE_WORKERS' not in os.environ:
+        inference_workers = max(2, model_replicas * model_num_workers)
+
+def preload_model(models: ModelRegistry):
+    with models.use(default_model):
+        pass
+
+async def warmup(models: ModelRegistry, batcher: BatchScheduler):
+    """
+    Run synthetic audio through the batched, sequential and language detection paths,
+    so CUDA kernel selection and allocator growth happen before the first real request
+    """
+    audio = synthetic_speech(warmup_audio_seconds)
+
+    def sequential():
+        with models.use(default_model) as whisper:
+            segments, _ = whisper.transcribe(audio, beam_size=default_beam_size, vad_filter=False)
+            for _ in segments:
+                pass
+            detect_language_probs(whisper, audio, windows=1, vad_filter=False, top_k=1)
+
+    for _ in range(warmup_runs):
+        # A full micro-batch, so the largest batch shape is the one that gets warmed
+        await asyncio.gather(*(
+            batcher.submit(audio, default_model, language=None, task="transcribe", beam_size=default_beam_size, vad_filter=False)
+            for _ in range(batch_max_size)
+        ))
+        await asyncio.to_thread(sequential)
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on shutdown"""
-    global model
-    model = None
+    global registry, scheduler, executor, job_queue, job_runner, decode_pool
+    if startup_task is not None and not startup_task.done():
+        startup_task.cancel()
+        await asyncio.gather(startup_task, return_exceptions=True)
+    if job_runner is not None:
+        await job_runner.stop()
+        job_runner = None
+    if job_queue is not None:
+        job_queue.close()
+        job_queue = None
+    if scheduler is not None:
+        await scheduler.stop()
+        scheduler = None
+    if executor is not None:
+        executor.shutdown()
+        executor = None
+    if decode_pool is not None:
+        decode_pool.shutdown()
+        decode_pool = None
+    registry = None
+    cache.close()
     logger.info("Model unloaded")
 
 # Health check endpoint
 @app.get("/health")
 async def health_check():
-    """Check if the API and model are ready"""
-    if model is None:
-        raise HTTPException(status_code=503, detail="Model not loaded")
-    return {"status": "healthy", "model_loaded": True}
+    """Check if the API and model are ready (model loaded and warmed up)"""
+    if registry is None:
+        raise HTTPException(status_code=503, detail=f"Model not loaded (startup {startup.state})")
+    return {"status": "healthy", "model_loaded": True, "inference": executor.stats()}
+
+# Probe endpoints: liveness restarts a broken process, readiness takes a busy one out of rotation
+@app.get("/livez")
+async def liveness():
+    """Alive unless startup failed (the event loop answering is the rest of the check)"""
+    if startup.state == "failed":
+        raise HTTPException(status_code=503, detail=f"Startup failed: {startup.error}")
+    return {"status": "alive", "startup": startup.state}
+
+@app.get("/readyz")
+async def readiness_check():
+    """Ready once warmed up and while below the saturation thresholds"""
+    load = current_load()
+    READY.set(1 if load["ready"] else 0)
+    return JSONResponse(load, status_code=200 if load["ready"] else 503)
+
+@app.get("/load")
+async def load_report():
+    """Get queue depth, in-flight work, recent throughput and real-time factor, and the estimated wait"""
+    load = current_load()
+    READY.set(1 if load["ready"] else 0)
+    return load
+
+def current_load() -> dict:
+    """Snapshot of the load, re-evaluating saturation"""
+    stats = executor.stats() if executor else {"max_workers": inference_workers, "running": 0, "admitted": 0, "queued": 0}
+    recent = recent_requests.summary()
+    wait = estimate_wait(stats["queued"], stats["max_workers"], recent)
+    reasons = readiness.update(stats["queued"], wait)
+    if registry is None:
+        reasons.insert(0, f"startup {startup.state}")
+    if decode_pool is not None and decode_pool.broken:
+        reasons.append("decode pool restarting")
+    return {
+        "ready": not reasons,
+        "reasons": reasons,
+        "in_flight": stats["admitted"],
+        "running": stats["running"],
+        "queued": stats["queued"],
+        "batch_queue_depth": scheduler.queue.qsize() if scheduler else 0,
+        "workers": stats["max_workers"],
+        "decode": decode_pool.stats() if decode_pool else None,
+        "estimated_wait_seconds": round(wait, 3),
+        "recent": {
+            "window_seconds": recent_requests.window_s,
+            "requests": recent["requests"],
+            "throughput_per_second": round(recent["throughput"], 3),
+            "latency_p50_seconds": round(recent["latency_p50"], 3) if recent["latency_p50"] is not None else None,
+            "latency_p95_seconds": round(recent["latency_p95"], 3) if recent["latency_p95"] is not None else None,
+            "real_time_factor": round(recent["real_time_factor"], 3) if recent["real_time_factor"] is not None else None,
+        },
+        "thresholds": readiness.thresholds(),
+    }
+
+# Startup progress endpoint
+@app.get("/startup")
+async def startup_status():
+    """Get the startup state and how long each phase (model, VAD, jobs, warmup) took"""
+    return startup.as_dict()
 
 # Model info endpoint
 @app.get("/model-info")
 async def model_info():
-    """Get current model information"""
-    if model is None:
+    """Get current model information, including which models are resident"""
+    if registry is None:
         raise HTTPException(status_code=503, detail="Model not loaded")
     
     import ctranslate2
     return {
-        "device": model.device,
-        "compute_type": model.compute_type,
+        "device": registry.device,
+        "compute_type": registry.compute_type,
+        "num_workers": registry.num_workers,
+        "cpu_threads": model_cpu_threads,
+        "default_beam_size": default_beam_size,
+        "autotune": autotune_result,
         "cuda_available": ctranslate2.get_cuda_device_count() > 0,
-        "cuda_device_count": ctranslate2.get_cuda_device_count()
+        "cuda_device_count": ctranslate2.get_cuda_device_count(),
+        **registry.stats()
     }
 
+# Batching stats endpoint
+@app.get("/batch-stats")
+async def batch_stats():
+    """Get queue depth and batch-size statistics of the /transcribe scheduler"""
+    if scheduler is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    return scheduler.stats()
+
+# Prometheus metrics endpoint
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Stage latency histograms, audio seconds, real-time factor and in-flight requests"""
+    body, content_type = render()
+    return Response(content=body, media_type=content_type)
+
+# Cache stats endpoint
+@app.get("/cache-stats")
+async def cache_stats():
+    """Get hit/miss statistics of the transcription cache"""
+    return cache.stats()
+
 # Standard transcription endpoint
 @app.post("/transcribe", response_model=TranscriptionResponse)
 async def transcribe_audio(
     file: UploadFile = File(...),
     language: Optional[str] = Query(None, description="Language code (e.g., 'en', 'es')"),
     task: Literal["transcribe", "translate"] = Query("transcribe", description="Task type"),
-    beam_size: int = Query(5, ge=1, le=10, description="Beam size for decoding"),
-    vad_filter: bool = Query(True, description="Enable VAD filter")
+    beam_size: Optional[int] = Query(None, ge=1, le=10, description="Beam size for decoding, defaults to DEFAULT_BEAM_SIZE (or the autotuned one)"),
+    vad_filter: bool = Query(True, description="Enable VAD filter"),
+    model: Optional[str] = Query(None, description="Model name (see /model-info), defaults to the pinned model"),
+    long_form: bool = Query(False, description="Split at silences and transcribe chunks in parallel"),
+    format: Literal["json", "compact", "ndjson"] = Query("json", description="json, compact (columnar segments) or ndjson"),
+    debug: bool = Query(False, description="Attach the per-stage latency breakdown")
 ):
     """
     Transcribe an audio file and return the complete result.
     
     Supports various audio formats: mp3, mp4, wav, flac, ogg, etc.
+    Concurrent requests are micro-batched through the batched pipeline.
+    The response is encoded directly; `format=compact` returns segments as
+    parallel start/end/text arrays, `format=ndjson` one segment per line.
     """
-    if model is None:
+    if registry is None or scheduler is None:
         raise HTTPException(status_code=503, detail="Model not loaded")
+    model_name = resolve_model(model)
+    beam_size = beam_size or default_beam_size
+    timings = start_request()
+    
+    key, cached = await lookup_cache(file, model_name, language=language, task=task, beam_size=beam_size, vad_filter=vad_filter, long_form=long_form)
+    if cached is not None:
+        logger.info(f"Cache hit for: {file.filename}")
+        finish_request("transcribe", timings, inference=False)
+        return transcript_response(cached, format, **({"timings": timings.as_dict()} if debug else {}))
+    admit()
     
-    # Save uploaded file to temporary location
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1]) as tmp_file:
-            content = await file.read()
-            tmp_file.write(content)
-            tmp_path = tmp_file.name
-        
         logger.info(f"Processing file: {file.filename}")
         
-        # Transcribe
-        segments, info = model.transcribe(
-            tmp_path,
-            language=language,
-            task=task,
-            beam_size=beam_size,
-            vad_filter=vad_filter
-        )
-        
-        # Collect all segments
-        segment_list = []
-        full_text = []
-        
-        for segment in segments:
-            segment_data = {
-                "start": segment.start,
-                "end": segment.end,
-                "text": segment.text
-            }
-            segment_list.append(segment_data)
-            full_text.append(segment.text)
-        
-        result = {
-            "text": " ".join(full_text),
-            "language": info.language,
-            "segments": segment_list
-        }
+        # Decode in the decode pool (overlapping with inference on earlier requests) and queue for the next batch
+        audio = await decode_pool.decode_upload(file)
+        if long_form:
+            result = await executor.call(
+                run_long_form, audio, model_name, language, task, beam_size, vad_filter
+            )
+        else:
+            result = await scheduler.submit(
+                audio,
+                model_name,
+                language=language,
+                task=task,
+                beam_size=beam_size,
+                vad_filter=vad_filter
+            )
         
-        logger.info(f"Transcription complete. Language: {info.language}")
-        return result
+        await asyncio.to_thread(cache.put, key, result)
+        finish_request("transcribe", timings, len(audio) / 16000)
+        logger.info(f"Transcription complete. Language: {result['language']}")
+        return transcript_response(result, format, **({"timings": timings.as_dict()} if debug else {}))
         
     except Exception as e:
         logger.error(f"Transcription error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
     
     finally:
-        # Cleanup temporary file
-        if os.path.exists(tmp_path):
-            os.unlink(tmp_path)
+        executor.release()
 
 # Streaming transcription endpoint
 @app.post("/transcribe/stream")
@@ -171,117 +547,445 @@ async def transcribe_stream(
     file: UploadFile = File(...),
     language: Optional[str] = Query(None, description="Language code"),
     task: Literal["transcribe", "translate"] = Query("transcribe"),
-    beam_size: int = Query(5, ge=1, le=10),
-    vad_filter: bool = Query(True)
+    beam_size: Optional[int] = Query(None, ge=1, le=10, description="Beam size, defaults to DEFAULT_BEAM_SIZE"),
+    vad_filter: bool = Query(True),
+    model: Optional[str] = Query(None, description="Model name"),
+    long_form: bool = Query(False, description="Split at silences and transcribe chunks in parallel"),
+    format: Literal["sse", "ndjson"] = Query("sse", description="sse, or ndjson (one event per line)"),
+    batch: int = Query(1, ge=1, le=256, description="Segments sent per write; more means fewer, larger writes"),
+    debug: bool = Query(False, description="Attach the per-stage latency breakdown to the complete event")
 ):
     """
     Transcribe an audio file and stream segments as they are processed.
     
-    Returns an SSE (Server-Sent Events) stream with real-time transcription results.
-    Each event contains a JSON object with segment information.
+    Returns an SSE (Server-Sent Events) stream with real-time transcription results,
+    or NDJSON with the same events. Each event contains a JSON object with segment information.
+    With `batch` > 1, segments are held back until that many are ready (or the stream ends).
     """
-    if model is None:
-        raise HTTPException(status_code=503, detail="Model not loaded")
+    model_name = resolve_model(model)
+    beam_size = beam_size or default_beam_size
+    timings = start_request()
+    
+    key, cached = await lookup_cache(file, model_name, language=language, task=task, beam_size=beam_size, vad_filter=vad_filter, long_form=long_form)
+    if cached is not None:
+        logger.info(f"Cache hit for: {file.filename}")
+        finish_request("transcribe_stream", timings, inference=False)
+        return StreamingResponse(
+            replay_stream(cached, format),
+            media_type=stream_media_type(format),
+            headers={
+                "Cache-Control": "no-cache",
+                "Connection": "keep-alive",
+            }
+        )
+    admit()
     
-    # Save uploaded file
+    # Decode now: the upload is closed once this handler returns the response
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1]) as tmp_file:
-            content = await file.read()
-            tmp_file.write(content)
-            tmp_path = tmp_file.name
+        audio = await decode_pool.decode_upload(file)
     except Exception as e:
+        executor.release()
         raise HTTPException(status_code=500, detail=f"File upload error: {e}")
     
     async def generate_stream():
         """Generator function for streaming segments"""
+        results = executor.iterate(
+            run_transcription, audio, model_name, language, task, beam_size, vad_filter, long_form
+        )
         try:
             logger.info(f"Starting streaming transcription for: {file.filename}")
             
-            segments, info = model.transcribe(
-                tmp_path,
-                language=language,
-                task=task,
-                beam_size=beam_size,
-                vad_filter=vad_filter
-            )
+            info = await results.__anext__()
             
             # Send language info first
             language_event = {
                 "type": "language",
-                "language": info.language,
-                "language_probability": info.language_probability
+                "language": info["language"],
+                "language_probability": info["language_probability"]
             }
-            yield f"data: {json.dumps(language_event)}\n\n"
+            yield stream_event(language_event, format)
+            
+            # Stream each segment as it's processed, `batch` per write
+            segment_list = []
+            pending = []
+            async for segment in results:
+                segment_list.append(segment)
+                pending.append(stream_event({"type": "segment", **segment}, format))
+                if len(pending) >= batch:
+                    yield b"".join(pending)
+                    pending = []
+            if pending:
+                yield b"".join(pending)
             
-            # Stream each segment as it's processed
-            for segment in segments:
-                segment_data = {
-                    "type": "segment",
-                    "start": segment.start,
-                    "end": segment.end,
-                    "text": segment.text
-                }
-                yield f"data: {json.dumps(segment_data)}\n\n"
+            await asyncio.to_thread(cache.put, key, {
+                "text": " ".join(s["text"] for s in segment_list),
+                "language": info["language"],
+                "language_probability": info["language_probability"],
+                "segments": segment_list
+            })
+            
+            finish_request("transcribe_stream", timings, len(audio) / 16000)
             
             # Send completion event
             completion_event = {"type": "complete"}
-            yield f"data: {json.dumps(completion_event)}\n\n"
+            if debug:
+                completion_event["timings"] = timings.as_dict()
+            yield stream_event(completion_event, format)
             
             logger.info("Streaming transcription complete")
             
         except Exception as e:
             logger.error(f"Streaming error: {e}")
             error_event = {"type": "error", "message": str(e)}
-            yield f"data: {json.dumps(error_event)}\n\n"
+            yield stream_event(error_event, format)
         
         finally:
-            # Cleanup
-            if os.path.exists(tmp_path):
-                os.unlink(tmp_path)
+            # Stop the worker if the client went away mid-stream
+            await results.aclose()
+            executor.release()
     
     return StreamingResponse(
         generate_stream(),
-        media_type="text/event-stream",
+        media_type=stream_media_type(format),
         headers={
             "Cache-Control": "no-cache",
             "Connection": "keep-alive",
         }
     )
 
+def run_transcription(audio, model_name: str, language, task, beam_size, vad_filter, long_form):
+    """Runs on the inference pool; yields the info first, then each segment as it is decoded"""
+    with registry.use(model_name) as whisper:
+        if long_form:
+            info, segments = transcribe_long(
+                whisper, audio, language, task, beam_size, vad_filter,
+                workers=longform_workers, batch_size=batch_chunk_size, executor=executor
+            )
+            yield info
+            yield from segments
+            return
+        segments, info = whisper.transcribe(
+            audio,
+            language=language,
+            task=task,
+            beam_size=beam_size,
+            vad_filter=vad_filter
+        )
+        yield {"language": info.language, "language_probability": info.language_probability}
+        for segment in segments:
+            yield {"start": segment.start, "end": segment.end, "text": segment.text}
+
+def run_long_form(audio, model_name: str, language, task, beam_size, vad_filter) -> dict:
+    """Long-form transcription collected into a TranscriptionResponse (blocking)"""
+    with registry.use(model_name) as whisper:
+        info, segments = transcribe_long(
+            whisper, audio, language, task, beam_size, vad_filter,
+            workers=longform_workers, batch_size=batch_chunk_size, executor=executor
+        )
+        segment_list = list(segments)
+    logger.info(f"Long-form transcription: {info['chunks']} chunks")
+    return {
+        "text": " ".join(s["text"] for s in segment_list),
+        "language": info["language"],
+        "language_probability": info["language_probability"],
+        "segments": segment_list
+    }
+
+async def replay_stream(result: dict, format: str = "sse"):
+    """Replay a cached transcription as the same events a live stream produces, in one write"""
+    language_event = {
+        "type": "language",
+        "language": result["language"],
+        "language_probability": result["language_probability"]
+    }
+    events = [stream_event(language_event, format)]
+    events += [stream_event({"type": "segment", **segment}, format) for segment in result["segments"]]
+    events.append(stream_event({"type": "complete", "cached": True}, format))
+    yield b"".join(events)
+
+# Real-time microphone transcription endpoint
+@app.websocket("/transcribe/realtime")
+async def transcribe_realtime(
+    ws: WebSocket,
+    language: Optional[str] = Query(None, description="Language code"),
+    beam_size: int = Query(1, ge=1, le=10),
+    min_chunk_ms: int = Query(500, ge=100, le=5000, description="New audio needed before re-decoding"),
+    endpoint_silence_ms: int = Query(600, ge=100, le=5000, description="Trailing silence that ends an utterance"),
+    model: Optional[str] = Query(None, description="Model name")
+):
+    """
+    Transcribe live audio sent as binary PCM16 mono 16 kHz frames.
+    
+    Emits JSON "partial" hypotheses while speech is ongoing and "final" ones once
+    words are stable or an utterance ends. Send {"type": "stop"} (or close) to flush.
+    """
+    await ws.accept()
+    if registry is None:
+        await ws.close(code=1013, reason="Model not loaded")
+        return
+    try:
+        model_name = registry.resolve(model)
+    except KeyError as e:
+        await ws.close(code=1008, reason=str(e))
+        return
+    try:
+        async with executor.admission():
+            whisper = await executor.call(registry.acquire, model_name)
+    except (Overloaded, ShuttingDown):
+        await ws.close(code=1013, reason="Too many requests in flight")
+        return
+    except Exception as e:
+        await ws.close(code=1011, reason=f"Failed to load model: {e}")
+        return
+    
+    session = RealtimeSession(
+        whisper,
+        language=language,
+        beam_size=beam_size,
+        min_chunk_s=min_chunk_ms / 1000,
+        endpoint_silence_ms=endpoint_silence_ms
+    )
+    decoding: Optional[asyncio.Task] = None
+    
+    async def decode(step):
+        # A slot is held per decoding pass rather than for the session, so idle microphones cost none;
+        # while all are taken the pass waits and audio keeps buffering
+        await executor.wait_admit()
+        try:
+            events = await executor.call(step)
+        finally:
+            executor.release()
+        for event in events:
+            await ws.send_json(event)
+    
+    try:
+        while True:
+            message = await ws.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes"):
+                session.feed(message["bytes"], time.monotonic())
+            elif message.get("text") and json.loads(message["text"]).get("type") == "stop":
+                break
+            # Only one decoding pass per session at a time; audio keeps buffering meanwhile
+            if session.ready() and (decoding is None or decoding.done()):
+                decoding = asyncio.create_task(decode(session.step))
+        
+        if decoding is not None:
+            await decoding
+        await decode(session.finish)
+        await ws.send_json({"type": "complete", **session.stats()})
+        await ws.close()
+    except (WebSocketDisconnect, RuntimeError):
+        logger.info("Realtime client disconnected")
+    except Exception as e:
+        logger.error(f"Realtime transcription error: {e}")
+    finally:
+        if decoding is not None and not decoding.done():
+            decoding.cancel()
+        registry.release(model_name, whisper)
+        logger.info(f"Realtime session finished: {session.stats()}")
+
 # Language detection endpoint
 @app.post("/detect-language")
 async def detect_language(
-    file: UploadFile = File(...)
+    file: UploadFile = File(...),
+    windows: int = Query(1, ge=1, le=5, description="30 s windows to vote over"),
+    vad_filter: bool = Query(True, description="Only score windows of detected speech"),
+    top_k: int = Query(5, ge=1, le=100, description="Number of language probabilities to return"),
+    model: Optional[str] = Query(None, description="Model name")
 ):
     """
     Detect the language of an audio file without transcribing.
+    
+    Only the head of the file is decoded and the text decoder never runs,
+    so processing time does not depend on file length; receiving the upload still does.
     """
-    if model is None:
-        raise HTTPException(status_code=503, detail="Model not loaded")
+    model_name = resolve_model(model)
+    timings = start_request()
+    admit()
     
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename)[1]) as tmp_file:
-            content = await file.read()
-            tmp_file.write(content)
-            tmp_path = tmp_file.name
-        
         logger.info(f"Detecting language for: {file.filename}")
         
-        # Transcribe just the first few seconds to detect language
-        segments, info = model.transcribe(tmp_path, beam_size=1)
+        def detect():
+            # With VAD, read twice as much audio so silence doesn't leave the windows empty
+            head_seconds = windows * 30 * (2 if vad_filter else 1)
+            audio = staged("decode", decode_head)(upload_stream(file), head_seconds)
+            with registry.use(model_name) as whisper:
+                return detect_language_probs(whisper, audio, windows=windows, vad_filter=vad_filter, top_k=top_k)
         
-        return {
-            "language": info.language,
-            "language_probability": info.language_probability
-        }
+        result = await executor.call(detect)
+        finish_request("detect_language", timings)
+        return result
         
     except Exception as e:
         logger.error(f"Language detection error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
     
     finally:
-        if os.path.exists(tmp_path):
-            os.unlink(tmp_path)
+        executor.release()
+
+# Batch job endpoints
+async def run_job(job: dict, report) -> dict:
+    """JobRunner handler: decode the stored audio and transcribe it, reporting progress"""
+    params = job["params"]
+    timings = start_request()
+    audio = await decode_pool.decode_path(job["audio_path"])
+    duration = max(len(audio) / 16000, 1e-6)
+    # Counted against the same slots as requests; while they are all taken the job waits rather than fails
+    await executor.wait_admit()
+    results = executor.iterate(
+        run_transcription,
+        audio,
+        params["model"],
+        params["language"],
+        params["task"],
+        params["beam_size"],
+        params["vad_filter"],
+        params["long_form"]
+    )
+    try:
+        info = await results.__anext__()
+        segment_list = []
+        async for segment in results:
+            segment_list.append(segment)
+            await report(min(segment["end"] / duration, 1.0))
+    finally:
+        await results.aclose()
+        executor.release()
+    
+    result = {
+        "text": " ".join(s["text"] for s in segment_list),
+        "language": info["language"],
+        "language_probability": info["language_probability"],
+        "segments": segment_list
+    }
+    await asyncio.to_thread(cache.put, job["cache_key"], result)
+    finish_request("jobs", timings, len(audio) / 16000)
+    return result
+
+def public_job(job: dict) -> dict:
+    """Drop internal fields before returning a job to clients"""
+    return {k: v for k, v in job.items() if k not in ("cache_key", "audio_path")}
+
+@app.post("/jobs", status_code=202)
+async def create_job(
+    file: UploadFile = File(...),
+    language: Optional[str] = Query(None, description="Language code"),
+    task: Literal["transcribe", "translate"] = Query("transcribe"),
+    beam_size: Optional[int] = Query(None, ge=1, le=10, description="Beam size, defaults to DEFAULT_BEAM_SIZE"),
+    vad_filter: bool = Query(True),
+    model: Optional[str] = Query(None, description="Model name"),
+    long_form: bool = Query(False, description="Split at silences and transcribe chunks in parallel"),
+    priority: Literal["interactive", "bulk"] = Query("bulk", description="Queue lane, interactive jobs run first")
+):
+    """
+    Queue an audio file for transcription and return immediately.
+    
+    Poll GET /jobs/{id} or subscribe to GET /jobs/{id}/events for progress and the result.
+    """
+    if job_runner is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    model_name = resolve_model(model)
+    beam_size = beam_size or default_beam_size
+    params = {
+        "model": model_name,
+        "language": language,
+        "task": task,
+        "beam_size": beam_size,
+        "vad_filter": vad_filter,
+        "long_form": long_form
+    }
+    
+    key, cached = await lookup_cache(file, model_name, language=language, task=task, beam_size=beam_size, vad_filter=vad_filter, long_form=long_form)
+    try:
+        job = await asyncio.to_thread(
+            job_queue.create,
+            upload_stream(file),
+            params,
+            lane=priority,
+            filename=file.filename,
+            cache_key=key,
+            result=cached
+        )
+    except Exception as e:
+        logger.error(f"Failed to queue job: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    job_runner.notify()
+    logger.info(f"Queued job {job['id']} ({priority}) for: {file.filename}")
+    return public_job(job)
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Get a job's status, progress and, once completed, its result"""
+    if job_queue is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return public_job(job)
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Stream a job's progress as SSE events.
+    
+    Emits "status" events on every state or progress change and ends with a
+    "complete" event carrying the result, or an "error" event.
+    """
+    # The queue opens before warmup, the runner only once the model is ready
+    queue, runner = job_queue, job_runner
+    if queue is None or runner is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    job = await asyncio.to_thread(queue.get, job_id, False)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    async def generate_events():
+        gone = f"data: {json.dumps({'type': 'error', 'message': 'Job no longer exists'})}\n\n"
+        last = None
+        while True:
+            job = await asyncio.to_thread(queue.get, job_id, False)
+            if job is None:
+                # Deleted by the retention cleanup between two polls
+                yield gone
+                return
+            state = (job["status"], job["progress"])
+            if state != last:
+                last = state
+                status_event = {"type": "status", "status": job["status"], "progress": job["progress"]}
+                yield f"data: {json.dumps(status_event)}\n\n"
+            if job["status"] in TERMINAL:
+                break
+            if not await runner.wait_changed(15):
+                yield ": keepalive\n\n"
+        
+        if job["status"] == "completed":
+            job = await asyncio.to_thread(queue.get, job_id)
+            if job is None:
+                yield gone
+                return
+            yield f"data: {json.dumps({'type': 'complete', 'result': job['result']})}\n\n"
+        else:
+            yield f"data: {json.dumps({'type': 'error', 'message': job['error']})}\n\n"
+    
+    return StreamingResponse(
+        generate_events(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+        }
+    )
+
+# Job stats endpoint
+@app.get("/job-stats")
+async def job_stats():
+    """Get job counts per lane and status, and worker utilisation"""
+    if job_runner is None:
+        raise HTTPException(status_code=503, detail="Model not loaded")
+    return await asyncio.to_thread(job_runner.stats)
 
 # Root endpoint
 @app.get("/")
@@ -292,10 +996,20 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "health": "/health",
+            "livez": "/livez",
+            "readyz": "/readyz",
+            "load": "/load",
+            "startup": "/startup",
             "model_info": "/model-info",
+            "batch_stats": "/batch-stats",
+            "cache_stats": "/cache-stats",
+            "metrics": "/metrics",
             "transcribe": "/transcribe",
             "transcribe_stream": "/transcribe/stream",
+            "transcribe_realtime": "/transcribe/realtime",
             "detect_language": "/detect-language",
+            "jobs": "/jobs",
+            "job_stats": "/job-stats",
             "docs": "/docs"
         }
     }
@@ -0,0 +1,193 @@
+"""
+Prometheus metrics and per-stage latency breakdown.
+
+Each request gets a StageTimings (held in a context variable, which the
+inference executor copies into its worker threads). Stages are timed with
+`stage()`, which records exclusive time: the encoder running inside a batched
+decode is not counted twice. Every timed stage feeds the
+`whisper_stage_seconds` histogram and, when a request is active, that request's
+breakdown, which endpoints return with `?debug=true`.
+
+The model-side stages (encoder, decoder, language detection, VAD inside
+faster-whisper) are timed by wrapping the corresponding faster-whisper methods
+once at startup via `instrument_faster_whisper()`. Requests transcribed in
+the same micro-batch share one breakdown for the batched stages.
+"""
+
+import contextvars
+import functools
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+import faster_whisper.transcribe
+from faster_whisper import BatchedInferencePipeline, WhisperModel
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+from load import recent_requests
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+RTF_BUCKETS = (0.01, 0.02, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 5)
+
+STAGE_SECONDS = Histogram(
+    "whisper_stage_seconds", "Time spent per processing stage", ["stage"], buckets=LATENCY_BUCKETS
+)
+REQUEST_SECONDS = Histogram(
+    "whisper_request_seconds", "End-to-end request latency", ["endpoint"], buckets=LATENCY_BUCKETS
+)
+AUDIO_SECONDS = Counter("whisper_audio_seconds_total", "Seconds of audio transcribed", ["endpoint"])
+REAL_TIME_FACTOR = Histogram(
+    "whisper_real_time_factor", "Processing time divided by audio duration", ["endpoint"], buckets=RTF_BUCKETS
+)
+MODEL_LOAD_SECONDS = Histogram(
+    "whisper_model_load_seconds", "Model load time", ["model"], buckets=(1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+)
+REQUESTS_IN_FLIGHT = Gauge("whisper_requests_in_flight", "Requests admitted to the inference executor")
+BATCH_QUEUE_DEPTH = Gauge("whisper_batch_queue_depth", "Requests waiting for the next micro-batch")
+READY = Gauge("whisper_ready", "1 while /readyz reports ready, 0 while starting or saturated")
+DECODE_PEAK_RSS = Histogram(
+    "whisper_decode_peak_rss_megabytes", "Peak memory growth of the process decoding one upload",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+)
+STARTUP_PHASE_SECONDS = Gauge(
+    "whisper_startup_phase_seconds", "Duration of each startup phase of this process", ["phase"]
+)
+
+request_started: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("request_started", default=None)
+current_timings: contextvars.ContextVar[Optional["StageTimings"]] = contextvars.ContextVar(
+    "current_timings", default=None
+)
+_local = threading.local()
+
+
+class StageTimings:
+    """Accumulated seconds per stage for one request (or one batch)"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float):
+        with self._lock:
+            self.stages[name] += seconds
+
+    def merge(self, other: "StageTimings"):
+        with other._lock:
+            stages = dict(other.stages)
+        for name, seconds in stages.items():
+            self.add(name, seconds)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def as_dict(self) -> dict:
+        """Milliseconds per stage plus the total since the request started"""
+        with self._lock:
+            breakdown = {name: round(seconds * 1000, 2) for name, seconds in self.stages.items()}
+        return {"stages_ms": breakdown, "total_ms": round(self.elapsed() * 1000, 2)}
+
+
+def record(name: str, seconds: float, timings: Optional[StageTimings] = None):
+    STAGE_SECONDS.labels(name).observe(seconds)
+    timings = timings or current_timings.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block of blocking code, excluding nested stages on the same thread"""
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    stack.append(0.0)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        nested = stack.pop()
+        if stack:
+            stack[-1] += elapsed
+        record(name, elapsed - nested)
+
+
+def staged(name: str, fn: Callable) -> Callable:
+    """Wrap a blocking function so each call is timed as `name`"""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with stage(name):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def start_request() -> StageTimings:
+    """Begin the breakdown for the current request, counting time spent receiving the upload"""
+    timings = StageTimings()
+    current_timings.set(timings)
+    started = request_started.get()
+    if started is not None:
+        timings.started = started
+        record("upload", time.perf_counter() - started, timings)
+    return timings
+
+
+def finish_request(endpoint: str, timings: StageTimings, audio_seconds: float = 0.0, inference: bool = True):
+    """Record end-to-end latency, audio processed and real-time factor"""
+    elapsed = timings.elapsed()
+    REQUEST_SECONDS.labels(endpoint).observe(elapsed)
+    if inference:
+        # Cache hits never reach the executor, they would inflate its apparent throughput
+        recent_requests.add(elapsed, audio_seconds)
+    if audio_seconds > 0:
+        AUDIO_SECONDS.labels(endpoint).inc(audio_seconds)
+        REAL_TIME_FACTOR.labels(endpoint).observe(elapsed / audio_seconds)
+
+
+def observe_model_load(name: str, seconds: float):
+    MODEL_LOAD_SECONDS.labels(name).observe(seconds)
+
+
+def observe_decode_memory(megabytes: Optional[float]):
+    if megabytes is not None:
+        DECODE_PEAK_RSS.observe(megabytes)
+
+
+def observe_startup_phase(name: str, seconds: float):
+    STARTUP_PHASE_SECONDS.labels(name).set(seconds)
+
+
+def render() -> tuple:
+    """Prometheus text exposition and its content type"""
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+class RequestTimingMiddleware:
+    """ASGI middleware noting when a request arrived, before its body is read"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            request_started.set(time.perf_counter())
+        await self.app(scope, receive, send)
+
+
+def instrument_faster_whisper():
+    """Time encoder, decoder, language detection and VAD inside faster-whisper (idempotent)"""
+    if getattr(WhisperModel, "_stage_instrumented", False):
+        return
+    WhisperModel.encode = staged("encoder", WhisperModel.encode)
+    WhisperModel.generate_with_fallback = staged("decoder", WhisperModel.generate_with_fallback)
+    WhisperModel.detect_language = staged("language_detection", WhisperModel.detect_language)
+    BatchedInferencePipeline.generate_segment_batched = staged(
+        "decoder", BatchedInferencePipeline.generate_segment_batched
+    )
+    faster_whisper.transcribe.get_speech_timestamps = staged(
+        "vad", faster_whisper.transcribe.get_speech_timestamps
+    )
+    WhisperModel._stage_instrumented = True
@@ -0,0 +1,250 @@
+"""
+Incremental transcription of live PCM16 audio.
+
+A RealtimeSession keeps a rolling buffer of uncommitted audio. Every
+`min_chunk_s` of new audio the buffer is re-transcribed with word timestamps
+and the words are stabilised with local agreement: a word is committed once two
+consecutive hypotheses agree on it. Committed audio is trimmed from the buffer
+so it is never decoded again; the committed text is passed on as the prompt
+instead. Silero VAD drops leading silence and ends an utterance after
+`endpoint_silence_ms` of trailing silence, at which point the remaining
+hypothesis is finalised.
+"""
+
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+from faster_whisper import WhisperModel
+from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+SAMPLING_RATE = 16000
+MAX_BUFFER_S = 30  # Whisper's input window
+PREROLL_S = 0.3  # audio kept in front of detected speech
+PROMPT_WORDS = 50
+
+
+def pcm16_to_float(frame: bytes) -> np.ndarray:
+    return np.frombuffer(frame, dtype=np.int16).astype(np.float32) / 32768.0
+
+
+class LocalAgreement:
+    """Commits the longest prefix two consecutive hypotheses agree on"""
+
+    def __init__(self):
+        self.previous: List[Tuple[float, float, str]] = []
+        self.committed: List[Tuple[float, float, str]] = []
+        self.last_committed_end = 0.0
+
+    def insert(self, words: List[Tuple[float, float, str]]) -> List[Tuple[float, float, str]]:
+        """Add a new hypothesis (absolute timestamps) and return the newly committed words"""
+        words = [w for w in words if w[0] > self.last_committed_end - 0.1]
+        words = self._drop_committed_overlap(words)
+
+        agreed = []
+        for new, old in zip(words, self.previous):
+            if _norm(new[2]) != _norm(old[2]):
+                break
+            agreed.append(new)
+
+        self.previous = words[len(agreed):]
+        if agreed:
+            self.committed.extend(agreed)
+            self.last_committed_end = agreed[-1][1]
+        return agreed
+
+    def flush(self) -> List[Tuple[float, float, str]]:
+        """Commit whatever is left of the last hypothesis"""
+        rest = self.previous
+        self.previous = []
+        if rest:
+            self.committed.extend(rest)
+            self.last_committed_end = rest[-1][1]
+        return rest
+
+    def pending(self) -> List[Tuple[float, float, str]]:
+        return self.previous
+
+    def _drop_committed_overlap(self, words):
+        # Whisper often repeats the last committed words at the start of the trimmed buffer
+        if not words or not self.committed:
+            return words
+        for n in range(min(len(self.committed), len(words), 5), 0, -1):
+            tail = [_norm(w[2]) for w in self.committed[-n:]]
+            head = [_norm(w[2]) for w in words[:n]]
+            if tail == head:
+                return words[n:]
+        return words
+
+
+def _norm(word: str) -> str:
+    return word.strip().lower().strip(".,!?;:\"'")
+
+
+def _text(words) -> str:
+    return "".join(w[2] for w in words).strip()
+
+
+class RealtimeSession:
+    def __init__(
+        self,
+        model: WhisperModel,
+        language: Optional[str] = None,
+        beam_size: int = 1,
+        min_chunk_s: float = 0.5,
+        endpoint_silence_ms: int = 600,
+    ):
+        self.model = model
+        self.language = language
+        self.beam_size = beam_size
+        self.min_chunk = int(min_chunk_s * SAMPLING_RATE)
+        self.endpoint_silence = endpoint_silence_ms * SAMPLING_RATE // 1000
+        self.vad_options = VadOptions(min_silence_duration_ms=endpoint_silence_ms // 2, speech_pad_ms=100)
+
+        # feed() appends on the event loop while step() trims on a worker thread
+        self._lock = threading.Lock()
+        self.buffer = np.zeros(0, dtype=np.float32)
+        self.buffer_offset = 0  # absolute sample index of buffer[0]
+        self.decoded_until = 0  # absolute sample index covered by the last decode
+        self.agreement = LocalAgreement()
+        self.prompt_words: List[str] = []
+        # (absolute end sample, arrival time) per received frame, for latency reporting
+        self.arrivals: List[Tuple[int, float]] = []
+        self.utterance_onset: Optional[float] = None
+        self.first_partial_sent = False
+        self.first_partial_latencies: List[float] = []
+
+    @property
+    def received_until(self) -> int:
+        return self.buffer_offset + len(self.buffer)
+
+    def feed(self, frame: bytes, received_at: Optional[float] = None):
+        with self._lock:
+            self.buffer = np.concatenate([self.buffer, pcm16_to_float(frame)])
+            self.arrivals.append((self.received_until, received_at or time.monotonic()))
+
+    def ready(self) -> bool:
+        """Enough new audio has arrived for another decoding pass"""
+        return self.received_until - self.decoded_until >= self.min_chunk
+
+    def step(self) -> List[dict]:
+        """Run VAD and one decoding pass over the buffer (blocking); returns events to send"""
+        with self._lock:
+            audio = self.buffer
+        self.decoded_until = self.buffer_offset + len(audio)
+        speech = get_speech_timestamps(audio, self.vad_options)
+
+        if not speech:
+            # Nothing to decode, keep only a short pre-roll of silence
+            self._trim_to(self.decoded_until - int(PREROLL_S * SAMPLING_RATE))
+            return []
+
+        if self.utterance_onset is None:
+            self.utterance_onset = self._arrival_of(self.buffer_offset + speech[0]["start"])
+
+        trailing_silence = len(audio) - speech[-1]["end"]
+        if trailing_silence >= self.endpoint_silence or len(audio) >= MAX_BUFFER_S * SAMPLING_RATE:
+            return self._finalize(audio, speech[-1]["end"])
+
+        committed = self.agreement.insert(self._transcribe(audio))
+        events = []
+        if committed:
+            events.append(self._event("final", committed))
+            self._commit(committed)
+        pending = self.agreement.pending()
+        if pending:
+            events.append(self._event("partial", pending))
+        return events
+
+    def finish(self) -> List[dict]:
+        """Finalise any buffered speech when the client stops sending"""
+        with self._lock:
+            audio = self.buffer
+        if len(audio) == 0:
+            return []
+        return self._finalize(audio, len(audio))
+
+    def _finalize(self, audio: np.ndarray, speech_end: int) -> List[dict]:
+        """Commit the whole hypothesis for audio[:speech_end] and drop the snapshot from the buffer"""
+        snapshot_end = self.buffer_offset + len(audio)
+        words = self.agreement.insert(self._transcribe(audio[:speech_end]))
+        words += self.agreement.flush()
+        events = []
+        if words:
+            events.append(self._event("final", words, utterance_end=True))
+            self._commit(words)
+        self._trim_to(snapshot_end)
+        self.agreement = LocalAgreement()
+        self.utterance_onset = None
+        self.first_partial_sent = False
+        return events
+
+    def _transcribe(self, audio: np.ndarray) -> List[Tuple[float, float, str]]:
+        offset = self.buffer_offset / SAMPLING_RATE
+        segments, _ = self.model.transcribe(
+            audio,
+            language=self.language,
+            beam_size=self.beam_size,
+            word_timestamps=True,
+            vad_filter=False,
+            condition_on_previous_text=False,
+            initial_prompt=" ".join(self.prompt_words[-PROMPT_WORDS:]) or None,
+        )
+        return [
+            (offset + word.start, offset + word.end, word.word)
+            for segment in segments
+            for word in (segment.words or [])
+        ]
+
+    def _commit(self, words):
+        """Remember committed text as prompt and drop its audio from the buffer"""
+        self.prompt_words.extend(w[2].strip() for w in words)
+        self._trim_to(int(words[-1][1] * SAMPLING_RATE))
+
+    def _trim_to(self, sample: int):
+        """Drop buffered audio before the absolute sample index"""
+        with self._lock:
+            samples = max(0, min(sample - self.buffer_offset, len(self.buffer)))
+            if samples:
+                self.buffer = self.buffer[samples:]
+                self.buffer_offset += samples
+                self.arrivals = [a for a in self.arrivals if a[0] > self.buffer_offset]
+
+    def _arrival_of(self, sample: int) -> float:
+        for end, arrived in self.arrivals:
+            if end > sample:
+                return arrived
+        return time.monotonic()
+
+    def _event(self, kind: str, words, utterance_end: bool = False) -> dict:
+        event = {
+            "type": kind,
+            "text": _text(words),
+            "start": round(words[0][0], 3),
+            "end": round(words[-1][1], 3),
+        }
+        if utterance_end:
+            event["utterance_end"] = True
+        if not self.first_partial_sent and self.utterance_onset is not None:
+            # Wall time from receiving the first speech frame to the first hypothesis about it
+            latency = time.monotonic() - self.utterance_onset
+            self.first_partial_latencies.append(latency)
+            event["first_partial_latency_ms"] = round(1000 * latency, 1)
+            self.first_partial_sent = True
+        return event
+
+    def stats(self) -> dict:
+        latencies = sorted(self.first_partial_latencies)
+        if not latencies:
+            return {"utterances": 0}
+
+        def pick(q):
+            return round(1000 * latencies[min(len(latencies) - 1, int(q * len(latencies)))], 1)
+
+        return {
+            "utterances": len(latencies),
+            "first_partial_ms_p50": pick(0.5),
+            "first_partial_ms_p95": pick(0.95),
+            "first_partial_ms_p99": pick(0.99),
+        }
@@ -0,0 +1,282 @@
+"""
+Registry of the Whisper models served by one process.
+
+Models are configured by name (e.g. "tiny" for quick previews, "large-v3" for
+final transcripts) and loaded lazily on first use. Resident models are kept
+under a memory budget: when a new model does not fit, the least recently used
+model that is neither pinned nor in use is unloaded first. The default model is
+pinned so it always stays resident.
+
+Each model is loaded as one or more replicas, so concurrent requests do not
+all queue on one model instance. Replicas are spread round-robin over the
+configured CUDA device indexes, or on CPU split the configured threads
+between them (e.g. 4 replicas x 2 threads on an 8 core box instead of one
+8-thread model that requests take turns on). Requests go to the replica with
+the fewest requests in flight, ties to the least busy one; each replica reports
+its requests, busy time and utilization.
+"""
+
+import gc
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Sequence
+
+from faster_whisper import WhisperModel
+from faster_whisper.utils import download_model
+
+from metrics import observe_model_load
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Replica:
+    index: int
+    model: WhisperModel
+    device_index: int
+    cpu_threads: int
+    loaded_at: float = field(default_factory=time.monotonic)
+    users: int = 0
+    requests: int = 0
+    busy_seconds: float = 0.0
+    busy_since: Optional[float] = None
+
+    def busy(self, now: float) -> float:
+        """Seconds with at least one request in flight since loading"""
+        return self.busy_seconds + (now - self.busy_since if self.busy_since is not None else 0.0)
+
+    def stats(self, now: float) -> dict:
+        return {
+            "index": self.index,
+            "device_index": self.device_index,
+            "cpu_threads": self.cpu_threads,
+            "in_use": self.users,
+            "requests": self.requests,
+            "busy_seconds": round(self.busy(now), 2),
+            "utilization": round(self.busy(now) / max(now - self.loaded_at, 1e-9), 3),
+        }
+
+
+@dataclass
+class ResidentModel:
+    name: str
+    path: str
+    replicas: List[Replica]
+    memory_mb: float
+    load_seconds: float
+    last_used: float
+    users: int = 0
+
+    @property
+    def model(self) -> WhisperModel:
+        return self.replicas[0].model
+
+
+def parse_model_sources(spec: str) -> Dict[str, str]:
+    """Parse "name=path_or_size,name2=..." (a bare entry is its own source)"""
+    sources = {}
+    for entry in filter(None, (e.strip() for e in spec.split(","))):
+        name, _, source = entry.partition("=")
+        sources[name.strip()] = (source or name).strip()
+    return sources
+
+
+def replica_layout(replicas: int, device: str, device_indexes: Sequence[int], cpu_threads: int) -> List[tuple]:
+    """(device_index, cpu_threads) of each replica: devices round-robin, CPU threads split evenly"""
+    replicas = max(replicas, 1)
+    threads = max(cpu_threads // replicas, 1) if device == "cpu" and cpu_threads else 0
+    return [(device_indexes[i % len(device_indexes)], threads) for i in range(replicas)]
+
+
+def resolve_model_path(source: str, cache_dir: Optional[str] = None) -> str:
+    """A model directory as is, a size or Hub id downloaded (or found in the cache)"""
+    return source if os.path.isdir(source) else download_model(source, cache_dir=cache_dir)
+
+
+def model_memory_mb(path: str) -> float:
+    """Estimate a model's memory from its weight files on disk"""
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files if f.endswith(".bin"))
+    return total / (1024 * 1024)
+
+
+class ModelRegistry:
+    def __init__(
+        self,
+        sources: Dict[str, str],
+        default: str,
+        device: str = "cuda",
+        compute_type: str = "float16",
+        memory_budget_mb: float = 0,
+        num_workers: int = 1,
+        loader: Optional[Callable[[str, int, int], WhisperModel]] = None,
+        cache_dir: Optional[str] = None,
+        replicas: int = 1,
+        device_indexes: Sequence[int] = (0,),
+        cpu_threads: int = 0,
+    ):
+        if default not in sources:
+            raise ValueError(f"Default model {default!r} is not one of {list(sources)}")
+        self.sources = sources
+        self.default = default
+        self.device = device
+        self.compute_type = compute_type
+        self.memory_budget_mb = memory_budget_mb
+        self.num_workers = num_workers
+        self.cache_dir = cache_dir
+        self.layout = replica_layout(replicas, device, list(device_indexes) or [0], cpu_threads)
+        self.loader = loader or (
+            lambda path, device_index, threads: WhisperModel(
+                path,
+                device=device,
+                device_index=device_index,
+                compute_type=compute_type,
+                cpu_threads=threads,
+                num_workers=num_workers,
+            )
+        )
+        self._resident: Dict[str, ResidentModel] = {}
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()  # one load at a time keeps memory peaks predictable
+        self.loads = 0
+        self.evictions = 0
+
+    def resolve(self, name: Optional[str]) -> str:
+        """Map an optional request parameter to a configured model name"""
+        name = name or self.default
+        if name not in self.sources:
+            raise KeyError(f"Unknown model {name!r}, available: {', '.join(self.sources)}")
+        return name
+
+    def acquire(self, name: str) -> WhisperModel:
+        """Return the least loaded replica of a model, loading it if needed (blocking). Pair with release()."""
+        with self._lock:
+            entry = self._resident.get(name)
+            if entry is not None:
+                return self._checkout(entry)
+
+        with self._load_lock:
+            with self._lock:
+                entry = self._resident.get(name)
+                if entry is not None:
+                    return self._checkout(entry)
+            entry = self._load(name)
+            with self._lock:
+                self._resident[name] = entry
+                return self._checkout(entry)
+
+    def _checkout(self, entry: ResidentModel) -> WhisperModel:
+        now = time.monotonic()
+        replica = min(entry.replicas, key=lambda r: (r.users, r.busy(now)))
+        if replica.users == 0:
+            replica.busy_since = now
+        replica.users += 1
+        replica.requests += 1
+        entry.users += 1
+        entry.last_used = now
+        return replica.model
+
+    def release(self, name: str, model: WhisperModel):
+        with self._lock:
+            entry = self._resident.get(name)
+            if entry is None:
+                return
+            now = time.monotonic()
+            for replica in entry.replicas:
+                if replica.model is model:
+                    replica.users -= 1
+                    if replica.users == 0 and replica.busy_since is not None:
+                        replica.busy_seconds += now - replica.busy_since
+                        replica.busy_since = None
+                    break
+            entry.users -= 1
+            entry.last_used = now
+
+    @contextmanager
+    def use(self, name: str) -> Iterator[WhisperModel]:
+        model = self.acquire(name)
+        try:
+            yield model
+        finally:
+            self.release(name, model)
+
+    def _load(self, name: str) -> ResidentModel:
+        source = self.sources[name]
+        path = resolve_model_path(source, self.cache_dir)
+        memory_mb = model_memory_mb(path) * len(self.layout)
+        self._make_room(memory_mb)
+
+        logger.info(f"Loading Whisper model {name} from {path} ({memory_mb:.0f} MB, {len(self.layout)} replicas)")
+        started = time.monotonic()
+        # Replicas load concurrently; CTranslate2 releases the GIL while reading and placing weights
+        with ThreadPoolExecutor(max_workers=len(self.layout)) as pool:
+            models = list(pool.map(lambda placement: self.loader(path, *placement), self.layout))
+        load_seconds = time.monotonic() - started
+        self.loads += 1
+        observe_model_load(name, load_seconds)
+        logger.info(f"Model {name} loaded in {load_seconds:.1f}s")
+        return ResidentModel(
+            name=name,
+            path=path,
+            replicas=[
+                Replica(index=i, model=model, device_index=device_index, cpu_threads=threads)
+                for i, (model, (device_index, threads)) in enumerate(zip(models, self.layout))
+            ],
+            memory_mb=memory_mb,
+            load_seconds=load_seconds,
+            last_used=time.monotonic(),
+        )
+
+    def _make_room(self, needed_mb: float):
+        """Unload idle, unpinned models in LRU order until `needed_mb` fits the budget"""
+        if not self.memory_budget_mb:
+            return
+        with self._lock:
+            while self.resident_mb() + needed_mb > self.memory_budget_mb:
+                idle = [e for e in self._resident.values() if e.users == 0 and e.name != self.default]
+                if not idle:
+                    logger.warning(
+                        f"Memory budget of {self.memory_budget_mb:.0f} MB exceeded, no idle model to evict"
+                    )
+                    return
+                victim = min(idle, key=lambda e: e.last_used)
+                del self._resident[victim.name]
+                self.evictions += 1
+                logger.info(f"Evicted model {victim.name} ({victim.memory_mb:.0f} MB)")
+                del victim
+                gc.collect()
+
+    def resident_mb(self) -> float:
+        return sum(e.memory_mb for e in self._resident.values())
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            resident = [
+                {
+                    "name": e.name,
+                    "path": e.path,
+                    "memory_mb": round(e.memory_mb, 1),
+                    "load_seconds": round(e.load_seconds, 2),
+                    "in_use": e.users,
+                    "pinned": e.name == self.default,
+                    "idle_seconds": round(now - e.last_used, 1),
+                    "replicas": [r.stats(now) for r in e.replicas],
+                }
+                for e in self._resident.values()
+            ]
+            return {
+                "default_model": self.default,
+                "available_models": list(self.sources),
+                "memory_budget_mb": self.memory_budget_mb,
+                "resident_mb": round(self.resident_mb(), 1),
+                "resident": resident,
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
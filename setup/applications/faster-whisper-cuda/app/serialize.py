@@ -0,0 +1,75 @@
+"""
+Transcript encoding.
+
+Results used to go back through the `TranscriptionResponse` response model:
+FastAPI validated every segment dict with pydantic, converted it back with
+jsonable_encoder and serialized it with stdlib json, and the SSE endpoint
+called json.dumps once per event. Responses are now encoded straight to bytes
+(orjson when installed, compact stdlib json otherwise) and returned as a
+Response, which skips validation. The default layout is unchanged.
+
+Layouts:
+- "json": {"text", "language", "segments": [{"start", "end", "text"}, ...]}
+- "compact": the same with columnar segments,
+  {"segments": {"start": [...], "end": [...], "text": [...]}}
+- "ndjson": one object per line, the language first, then each segment
+"""
+
+import json
+from typing import Iterator, List
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # stdlib fallback: same documents, slower
+    orjson = None
+
+
+def dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def columns(segments: List[dict]) -> dict:
+    """Segments as parallel arrays"""
+    return {
+        "start": [s["start"] for s in segments],
+        "end": [s["end"] for s in segments],
+        "text": [s["text"] for s in segments],
+    }
+
+
+def ndjson_lines(result: dict) -> Iterator[bytes]:
+    yield dumps({"language": result["language"], "language_probability": result["language_probability"]})
+    for segment in result["segments"]:
+        yield dumps(segment)
+
+
+def transcript_response(result: dict, format: str = "json", **extra) -> Response:
+    """Encode a transcription result in the requested layout; `extra` (e.g. timings) is added at the top level"""
+    if format == "ndjson":
+        lines = list(ndjson_lines(result))
+        if extra:
+            lines.append(dumps(extra))
+        return Response(b"\n".join(lines) + b"\n", media_type="application/x-ndjson")
+    segments = result["segments"]
+    body = {
+        "text": result["text"],
+        "language": result["language"],
+        "segments": columns(segments) if format == "compact" else segments,
+        **extra,
+    }
+    return Response(dumps(body), media_type="application/json")
+
+
+def stream_event(event: dict, format: str = "sse") -> bytes:
+    if format == "ndjson":
+        return dumps(event) + b"\n"
+    return b"data: " + dumps(event) + b"\n\n"
+
+
+def stream_media_type(format: str) -> str:
+    return "application/x-ndjson" if format == "ndjson" else "text/event-stream"
+
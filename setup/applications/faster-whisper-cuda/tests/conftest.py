@@ -0,0 +1,16 @@
+"""
+Fixtures for the Whisper app tests.
+
+The app modules are imported unchanged from ../app; tests that need a model
+pass in a stand-in for it, so they run on CPU without model weights.
+"""
+
+import os
+import sys
+
+import pytest
+
+pytest.importorskip("faster_whisper")
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+sys.path.insert(0, os.path.normpath(APP_DIR))
@@ -0,0 +1,35 @@
+import wave
+
+from autotune import autotune
+
+
+class StubModel:
+    def transcribe(self, audio, beam_size, **kwargs):
+        return iter([]), None
+
+
+def tune(tmp_path, sample=None):
+    return autotune(
+        str(tmp_path / "model"), "cpu", "latency", str(tmp_path / "autotune.json"), sample=sample,
+        compute_types=["int8"], cpu_threads=[2], num_workers=[1], beam_sizes=[5, 1],
+        loader=lambda *args: StubModel(), runs=1,
+    )
+
+
+def test_beam_sizes_are_not_tuned_on_the_synthetic_clip(tmp_path):
+    result = tune(tmp_path)
+    assert result["skipped_stages"] == ["beam_size"]
+    assert result["config"]["beam_size"] == 5
+    assert {m["beam_size"] for m in result["measurements"]} == {5}
+
+
+def test_beam_sizes_are_tuned_on_a_sample(tmp_path):
+    path = tmp_path / "sample.wav"
+    with wave.open(str(path), "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(16000)
+        f.writeframes(b"\0\0" * 16000)
+    result = tune(tmp_path, sample=str(path))
+    assert result["skipped_stages"] == []
+    assert {m["beam_size"] for m in result["measurements"]} == {5, 1}
@@ -0,0 +1,55 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from batching import SAMPLING_RATE, BatchRequest, BatchScheduler
+
+
+class StubPipeline:
+    """One segment per clip, timed the way BatchedInferencePipeline reports them"""
+
+    def transcribe(self, audio, clip_timestamps, **kwargs):
+        segments = []
+        for clip in clip_timestamps:
+            # Seconds to samples by truncation, then back to seconds rounded to the millisecond
+            start = int(clip["start"] * SAMPLING_RATE) / SAMPLING_RATE
+            end = int(clip["end"] * SAMPLING_RATE) / SAMPLING_RATE
+            segments.append(SimpleNamespace(start=round(start, 3), end=round(end, 3), text=f"{clip['start']:.6f}"))
+        return iter(segments), None
+
+
+def request(samples: int, index: int) -> BatchRequest:
+    return BatchRequest(
+        model="stub",
+        audio=np.full(samples, index, dtype=np.float32),
+        language="en",
+        task="transcribe",
+        beam_size=1,
+        vad_filter=False,
+        future=None,
+        enqueued_at=0.0,
+    )
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_segments_go_back_to_their_request(seed):
+    """Odd lengths put request offsets between milliseconds, where the reported starts are rounded"""
+    rng = np.random.default_rng(seed)
+    lengths = [int(n) for n in rng.integers(1, 40 * SAMPLING_RATE, size=8)]
+    lengths[0] = SAMPLING_RATE + 1
+    requests = [request(n, i) for i, n in enumerate(lengths)]
+
+    results = BatchScheduler(registry=None)._transcribe_group(
+        StubPipeline(), requests, [1.0] * len(requests), "en", "transcribe", 1
+    )
+
+    for samples, result in zip(lengths, results):
+        # Without VAD a request is cut into 30 s windows, each of which gives one segment here
+        windows = -(-samples // (30 * SAMPLING_RATE))
+        assert len(result["segments"]) == windows
+        # Times are rounded to the millisecond before and after the offset is taken off
+        starts = [segment["start"] for segment in result["segments"]]
+        assert starts == pytest.approx([30 * w for w in range(windows)], abs=0.0015)
+        assert all(start >= 0 for start in starts)
+        assert result["segments"][-1]["end"] == pytest.approx(samples / SAMPLING_RATE, abs=0.0015)
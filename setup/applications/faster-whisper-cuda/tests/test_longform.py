@@ -0,0 +1,69 @@
+import asyncio
+import threading
+import time
+
+from executor import InferenceExecutor
+from longform import Chunk, _deduplicate
+
+
+def segment(start: float, end: float, text: str) -> dict:
+    return {"start": start, "end": end, "text": text}
+
+
+def test_repeated_speech_is_kept():
+    first = Chunk(start=0, end=30 * 16000, keep_from=0.0)
+    segments = [(first, segment(1.0, 1.5, " No.")), (first, segment(1.6, 2.0, " No."))]
+    assert len(list(_deduplicate(iter(segments)))) == 2
+    batched = [(None, segment(1.0, 1.5, " Thank you.")), (None, segment(1.6, 2.0, " Thank you."))]
+    assert len(list(_deduplicate(iter(batched)))) == 2
+
+
+def test_sentence_decoded_on_both_sides_of_a_cut_is_dropped():
+    first = Chunk(start=0, end=30 * 16000, keep_from=0.0)
+    second = Chunk(start=29 * 16000, end=59 * 16000, keep_from=30.0)
+    segments = [
+        (first, segment(28.5, 30.4, " Across the cut.")),
+        (second, segment(29.9, 30.6, " Across the cut.")),
+        (second, segment(31.0, 32.0, " Across the cut.")),  # said again, after the overlap
+    ]
+    kept = list(_deduplicate(iter(segments)))
+    assert [s["start"] for s in kept] == [28.5, 31.0]
+
+
+def test_map_ordered_runs_on_a_full_pool_without_deadlock():
+    """Every worker is itself fanning out: queued items are run by the callers instead"""
+    executor = InferenceExecutor(max_workers=2, max_queue=2)
+    threads = []
+
+    def work(item):
+        threads.append(threading.current_thread().name)
+        time.sleep(0.01)
+        return item * 2
+
+    async def request():
+        return await executor.call(lambda: list(executor.map_ordered(work, range(10), parallel=4)))
+
+    async def main():
+        return await asyncio.wait_for(asyncio.gather(*(request() for _ in range(2))), 10)
+
+    results = asyncio.run(main())
+    assert results == [[i * 2 for i in range(10)]] * 2
+    assert executor.admitted == 0
+    assert all(name.startswith("inference") for name in threads)
+    executor.shutdown()
+
+
+def test_map_ordered_takes_slots_and_falls_back_to_the_caller():
+    executor = InferenceExecutor(max_workers=2, max_queue=0)
+    executor.admitted = 2  # every slot taken by requests
+    threads = set()
+
+    def work(item):
+        threads.add(threading.current_thread().name)
+        return item
+
+    assert list(executor.map_ordered(work, range(5), parallel=4)) == list(range(5))
+    assert threads == {threading.current_thread().name}
+    assert executor.admitted == 2
+    assert executor.rejected == 0
+    executor.shutdown()
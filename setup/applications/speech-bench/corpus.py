@@ -0,0 +1,97 @@
+"""
+Synthetic benchmark corpus.
+
+Writes speech-like WAV files (16 kHz mono PCM16: voiced phrases separated by
+pauses, so VAD splits them like speech) of seeded random lengths, a text file
+of sentences for the TTS service, and a manifest with the audio durations.
+The same seed always gives the same corpus, so runs on different machines or
+commits replay identical requests. Real recordings can be used instead: any
+directory of audio files works as a corpus.
+
+    python corpus.py corpus/ --files 24 --min-seconds 3 --max-seconds 90
+"""
+
+import argparse
+import json
+import os
+import random
+import wave
+
+import numpy as np
+
+from stubs import WORDS
+
+SAMPLE_RATE = 16_000
+
+
+def speech_like(seconds: float, rng: np.random.Generator) -> np.ndarray:
+    """Phrases of a gliding harmonic series with syllable-rate modulation, with pauses between them"""
+    total = int(seconds * SAMPLE_RATE)
+    audio = 0.003 * rng.standard_normal(total)
+    position = 0
+    while position < total:
+        length = min(int(rng.uniform(1.5, 4.5) * SAMPLE_RATE), total - position)
+        t = np.arange(length) / SAMPLE_RATE
+        pitch = rng.uniform(100, 180) + 25 * np.sin(2 * np.pi * rng.uniform(0.3, 0.8) * t)
+        phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+        voiced = sum(np.sin(k * phase) / k for k in range(1, 16))
+        syllables = np.clip(np.sin(2 * np.pi * rng.uniform(2.5, 4.5) * t), 0, None)
+        audio[position:position + length] += 0.1 * voiced * syllables
+        position += length + int(rng.uniform(0.3, 1.2) * SAMPLE_RATE)
+    return audio.astype(np.float32)
+
+
+def write_wav(path: str, audio: np.ndarray):
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes((np.clip(audio, -1.0, 1.0) * 32767).astype("<i2").tobytes())
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    text = " ".join(rng.choice(WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + rng.choice([".", ".", ".", "!", "?"])
+
+
+def make_corpus(directory: str, files: int, min_seconds: float, max_seconds: float, texts: int, seed: int) -> dict:
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    manifest = {"seed": seed, "files": {}}
+    for i in range(files):
+        # Log-uniform lengths: mostly short clips, a few long ones, like real traffic
+        seconds = round(float(np.exp(rng.uniform(np.log(min_seconds), np.log(max_seconds)))), 2)
+        name = f"clip-{i:03d}-{seconds:.0f}s.wav"
+        write_wav(os.path.join(directory, name), speech_like(seconds, rng))
+        manifest["files"][name] = {"seconds": seconds}
+
+    text_rng = random.Random(seed)
+    lines = []
+    for _ in range(texts):
+        # One to three sentences, 4 to 20 words each
+        lines.append(" ".join(sentence(text_rng, text_rng.randint(4, 20)) for _ in range(text_rng.randint(1, 3))))
+    with open(os.path.join(directory, "texts.txt"), "w") as f:
+        f.write("\n".join(lines) + "\n")
+    manifest["texts"] = len(lines)
+
+    with open(os.path.join(directory, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("directory")
+    parser.add_argument("--files", type=int, default=24)
+    parser.add_argument("--min-seconds", type=float, default=3.0)
+    parser.add_argument("--max-seconds", type=float, default=90.0)
+    parser.add_argument("--texts", type=int, default=50, help="lines of text for the TTS service")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    manifest = make_corpus(args.directory, args.files, args.min_seconds, args.max_seconds, args.texts, args.seed)
+    seconds = sum(f["seconds"] for f in manifest["files"].values())
+    print(f"Wrote {len(manifest['files'])} files ({seconds:.0f}s of audio) and {manifest['texts']} texts to {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Memory and time of decoding uploads in the Whisper app.
+
+Each file of a corpus is decoded once per ingestion path, every time in a
+fresh process, and the peak memory growth of the decode is measured with the
+app's PeakRss (the rise of the process's peak RSS above where it started):
+
+- `tempfile`: the upload read into bytes, copied to a NamedTemporaryFile and
+  decoded from that path, as the app did before decoding in place.
+- `spooled`: the app's `decode_upload` on the spooled upload file, which stays
+  in memory up to UPLOAD_SPOOL_MAX_BYTES and is on disk beyond it.
+
+The upload is spooled before the measurement starts, as Starlette does it
+while receiving the request, so only the decode is counted. Needs the Whisper
+app's dependencies, like stubs.py. Usage:
+
+    python decodebench.py corpus/ -o decode.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from stubs import WHISPER_APP
+
+METHODS = ("tempfile", "spooled")
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".flac", ".ogg", ".m4a", ".webm", ".opus")
+
+
+def _spooled_upload(path: str, spool_max_bytes: int):
+    from starlette.datastructures import UploadFile
+
+    spool = tempfile.SpooledTemporaryFile(max_size=spool_max_bytes)
+    with open(path, "rb") as f:
+        shutil.copyfileobj(f, spool, 1024 * 1024)
+    return UploadFile(spool, size=os.path.getsize(path), filename=os.path.basename(path))
+
+
+def _measure(app_dir: str, path: str, method: str, spool_max_bytes: int) -> dict:
+    """Worker: decode one file one way and report its memory growth and time"""
+    sys.path.insert(0, app_dir)
+    from faster_whisper.audio import decode_audio
+    from ingest import PeakRss, decode_upload, spilled_to_disk
+
+    upload = _spooled_upload(path, spool_max_bytes)
+    started = time.perf_counter()
+    with PeakRss() as memory:
+        if method == "tempfile":
+            upload.file.seek(0)
+            content = upload.file.read()
+            with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(path)[1]) as tmp_file:
+                tmp_file.write(content)
+                tmp_path = tmp_file.name
+            try:
+                audio = decode_audio(tmp_path)
+            finally:
+                os.unlink(tmp_path)
+        else:
+            audio = decode_upload(upload)
+    elapsed = time.perf_counter() - started
+    return {
+        "peak_rss_growth_mb": None if memory.growth_mb is None else round(memory.growth_mb, 1),
+        "decode_seconds": round(elapsed, 3),
+        "spilled_to_disk": spilled_to_disk(upload),
+        "audio_seconds": round(audio.shape[0] / 16000, 2),
+    }
+
+
+def corpus_files(directory: str) -> list:
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.lower().endswith(AUDIO_EXTENSIONS)
+    )
+
+
+def run(directory: str, app_dir: str, spool_max_bytes: int) -> dict:
+    # One process per decode: a process's peak RSS cannot be lowered by an earlier decode's garbage
+    context = multiprocessing.get_context("spawn")
+    files = []
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        for path in corpus_files(directory):
+            entry = {"file": os.path.basename(path), "bytes": os.path.getsize(path)}
+            for method in METHODS:
+                entry[method] = pool.apply(_measure, (app_dir, path, method, spool_max_bytes))
+            files.append(entry)
+    return {"spool_max_bytes": spool_max_bytes, "files": files}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("corpus")
+    parser.add_argument("--app-dir", default=WHISPER_APP, help="Whisper app directory, defaults to the one in this repository")
+    parser.add_argument(
+        "--spool-max-bytes", type=int, default=int(os.environ.get("UPLOAD_SPOOL_MAX_BYTES", str(64 * 1024 * 1024))),
+        help="size above which an upload is spooled to disk, as UPLOAD_SPOOL_MAX_BYTES",
+    )
+    parser.add_argument("-o", "--output", help="write the report as JSON")
+    args = parser.parse_args()
+    report = run(args.corpus, os.path.abspath(args.app_dir), args.spool_max_bytes)
+
+    print(f"{'file':<28} {'MB':>7} {'audio s':>8} " + " ".join(f"{m + ' +MB':>13} {m + ' s':>11}" for m in METHODS))
+    for entry in report["files"]:
+        columns = [f"{entry['file']:<28}", f"{entry['bytes'] / 2 ** 20:>7.1f}", f"{entry[METHODS[0]]['audio_seconds']:>8.0f}"]
+        for method in METHODS:
+            growth = entry[method]["peak_rss_growth_mb"]
+            columns.append(f"{'n/a' if growth is None else f'{growth:.1f}':>13}")
+            columns.append(f"{entry[method]['decode_seconds']:>11.3f}")
+        print(" ".join(columns))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,664 @@
+"""
+Load generator for the speech services.
+
+Replays a corpus against one or more targets and reports, per target, the
+throughput, latency percentiles, time to the first streamed segment or audio
+chunk, and real-time factor as JSON:
+
+- transcribe:       POST /transcribe
+- stream:           POST /transcribe/stream (time to first segment event)
+- detect-language:  POST /detect-language
+- tts:              the TTS /stream WebSocket (time to first audio chunk)
+- realtime:         the Whisper /transcribe/realtime WebSocket, fed 16 kHz
+                    PCM16 frames at real-time speed like a microphone
+                    (first-partial latency and final lag per utterance)
+
+Load is either closed-loop (--concurrency clients, each sending its next
+request when the previous one is done) or open-loop (--rate requests per
+second with Poisson arrivals, at most --concurrency in flight). Open-loop
+latency is measured from the scheduled arrival, so time spent waiting for a
+free client slot counts against the server rather than being hidden. Request
+order and arrival times come from --seed, so a run replays the same traffic
+every time. For the Whisper HTTP targets the server's own time per stage
+(upload, decode, encoder, ...) is read from its /metrics before and after.
+
+    python loadgen.py run --url http://localhost:11435 --target transcribe --target stream \\
+        --corpus corpus/ --concurrency 8 --requests 200 -o results.json
+    python loadgen.py run --url ws://localhost:8000 --target tts --texts corpus/texts.txt --rate 2
+    python loadgen.py run --url ws://localhost:11435 --target realtime --corpus corpus/ --concurrency 4 --requests 20
+    python loadgen.py compare results.json baseline.json --tolerance 0.1
+
+With --baseline (or the compare command), every metric is compared with a
+stored result, and the exit status is 1 if any got worse by more than the
+tolerance.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import io
+import json
+import os
+import platform
+import random
+import struct
+import subprocess
+import sys
+import time
+import wave
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import List, Optional
+from urllib.parse import urlencode
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".flac", ".ogg", ".opus", ".m4a", ".webm", ".mp4")
+TTS_RATE = 24_000
+WHISPER_RATE = 16_000
+TARGETS = ("transcribe", "stream", "detect-language", "tts", "realtime")
+FIRST_METRIC = {"stream": "time_to_first_segment", "tts": "time_to_first_audio"}
+
+# (metric, higher is better) compared against a baseline
+COMPARED = [
+    ("throughput_rps", True),
+    ("audio_seconds_per_second", True),
+    ("latency.p50", False),
+    ("latency.p95", False),
+    ("latency.p99", False),
+    ("time_to_first_segment.p50", False),
+    ("time_to_first_segment.p95", False),
+    ("time_to_first_audio.p50", False),
+    ("time_to_first_audio.p95", False),
+    ("real_time_factor.p50", False),
+    ("real_time_factor.p95", False),
+    ("first_partial_latency.p50", False),
+    ("first_partial_latency.p95", False),
+    ("final_lag.p50", False),
+    ("final_lag.p95", False),
+]
+# Error rates are compared in absolute terms: 0 -> 0.5% is a regression whatever the tolerance
+ERROR_RATE_SLACK = 0.005
+
+
+@dataclass
+class AudioItem:
+    name: str
+    data: bytes
+    seconds: Optional[float]
+
+
+@dataclass
+class Sample:
+    ok: bool
+    status: str
+    latency: float
+    first: Optional[float] = None
+    audio_seconds: Optional[float] = None
+    # realtime: per utterance, seconds from speech onset to the first hypothesis (as reported by the
+    # server) and from the end of the utterance's audio to its final transcript
+    first_partials: List[float] = field(default_factory=list)
+    final_lags: List[float] = field(default_factory=list)
+
+
+# Corpus
+
+
+def audio_seconds(path: str, data: bytes) -> Optional[float]:
+    if path.endswith(".wav"):
+        try:
+            with wave.open(path) as f:
+                return f.getnframes() / f.getframerate()
+        except (wave.Error, EOFError):
+            pass
+    try:
+        import av
+    except ImportError:  # durations of compressed files need PyAV or a manifest
+        return None
+    try:
+        with av.open(path) as container:
+            return float(container.duration) / av.time_base if container.duration else None
+    except av.error.FFmpegError:
+        return None
+
+
+def load_audio(directory: str) -> List[AudioItem]:
+    """Audio files of a corpus directory, with durations from manifest.json when present"""
+    manifest = {}
+    try:
+        with open(os.path.join(directory, "manifest.json")) as f:
+            manifest = json.load(f).get("files", {})
+    except FileNotFoundError:
+        pass
+    items = []
+    for name in sorted(os.listdir(directory)):
+        if not name.lower().endswith(AUDIO_EXTENSIONS):
+            continue
+        path = os.path.join(directory, name)
+        with open(path, "rb") as f:
+            data = f.read()
+        seconds = manifest.get(name, {}).get("seconds") or audio_seconds(path, data)
+        items.append(AudioItem(name, data, seconds))
+    if not items:
+        raise SystemExit(f"No audio files in {directory}")
+    return items
+
+
+def pcm16_mono(item: AudioItem) -> bytes:
+    """Raw 16 kHz mono PCM16 of an audio file, the format a microphone client sends"""
+    try:
+        with wave.open(io.BytesIO(item.data)) as f:
+            if (f.getframerate(), f.getnchannels(), f.getsampwidth()) == (WHISPER_RATE, 1, 2):
+                return f.readframes(f.getnframes())
+    except (wave.Error, EOFError):
+        pass
+    import av
+
+    resampler = av.AudioResampler(format="s16", layout="mono", rate=WHISPER_RATE)
+    chunks = []
+    with av.open(io.BytesIO(item.data)) as container:
+        for frame in container.decode(audio=0):
+            chunks += [out.to_ndarray().tobytes() for out in resampler.resample(frame)]
+    chunks += [out.to_ndarray().tobytes() for out in resampler.resample(None)]
+    return b"".join(chunks)
+
+
+def load_texts(path: str) -> List[str]:
+    with open(path) as f:
+        texts = [line.strip() for line in f if line.strip()]
+    if not texts:
+        raise SystemExit(f"No texts in {path}")
+    return texts
+
+
+def corpus_digest(items) -> str:
+    digest = hashlib.sha256()
+    for item in items:
+        digest.update(item.data if isinstance(item, AudioItem) else item.encode())
+    return digest.hexdigest()[:16]
+
+
+# Requests
+
+
+def _http_base(url: str) -> str:
+    return "http" + url[2:] if url.startswith("ws") else url
+
+
+def _ws_base(url: str) -> str:
+    return "ws" + url[4:] if url.startswith("http") else url
+
+
+async def send_transcribe(client, path: str, item: AudioItem, started: float, params: dict) -> Sample:
+    response = await client.post(path, params=params, files={"file": (item.name, item.data)})
+    latency = time.perf_counter() - started
+    ok = response.status_code == 200
+    return Sample(ok, str(response.status_code), latency, audio_seconds=item.seconds if ok else None)
+
+
+async def send_stream(client, item: AudioItem, started: float, params: dict) -> Sample:
+    first = None
+    ok = False
+    async with client.stream("POST", "/transcribe/stream", params=params, files={"file": (item.name, item.data)}) as response:
+        if response.status_code != 200:
+            await response.aread()
+            return Sample(False, str(response.status_code), time.perf_counter() - started)
+        async for line in response.aiter_lines():
+            line = line[5:].strip() if line.startswith("data:") else line.strip()
+            if not line:
+                continue
+            event = json.loads(line)
+            kind = event.get("type")
+            if kind == "segment" and first is None:
+                first = time.perf_counter() - started
+            elif kind == "complete":
+                ok = True
+            elif kind == "error":
+                return Sample(False, "stream-error", time.perf_counter() - started)
+    latency = time.perf_counter() - started
+    return Sample(ok, "200" if ok else "incomplete", latency, first, item.seconds if ok else None)
+
+
+async def send_tts(url: str, text: str, started: float, params: dict) -> Sample:
+    import websockets
+
+    incremental = params.get("mode") == "incremental"
+    binary = params.get("protocol") == "binary"
+    query = urlencode(params if incremental else {**params, "text": text})
+    first = None
+    samples = 0
+    try:
+        async with websockets.connect(f"{url}/stream?{query}", max_size=None) as ws:
+            if incremental:
+                await ws.send(json.dumps({"text": text, "done": True}))
+            async for message in ws:
+                if not isinstance(message, bytes):
+                    continue
+                if first is None:
+                    first = time.perf_counter() - started
+                # Binary frames carry their sample count in the header (see protocol.py), JSON mode sends raw PCM16
+                samples += struct.unpack_from("<I", message, 16)[0] if binary else len(message) // 2
+    except websockets.ConnectionClosedError as e:
+        code = e.rcvd.code if e.rcvd is not None else 1006
+        return Sample(False, str(code), time.perf_counter() - started)
+    except (OSError, websockets.InvalidHandshake) as e:
+        return Sample(False, type(e).__name__, time.perf_counter() - started)
+    latency = time.perf_counter() - started
+    if not samples:
+        return Sample(False, "no-audio", latency)
+    return Sample(True, "1000", latency, first, samples / TTS_RATE)
+
+
+async def send_realtime(url: str, item: AudioItem, pcm: bytes, started: float, params: dict,
+                        frame_ms: int) -> Sample:
+    """Stream a file at real-time speed, then stop and wait for the session's complete event"""
+    import websockets
+
+    frame_seconds = frame_ms / 1000
+    frame_bytes = 2 * int(WHISPER_RATE * frame_seconds)
+    sample = Sample(False, "incomplete", 0.0, audio_seconds=len(pcm) / 2 / WHISPER_RATE)
+    # Audio at t seconds into the file is "spoken" at speech_start + t
+    speech_start = 0.0
+
+    async def receive(ws):
+        async for message in ws:
+            event = json.loads(message)
+            if "first_partial_latency_ms" in event:
+                sample.first_partials.append(event["first_partial_latency_ms"] / 1000)
+            if event.get("utterance_end"):
+                sample.final_lags.append(time.perf_counter() - speech_start - event["end"])
+            if event.get("type") == "complete":
+                return True
+        return False
+
+    try:
+        async with websockets.connect(f"{url}/transcribe/realtime?{urlencode(params)}", max_size=None) as ws:
+            receiver = asyncio.create_task(receive(ws))
+            try:
+                speech_start = time.perf_counter()
+                for i, offset in enumerate(range(0, len(pcm), frame_bytes)):
+                    # Like a microphone, a frame can only be sent once all of its audio has been captured
+                    await asyncio.sleep(max(speech_start + (i + 1) * frame_seconds - time.perf_counter(), 0))
+                    if receiver.done():
+                        break
+                    await ws.send(pcm[offset:offset + frame_bytes])
+                audio_end = time.perf_counter()
+                await ws.send(json.dumps({"type": "stop"}))
+                complete = await receiver
+            finally:
+                # When the server closed early both tasks see it; one error is reported
+                receiver.cancel()
+                await asyncio.gather(receiver, return_exceptions=True)
+    except websockets.ConnectionClosedError as e:
+        sample.status = str(e.rcvd.code if e.rcvd is not None else 1006)
+        sample.latency = time.perf_counter() - started
+        return sample
+    except (OSError, websockets.InvalidHandshake) as e:
+        sample.status = type(e).__name__
+        sample.latency = time.perf_counter() - started
+        return sample
+    # The tail: how long after the last audio the last final arrived
+    sample.latency = time.perf_counter() - audio_end
+    if complete:
+        sample.ok, sample.status = True, "1000"
+    return sample
+
+
+def make_sender(target: str, url: str, params: dict, timeout: float, frame_ms: int = 100):
+    """Return (send(item, started) -> Sample, close())"""
+    if target == "tts":
+        base = _ws_base(url)
+
+        async def send(item, started):
+            return await send_tts(base, item, started, params)
+
+        async def close():
+            pass
+
+        return send, close
+
+    if target == "realtime":
+        base = _ws_base(url)
+        pcm = {}
+
+        async def send(item, started):
+            if item.name not in pcm:
+                pcm[item.name] = await asyncio.to_thread(pcm16_mono, item)
+            return await send_realtime(base, item, pcm[item.name], started, params, frame_ms)
+
+        async def close():
+            pass
+
+        return send, close
+
+    import httpx
+
+    client = httpx.AsyncClient(base_url=_http_base(url), timeout=timeout, limits=httpx.Limits(max_connections=None))
+
+    async def send(item, started):
+        try:
+            if target == "stream":
+                return await send_stream(client, item, started, params)
+            return await send_transcribe(client, "/" + target, item, started, params)
+        except httpx.HTTPError as e:
+            return Sample(False, type(e).__name__, time.perf_counter() - started)
+
+    return send, client.aclose
+
+
+async def stage_seconds(url: str, timeout: float) -> Optional[dict]:
+    """Totals of the Whisper app's whisper_stage_seconds histograms: {stage: (seconds, count)}, None if not served"""
+    import httpx
+
+    try:
+        async with httpx.AsyncClient(base_url=_http_base(url), timeout=timeout) as client:
+            response = await client.get("/metrics")
+    except httpx.HTTPError:
+        return None
+    if response.status_code != 200:
+        return None
+    totals = {}
+    for line in response.text.splitlines():
+        for suffix, index in (("_sum", 0), ("_count", 1)):
+            prefix = f"whisper_stage_seconds{suffix}{{stage=\""
+            if line.startswith(prefix):
+                stage, _, value = line[len(prefix):].partition("\"} ")
+                totals.setdefault(stage, [0.0, 0.0])[index] = float(value)
+    return totals
+
+
+def stage_breakdown(before: Optional[dict], after: Optional[dict], requests: int) -> Optional[dict]:
+    """Mean server-side milliseconds per request and stage between two scrapes"""
+    if before is None or after is None or not requests:
+        return None
+    breakdown = {}
+    for stage, (seconds, count) in after.items():
+        seconds -= before.get(stage, (0.0, 0.0))[0]
+        if count > before.get(stage, (0.0, 0.0))[1]:
+            breakdown[stage] = round(seconds / requests * 1000, 2)
+    return breakdown
+
+
+# Load shapes
+
+
+async def closed_loop(send, items: list, concurrency: int, requests: int, duration: float) -> List[Sample]:
+    samples: List[Sample] = []
+    deadline = time.perf_counter() + duration if duration else None
+    issued = 0
+
+    async def client():
+        nonlocal issued
+        while (not requests or issued < requests) and (deadline is None or time.perf_counter() < deadline):
+            item = items[issued % len(items)]
+            issued += 1
+            samples.append(await send(item, time.perf_counter()))
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return samples
+
+
+async def open_loop(send, items: list, rate: float, concurrency: int, requests: int, duration: float,
+                    rng: random.Random) -> List[Sample]:
+    samples: List[Sample] = []
+    slots = asyncio.Semaphore(concurrency)
+    start = time.perf_counter()
+
+    async def one(item, scheduled):
+        async with slots:
+            samples.append(await send(item, scheduled))
+
+    tasks = []
+    at = start
+    for i in range(sys.maxsize):
+        at += rng.expovariate(rate)
+        if (requests and i >= requests) or (duration and at - start > duration):
+            break
+        await asyncio.sleep(max(at - time.perf_counter(), 0))
+        tasks.append(asyncio.create_task(one(items[i % len(items)], at)))
+    await asyncio.gather(*tasks)
+    return samples
+
+
+# Report
+
+
+def distribution(values: List[float]) -> Optional[dict]:
+    if not values:
+        return None
+    values = sorted(values)
+
+    def percentile(p: float) -> float:
+        position = (len(values) - 1) * p / 100
+        low = int(position)
+        high = min(low + 1, len(values) - 1)
+        return values[low] + (values[high] - values[low]) * (position - low)
+
+    return {
+        "mean": round(sum(values) / len(values), 4),
+        "p50": round(percentile(50), 4),
+        "p95": round(percentile(95), 4),
+        "p99": round(percentile(99), 4),
+        "max": round(values[-1], 4),
+    }
+
+
+def summarize(target: str, samples: List[Sample], wall: float) -> dict:
+    ok = [s for s in samples if s.ok]
+    audio = sum(s.audio_seconds or 0.0 for s in ok)
+    result = {
+        "requests": len(samples),
+        "ok": len(ok),
+        "errors": dict(Counter(s.status for s in samples if not s.ok)),
+        "error_rate": round(1 - len(ok) / len(samples), 4) if samples else 0.0,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(len(ok) / wall, 3) if wall else 0.0,
+        "audio_seconds_per_second": round(audio / wall, 3) if wall else 0.0,
+        "latency": distribution([s.latency for s in ok]),
+    }
+    if target in FIRST_METRIC:
+        result[FIRST_METRIC[target]] = distribution([s.first for s in ok if s.first is not None])
+    if target == "realtime":
+        # Audio is paced at real-time speed, so a real-time factor would say nothing here
+        result["utterances"] = sum(len(s.first_partials) for s in ok)
+        result["first_partial_latency"] = distribution([v for s in ok for v in s.first_partials])
+        result["final_lag"] = distribution([v for s in ok for v in s.final_lags])
+        return result
+    # Seconds of processing per second of audio: below 1 is faster than real time
+    result["real_time_factor"] = distribution([s.latency / s.audio_seconds for s in ok if s.audio_seconds])
+    return result
+
+
+def _metric(result: dict, path: str) -> Optional[float]:
+    value = result
+    for key in path.split("."):
+        if not isinstance(value, dict) or value.get(key) is None:
+            return None
+        value = value[key]
+    return value
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> dict:
+    """Per target and metric: baseline, current, relative change and whether it is a regression"""
+    comparison = {"tolerance": tolerance, "regressions": 0, "warnings": [], "targets": {}}
+    for key in ("corpus", "concurrency", "rate", "params"):
+        if current["config"].get(key) != baseline["config"].get(key):
+            comparison["warnings"].append(f"{key} differs from the baseline, results may not be comparable")
+    for target, base in baseline["results"].items():
+        result = current["results"].get(target)
+        if result is None:
+            comparison["warnings"].append(f"target {target} is in the baseline but was not run")
+            continue
+        metrics = {}
+        for path, higher_is_better in COMPARED:
+            before, after = _metric(base, path), _metric(result, path)
+            if before is None or after is None:
+                continue
+            change = (after - before) / before if before else 0.0
+            worse = change < -tolerance if higher_is_better else change > tolerance
+            metrics[path] = {"baseline": before, "current": after, "change": round(change, 4), "regression": worse}
+        worse = result["error_rate"] > base["error_rate"] + ERROR_RATE_SLACK
+        metrics["error_rate"] = {"baseline": base["error_rate"], "current": result["error_rate"], "regression": worse}
+        comparison["regressions"] += sum(m["regression"] for m in metrics.values())
+        comparison["targets"][target] = metrics
+    return comparison
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {"host": platform.node(), "python": platform.python_version(), "commit": commit,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}
+
+
+# Command line
+
+
+def parse_params(values: List[str]) -> dict:
+    params = {}
+    for value in values or []:
+        key, sep, param = value.partition("=")
+        if not sep:
+            raise SystemExit(f"--param expects key=value, got {value!r}")
+        params[key] = param
+    return params
+
+
+async def run_target(target: str, items: list, args, params: dict) -> dict:
+    send, close = make_sender(target, args.url, params, args.timeout, args.frame_ms)
+    try:
+        # Warmup requests, one at a time, are not reported
+        for item in items[:args.warmup]:
+            await send(item, time.perf_counter())
+        scrape = target not in ("tts", "realtime")
+        stages_before = await stage_seconds(args.url, args.timeout) if scrape else None
+        started = time.perf_counter()
+        if args.rate > 0:
+            samples = await open_loop(send, items, args.rate, args.concurrency, args.requests, args.duration,
+                                      random.Random(args.seed))
+        else:
+            samples = await closed_loop(send, items, args.concurrency, args.requests, args.duration)
+        wall = time.perf_counter() - started
+        stages_after = await stage_seconds(args.url, args.timeout) if scrape else None
+    finally:
+        await close()
+    result = summarize(target, samples, wall)
+    stages = stage_breakdown(stages_before, stages_after, len(samples))
+    if stages is not None:
+        result["server_stages_ms"] = stages
+    return result
+
+
+async def run(args) -> dict:
+    params = parse_params(args.param)
+    audio: List[AudioItem] = []
+    texts: List[str] = []
+    if any(t != "tts" for t in args.target):
+        if not args.corpus:
+            raise SystemExit("--corpus is required for the Whisper targets")
+        audio = load_audio(args.corpus)
+    if "tts" in args.target:
+        texts = load_texts(args.texts or os.path.join(args.corpus or ".", "texts.txt"))
+    # The same seed replays the same request order
+    rng = random.Random(args.seed)
+    rng.shuffle(audio)
+    rng.shuffle(texts)
+
+    results = {}
+    for target in args.target:
+        items = texts if target == "tts" else audio
+        print(f"Running {target}...", file=sys.stderr)
+        results[target] = await run_target(target, items, args, params)
+    return {
+        "config": {
+            "url": args.url,
+            "targets": args.target,
+            "concurrency": args.concurrency,
+            "rate": args.rate,
+            "requests": args.requests,
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "frame_ms": args.frame_ms,
+            "seed": args.seed,
+            "params": params,
+            "corpus": {
+                "audio_files": len(audio),
+                "audio_seconds": round(sum(i.seconds or 0 for i in audio), 2),
+                "texts": len(texts),
+                "digest": corpus_digest(audio + texts),
+            },
+        },
+        "environment": environment(),
+        "results": results,
+    }
+
+
+def write_json(data: dict, path: Optional[str]):
+    text = json.dumps(data, indent=2)
+    if path:
+        with open(path, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="generate load and report")
+    run_parser.add_argument("--url", default="http://localhost:11435")
+    run_parser.add_argument("--target", action="append", choices=TARGETS, required=True,
+                            help="repeat to run several targets one after another")
+    run_parser.add_argument("--corpus", help="directory of audio files (and texts.txt)")
+    run_parser.add_argument("--texts", help="text file for the tts target, one request per line")
+    run_parser.add_argument("--concurrency", type=int, default=4,
+                            help="clients (closed loop) or max requests in flight (open loop)")
+    run_parser.add_argument("--rate", type=float, default=0.0, help="arrivals per second, 0 for a closed loop")
+    run_parser.add_argument("--requests", type=int, default=100, help="requests per target, 0 for no limit")
+    run_parser.add_argument("--duration", type=float, default=0.0, help="seconds per target, 0 for no limit")
+    run_parser.add_argument("--warmup", type=int, default=2, help="unreported requests sent first")
+    run_parser.add_argument("--param", action="append", help="query parameter as key=value, e.g. beam_size=1")
+    run_parser.add_argument("--frame-ms", type=int, default=100, help="audio per frame for the realtime target")
+    run_parser.add_argument("--timeout", type=float, default=600.0)
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--baseline", help="compare with a stored result; exit 1 on regression")
+    run_parser.add_argument("--tolerance", type=float, default=0.10)
+    run_parser.add_argument("-o", "--output", help="write the report here instead of stdout")
+
+    compare_parser = commands.add_parser("compare", help="compare two reports")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("--tolerance", type=float, default=0.10)
+    compare_parser.add_argument("-o", "--output")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        if not args.requests and not args.duration:
+            parser.error("one of --requests and --duration must be set")
+        report = asyncio.run(run(args))
+        if args.baseline:
+            with open(args.baseline) as f:
+                report["comparison"] = compare(report, json.load(f), args.tolerance)
+        write_json(report, args.output)
+    else:
+        with open(args.current) as f:
+            current = json.load(f)
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        report = {"comparison": compare(current, baseline, args.tolerance)}
+        write_json(report, args.output)
+    comparison = report.get("comparison")
+    if comparison:
+        for warning in comparison["warnings"]:
+            print(f"warning: {warning}", file=sys.stderr)
+        if comparison["regressions"]:
+            print(f"{comparison['regressions']} metrics regressed beyond {comparison['tolerance']:.0%}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
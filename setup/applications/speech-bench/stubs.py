@@ -0,0 +1,450 @@
+"""
+Stub model backends for benchmarking the speech services offline on CPU.
+
+The real Whisper and VibeVoice apps are served unchanged: routing, batching,
+the inference executor, caches, upload decoding, VAD, serialization, the TTS
+session scheduler and output protocols all run as in production. Only the
+models are swapped for stand-ins that spend a simulated amount of compute time
+and return plausible output:
+
+- Whisper: an encoder pass per 30 s window and a decoder pass per segment
+  (~6 s of speech, dearer with larger beams), on a simulated device that runs
+  DEVICE_SLOTS kernels at a time. A batched pass costs one encoder pass plus
+  a small increment per extra window, and decodes its clips in lockstep.
+- VibeVoice: a prefill, then one step per 133 ms frame of 24 kHz audio. The
+  app's scheduler already takes turns between sessions at every step, like
+  one GPU.
+- Allosaurus: a cost per second of audio and a phoneme every 80 ms.
+
+The defaults are roughly distil-large-v3 and VibeVoice-Realtime-0.5B on one
+mid-range GPU; change them with the flags. Usage:
+
+    python stubs.py whisper --port 11435
+    python stubs.py tts --port 8000
+
+Environment variables of the apps apply as usual (e.g. BATCH_MAX_SIZE),
+except that the result caches default to off (CACHE_MAX_BYTES=0,
+PHRASE_CACHE_MAX_CHARS=0): a corpus is replayed many times, and with caching
+only its first pass would reach the models.
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, fields
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+WHISPER_APP = os.path.join(HERE, "..", "faster-whisper-cuda", "app")
+TTS_APP = os.path.join(HERE, "..", "vibevoice-tts-api", "app")
+
+WHISPER_RATE = 16_000
+TTS_RATE = 24_000
+WORDS = (
+    "the quick brown fox jumps over a lazy dog while seven people watch from the old bridge near "
+    "our river and everyone agrees that this was the best day of summer so far"
+).split()
+
+
+@dataclass
+class WhisperTiming:
+    encode_s: float = 0.030  # one 30 s window
+    batch_encode_s: float = 0.008  # each further window in a batched pass
+    decode_s: float = 0.015  # one segment at beam size 1
+    beam_cost: float = 0.12  # extra decoder cost per additional beam
+    batch_decode_cost: float = 0.05  # extra decoder cost per additional sequence in a batched pass
+    segment_s: float = 6.0  # speech per segment
+    device_slots: int = 1
+
+
+@dataclass
+class TTSTiming:
+    prefill_s: float = 0.060
+    step_s: float = 0.040  # one frame
+    frame_samples: int = 3200  # 133 ms at 24 kHz
+    chars_per_second: float = 15.0  # speaking rate, sets the audio length of a text
+    recognize_s: float = 0.030  # Allosaurus, per second of audio
+
+
+class SimulatedDevice:
+    """Kernels wait for one of `slots` and hold it for their duration"""
+
+    def __init__(self, slots: int = 1):
+        self._slots = threading.Semaphore(max(slots, 1))
+
+    def run(self, seconds: float):
+        if seconds <= 0:
+            return
+        with self._slots:
+            time.sleep(seconds)
+
+
+# Whisper
+
+
+def _words(rng: random.Random, seconds: float) -> List[str]:
+    return [rng.choice(WORDS) for _ in range(max(1, round(seconds * 2.5)))]
+
+
+def _pieces(spans: List[Tuple[float, float]], length: float) -> List[Tuple[float, float]]:
+    """Split (start, end) spans in seconds into pieces of at most `length`"""
+    pieces = []
+    for start, end in spans:
+        count = max(1, math.ceil((end - start) / length - 1e-9))
+        step = (end - start) / count
+        pieces += [(start + i * step, start + (i + 1) * step) for i in range(count)]
+    return pieces
+
+
+class _StubCT2Model:
+    """The `model.model` attribute: what the app reads from the CTranslate2 model"""
+
+    is_multilingual = True
+
+    def __init__(self, device: str):
+        self.device = device
+
+    def detect_language(self, encoder_output) -> List[List[Tuple[str, float]]]:
+        return [[("<|en|>", 0.93), ("<|de|>", 0.04), ("<|fr|>", 0.03)] for _ in range(encoder_output)]
+
+
+class StubWhisperModel:
+    """Stands in for faster_whisper.WhisperModel; the loading arguments are accepted and ignored"""
+
+    timing = WhisperTiming()
+    device = SimulatedDevice()
+
+    def __init__(self, model_size_or_path: str, device: str = "cuda", **kwargs):
+        from faster_whisper.feature_extractor import FeatureExtractor
+
+        self.model = _StubCT2Model(device)
+        # The real feature extractor: computing mel features is CPU work the app does too
+        self.feature_extractor = FeatureExtractor()
+
+    def encode(self, features) -> int:
+        windows = len(features)
+        self.device.run(self.timing.encode_s + self.timing.batch_encode_s * (windows - 1))
+        return windows
+
+    def detect_language(self, audio=None, features=None, vad_filter=False, vad_parameters=None, **kwargs):
+        self.device.run(self.timing.encode_s)
+        return "en", 0.93, [("en", 0.93), ("de", 0.04), ("fr", 0.03)]
+
+    def decode_cost(self, seconds: float, beam_size: int, sequences: int = 1) -> float:
+        t = self.timing
+        return (
+            t.decode_s * seconds / t.segment_s
+            * (1 + t.beam_cost * (max(beam_size, 1) - 1))
+            * (1 + t.batch_decode_cost * (sequences - 1))
+        )
+
+    def transcribe(
+        self,
+        audio,
+        language: Optional[str] = None,
+        task: str = "transcribe",
+        beam_size: int = 5,
+        vad_filter: bool = False,
+        vad_parameters=None,
+        word_timestamps: bool = False,
+        **kwargs,
+    ):
+        from faster_whisper.audio import decode_audio
+        from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+        if not isinstance(audio, np.ndarray):
+            audio = decode_audio(audio)
+        duration = audio.size / WHISPER_RATE
+        if vad_filter:
+            options = vad_parameters if isinstance(vad_parameters, VadOptions) else VadOptions(**(vad_parameters or {}))
+            spans = [(s["start"] / WHISPER_RATE, s["end"] / WHISPER_RATE) for s in get_speech_timestamps(audio, options)]
+        else:
+            spans = [(0.0, duration)] if duration else []
+        if language is None:
+            language, probability, _ = self.detect_language(audio)
+        else:
+            probability = 1.0
+        info = _transcription_info(language, probability, duration, sum(e - s for s, e in spans))
+
+        def segments() -> Iterator:
+            rng = random.Random(audio.size)
+            encoded_until = 0.0
+            speech = 0.0
+            for i, (start, end) in enumerate(_pieces(spans, self.timing.segment_s)):
+                if speech >= encoded_until:
+                    self.device.run(self.timing.encode_s)
+                    encoded_until += 30.0
+                speech += end - start
+                self.device.run(self.decode_cost(end - start, beam_size))
+                yield _segment(i, start, end, _words(rng, end - start), word_timestamps)
+
+        return segments(), info
+
+
+class StubBatchedPipeline:
+    """Stands in for faster_whisper.BatchedInferencePipeline"""
+
+    def __init__(self, model: StubWhisperModel, **kwargs):
+        self.model = model
+
+    def transcribe(
+        self,
+        audio,
+        language: Optional[str] = None,
+        task: str = "transcribe",
+        beam_size: int = 5,
+        clip_timestamps=None,
+        batch_size: int = 8,
+        vad_filter: bool = True,
+        **kwargs,
+    ):
+        duration = audio.size / WHISPER_RATE
+        if clip_timestamps:
+            clips = [(c["start"], c["end"]) for c in clip_timestamps]
+        else:
+            clips = [(s, min(s + 30.0, duration)) for s in np.arange(0.0, duration, 30.0)]
+        clips = _pieces(clips, 30.0)
+        if language is None:
+            language, probability, _ = self.model.detect_language(audio)
+        else:
+            probability = 1.0
+        info = _transcription_info(language, probability, duration, sum(e - s for s, e in clips))
+
+        def segments() -> Iterator:
+            rng = random.Random(audio.size)
+            index = 0
+            for first in range(0, len(clips), max(batch_size, 1)):
+                group = clips[first:first + batch_size]
+                self.model.encode(group)
+                # Batched decoding runs in lockstep: as long as the longest clip of the group
+                longest = max(end - start for start, end in group)
+                self.model.device.run(self.model.decode_cost(longest, beam_size, len(group)))
+                for start, end in _pieces(group, self.model.timing.segment_s):
+                    yield _segment(index, start, end, _words(rng, end - start), False)
+                    index += 1
+
+        return segments(), info
+
+
+def _segment(index: int, start: float, end: float, words: List[str], word_timestamps: bool):
+    from faster_whisper.transcribe import Segment, Word
+
+    step = (end - start) / len(words)
+    return Segment(
+        id=index + 1,
+        seek=int(start * 100),
+        start=round(start, 3),
+        end=round(end, 3),
+        text=" " + " ".join(words),
+        tokens=list(range(len(words))),
+        avg_logprob=-0.25,
+        compression_ratio=1.4,
+        no_speech_prob=0.01,
+        words=[
+            Word(start=round(start + i * step, 3), end=round(start + (i + 1) * step, 3), word=" " + w, probability=0.9)
+            for i, w in enumerate(words)
+        ] if word_timestamps else None,
+        temperature=0.0,
+    )
+
+
+def _transcription_info(language: str, probability: float, duration: float, speech: float):
+    from faster_whisper.transcribe import TranscriptionInfo
+
+    return TranscriptionInfo(
+        language=language,
+        language_probability=probability,
+        duration=duration,
+        duration_after_vad=speech,
+        all_language_probs=[(language, probability)],
+        transcription_options=None,
+        vad_options=None,
+    )
+
+
+def install_whisper(timing: WhisperTiming):
+    """Swap the models in the Whisper app's modules (import them from its directory first)"""
+    import batching
+    import longform
+    import registry
+
+    StubWhisperModel.timing = timing
+    StubWhisperModel.device = SimulatedDevice(timing.device_slots)
+    registry.WhisperModel = StubWhisperModel
+    batching.BatchedInferencePipeline = StubBatchedPipeline
+    longform.BatchedInferencePipeline = StubBatchedPipeline
+
+
+# VibeVoice and Allosaurus
+
+
+class StubTTSProcessor:
+    tokenizer = None
+
+    def process_input_with_cached_prompt(self, text: str, cached_prompt=None, **kwargs) -> dict:
+        return {"text": text}
+
+
+class StubTTSModel:
+    """Stands in for VibeVoiceStreamingForConditionalGenerationInference.generate"""
+
+    def __init__(self, timing: TTSTiming):
+        self.timing = timing
+        # A second of speech-like signal that frames are cut from
+        t = np.arange(TTS_RATE) / TTS_RATE
+        phase = 2 * np.pi * np.cumsum(140 + 30 * np.sin(2 * np.pi * 0.7 * t)) / TTS_RATE
+        voiced = sum(np.sin(k * phase) / k for k in range(1, 12))
+        self.signal = (0.2 * voiced * np.clip(np.sin(2 * np.pi * 3.5 * t), 0, None)).astype(np.float32)
+
+    def frames(self, text: str) -> int:
+        seconds = len(text) / self.timing.chars_per_second
+        return max(1, math.ceil(seconds * TTS_RATE / self.timing.frame_samples))
+
+    def generate(self, text: str = "", audio_streamer=None, stop_check_fn=None, **kwargs):
+        import torch
+
+        t = self.timing
+        time.sleep(t.prefill_s)
+        for i in range(self.frames(text)):
+            if stop_check_fn is not None and stop_check_fn():
+                break
+            time.sleep(t.step_s)
+            start = (i * t.frame_samples) % (self.signal.size - t.frame_samples)
+            chunk = torch.from_numpy(self.signal[start:start + t.frame_samples].copy())
+            audio_streamer.put(chunk[None], torch.tensor([0]))
+
+
+class StubRecognizer:
+    """Stands in for visemes.PhonemeRecognizer"""
+
+    def __init__(self, timing: TTSTiming):
+        from visemes import PHONEME_DTYPE, RECOGNIZER_RATE, VISEMES
+
+        self.timing = timing
+        self.dtype = PHONEME_DTYPE
+        self.rate = RECOGNIZER_RATE
+        self.names = VISEMES
+
+    def recognize(self, audio: np.ndarray) -> np.ndarray:
+        seconds = audio.size / self.rate
+        time.sleep(self.timing.recognize_s * seconds)
+        starts = np.arange(0.0, seconds, 0.08)
+        phonemes = np.empty(starts.size, dtype=self.dtype)
+        phonemes["start"] = starts
+        phonemes["duration"] = 0.025
+        phonemes["phoneme"] = np.arange(starts.size) % len(self.names)
+        return phonemes
+
+    def visemes(self, phonemes: np.ndarray) -> List[str]:
+        return [self.names[p] for p in phonemes["phoneme"].tolist()]
+
+
+def install_tts(main, timing: TTSTiming):
+    """Swap the models of the TTS app's StreamingTTSService (main imported from its directory)"""
+    import torch
+
+    service = main.StreamingTTSService
+    original_init = service.__init__
+
+    def __init__(self, *args, **kwargs):
+        original_init(self, *args, **kwargs)
+        # Voice presets are stub tensors on the CPU
+        self.device = torch.device("cpu")
+        self.voices.device = self.device
+
+    def load_model(self):
+        self.processor = StubTTSProcessor()
+        self.model = StubTTSModel(timing)
+
+    def load_recognizer(self):
+        self.phoneme_recognizer = StubRecognizer(timing)
+
+    service.__init__ = __init__
+    service.load_model = load_model
+    service.load_recognizer = load_recognizer
+
+
+def write_voice_presets(directory: str, names: List[str]):
+    """Small stand-in presets, so the app's voice cache loads real files"""
+    import torch
+
+    os.makedirs(directory, exist_ok=True)
+    for name in names:
+        torch.save({"prompt": torch.zeros(64, 256)}, os.path.join(directory, name + ".pt"))
+
+
+# Command line
+
+
+def _add_timing_flags(parser: argparse.ArgumentParser, timing_class):
+    for f in fields(timing_class):
+        parser.add_argument(f"--{f.name.replace('_', '-')}", type=f.type, default=f.default, help=f"default {f.default}")
+
+
+def _timing(args, timing_class):
+    return timing_class(**{f.name: getattr(args, f.name) for f in fields(timing_class)})
+
+
+def serve_whisper(args):
+    sys.path.insert(0, os.path.abspath(args.app_dir or WHISPER_APP))
+    scratch = tempfile.mkdtemp(prefix="whisper-stub-")
+    os.makedirs(os.path.join(scratch, "model"))
+    os.environ.setdefault("MODELS", f"stub={os.path.join(scratch, 'model')}")
+    os.environ.setdefault("JOBS_DIR", os.path.join(scratch, "jobs"))
+    # A corpus is replayed many times: with the result cache on, only the first pass would be measured
+    os.environ.setdefault("CACHE_MAX_BYTES", "0")
+    install_whisper(_timing(args, WhisperTiming))
+    import main
+
+    _run(main.app, args)
+
+
+def serve_tts(args):
+    sys.path.insert(0, os.path.abspath(args.app_dir or TTS_APP))
+    scratch = tempfile.mkdtemp(prefix="tts-stub-")
+    voices = os.path.join(scratch, "voices")
+    os.environ.setdefault("VOICE_PATH", voices)
+    os.environ.setdefault("PHRASE_CACHE_MAX_CHARS", "0")
+    default_voice = os.path.splitext(os.environ.get("VOICE_FILE", "en-Emma_woman.pt"))[0]
+    write_voice_presets(os.environ["VOICE_PATH"], [default_voice, *args.voices])
+    import main
+
+    install_tts(main, _timing(args, TTSTiming))
+    _run(main.app, args)
+
+
+def _run(app, args):
+    import uvicorn
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level=args.log_level)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0], formatter_class=argparse.RawDescriptionHelpFormatter)
+    services = parser.add_subparsers(dest="service", required=True)
+    for name, timing_class, port, serve in (
+        ("whisper", WhisperTiming, 11435, serve_whisper),
+        ("tts", TTSTiming, 8000, serve_tts),
+    ):
+        sub = services.add_parser(name, help=f"serve the {name} app with stub models")
+        sub.add_argument("--host", default="127.0.0.1")
+        sub.add_argument("--port", type=int, default=port)
+        sub.add_argument("--app-dir", help="app directory, defaults to the one in this repository")
+        sub.add_argument("--log-level", default="warning")
+        if name == "tts":
+            sub.add_argument("--voices", nargs="*", default=[], help="extra voice names besides VOICE_FILE")
+        _add_timing_flags(sub, timing_class)
+        sub.set_defaults(serve=serve)
+    args = parser.parse_args()
+    args.serve(args)
+
+
+if __name__ == "__main__":
+    main()
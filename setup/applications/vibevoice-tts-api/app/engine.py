@@ -0,0 +1,335 @@
+"""
+Session-aware generation engine for concurrent /stream connections.
+
+Every connection gets its own TTSSession (viseme context, timing, stop flag)
+instead of sharing state on the service. A GenerationScheduler admits at most
+`max_sessions` generations at a time; further sessions wait in a bounded queue.
+
+model.generate runs its whole decoding loop internally and only calls back into
+us through `stop_check_fn`, once per step. The scheduler uses that callback as
+a yield point: active sessions take turns through a FIFO turn lock, one
+decoding step each, so concurrent sessions are interleaved step by step on the
+GPU instead of contending for it from several threads at once.
+
+The scheduler also reports its load for /load and /readyz: the estimated wait
+of a new session (queue position times the recent mean session length, spread
+over the slots) and the recent real-time factor of generation. Above the
+configured thresholds the service reports not-ready until the load has dropped
+below RECOVER of them, so a gateway stops sending it sessions it would only
+queue or stutter through.
+"""
+
+import asyncio
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Deque, List, Optional, Tuple
+
+import numpy as np
+
+from resample import StreamingResampler
+
+SAMPLE_RATE = 24_000
+LOAD_WINDOW_S = 60.0
+RECOVER = 0.8
+
+
+class SessionLimitReached(Exception):
+    """Raised when both the active sessions and the waiting queue are full"""
+
+
+class GenerationFailed(Exception):
+    """Raised by the stream of a generation that ended in an error rather than at the end of its text"""
+
+
+@dataclass
+class TTSSession:
+    text: str
+    voice: str
+    cfg_scale: float = 1.5
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    stop_event: threading.Event = field(default_factory=threading.Event)
+    created: float = field(default_factory=time.monotonic)
+    started: Optional[float] = None  # first generation slot; None if every unit came from the cache
+    first_audio: Optional[float] = None
+    finished: Optional[float] = None
+    audio_samples: int = 0
+    # Set by the first stop(): "done", "disconnect"/"client" when the client cancelled, "error" when generation
+    # failed, "rejected" when the slot queue was full
+    stop_reason: Optional[str] = None
+    stopped: Optional[float] = None
+    # Audio generated after a cancellation and thrown away
+    discarded_samples: int = 0
+    # Runs the session's blocking stream iterator calls in order on one thread
+    worker: ThreadPoolExecutor = field(
+        default_factory=lambda: ThreadPoolExecutor(max_workers=1, thread_name_prefix="tts-session")
+    )
+    # Viseme pipeline state carried between chunks: 24 -> 16 kHz filter and 100 ms of 16 kHz context
+    resampler: StreamingResampler = field(default_factory=StreamingResampler)
+    last_100ms: np.ndarray = field(default_factory=lambda: np.zeros(1600, dtype=np.float32))
+    time_offset: float = 0.0
+
+    def stop(self, reason: str = "done"):
+        """Signal the generation to end at its next step"""
+        if self.stop_reason is None:
+            self.stop_reason = reason
+            self.stopped = time.monotonic()
+        self.stop_event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.stop_reason in ("disconnect", "client")
+
+    def add_audio(self, samples: int):
+        if self.first_audio is None:
+            self.first_audio = time.monotonic()
+        self.audio_samples += samples
+
+    def audio_lead(self) -> float:
+        """Seconds of audio sent ahead of real-time playback"""
+        if self.first_audio is None:
+            return 0.0
+        return self.audio_samples / SAMPLE_RATE - (time.monotonic() - self.first_audio)
+
+    @property
+    def time_to_first_audio(self) -> Optional[float]:
+        if self.first_audio is None:
+            return None
+        return self.first_audio - self.created
+
+
+class TurnLock:
+    """FIFO lock: waiters are served in arrival order, which makes turns round-robin"""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._next_ticket = 0
+        self._serving = 0
+
+    def acquire(self):
+        with self._cond:
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            while self._serving != ticket:
+                self._cond.wait()
+
+    def release(self):
+        with self._cond:
+            self._serving += 1
+            self._cond.notify_all()
+
+
+class GenerationScheduler:
+    def __init__(
+        self,
+        max_sessions: int = 4,
+        max_queue: int = 16,
+        interleave: bool = True,
+        ready_max_waiting: int = 0,
+        ready_max_wait_s: float = 0.0,
+        ready_max_rtf: float = 0.0,
+    ):
+        self.max_sessions = max_sessions
+        self.max_queue = max_queue
+        self.interleave = interleave
+        # Saturation thresholds for readiness, 0 disables
+        self.ready_max_waiting = ready_max_waiting
+        self.ready_max_wait_s = ready_max_wait_s
+        self.ready_max_rtf = ready_max_rtf
+        self.saturated = False
+        self._slots = asyncio.Semaphore(max_sessions)
+        self._turn = TurnLock()
+        self.active = 0
+        self.waiting = 0
+        # Stats
+        self.rejected = 0
+        self.served = 0
+        self.failed = 0
+        self.generation_seconds = 0.0
+        self.audio_seconds = 0.0
+        self.ttfa: Deque[float] = deque(maxlen=1000)
+        self.cancelled: Counter = Counter()
+        self.cancelled_generation_seconds = 0.0
+        self.discarded_audio_seconds = 0.0
+        # Time from a cancellation until the session's generation exited and its slot was free
+        self.stop_latency: Deque[float] = deque(maxlen=1000)
+        # Sliding windows for the load report: (finished, seconds, audio seconds) of completed
+        # generations, and (released, seconds held) of generation slots
+        self.recent_generations: Deque[Tuple[float, float, float]] = deque()
+        self.recent_slots: Deque[Tuple[float, float]] = deque()
+
+    @asynccontextmanager
+    async def session(self, session: TTSSession):
+        """Account for a session from start to end; it only holds a generation slot inside slot()"""
+        try:
+            yield session
+        finally:
+            self._record(session)
+
+    @asynccontextmanager
+    async def slot(self, session: TTSSession):
+        """
+        Hold a generation slot for one unit of the session, waiting in the queue if all slots are busy.
+
+        Taken per generated unit rather than per session, so a session waiting for more text or
+        replaying a cached phrase does not keep the GPU from others.
+        """
+        if self._slots.locked() and self.waiting >= self.max_queue:
+            self.rejected += 1
+            session.stop("rejected")
+            raise SessionLimitReached(f"{self.active} sessions active, {self.waiting} waiting")
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        acquired = time.monotonic()
+        samples = session.audio_samples
+        if session.started is None:
+            session.started = acquired
+        try:
+            yield session
+        finally:
+            self.active -= 1
+            self._slots.release()
+            self._record_slot(session, acquired, session.audio_samples - samples)
+
+    @contextmanager
+    def generation_turn(self):
+        """Wrap a blocking model.generate call; holds the turn between step callbacks"""
+        if not self.interleave:
+            yield
+            return
+        self._turn.acquire()
+        try:
+            yield
+        finally:
+            self._turn.release()
+
+    def stop_check(self, session: TTSSession) -> Callable[[], bool]:
+        """stop_check_fn for model.generate: hands the turn to the next session, then reports cancellation"""
+        def check() -> bool:
+            if self.interleave:
+                self._turn.release()
+                self._turn.acquire()
+            return session.stop_event.is_set()
+        return check
+
+    def _record_slot(self, session: TTSSession, acquired: float, samples: int):
+        released = time.monotonic()
+        self.generation_seconds += released - acquired
+        self.audio_seconds += samples / SAMPLE_RATE
+        if session.cancelled:
+            self.cancelled_generation_seconds += released - acquired
+            # The unit a cancellation interrupted (or that was still waiting for its slot)
+            self.stop_latency.append(released - max(session.stopped, acquired))
+        elif session.stop_reason != "error":
+            self.recent_slots.append((released, released - acquired))
+
+    def _record(self, session: TTSSession):
+        session.finished = time.monotonic()
+        if session.stop_reason == "rejected":
+            return  # counted in `rejected`
+        self.served += 1
+        if session.time_to_first_audio is not None:
+            self.ttfa.append(session.time_to_first_audio)
+        if session.cancelled:
+            self.cancelled[session.stop_reason] += 1
+            self.discarded_audio_seconds += session.discarded_samples / SAMPLE_RATE
+        elif session.stop_reason == "error":
+            self.failed += 1
+
+    def record_generation(self, seconds: float, samples: int):
+        """A text unit generated to completion: wall time of its generation and the audio it produced"""
+        if samples:
+            self.recent_generations.append((time.monotonic(), seconds, samples / SAMPLE_RATE))
+
+    def load(self) -> dict:
+        """Current load and whether it exceeds the readiness thresholds"""
+        now = time.monotonic()
+        for window in (self.recent_generations, self.recent_slots):
+            while window and window[0][0] < now - LOAD_WINDOW_S:
+                window.popleft()
+        generations = list(self.recent_generations)
+        slots = [seconds for _, seconds in self.recent_slots]
+        audio = sum(audio_seconds for _, _, audio_seconds in generations)
+        rtf = sum(seconds for _, seconds, _ in generations) / audio if audio else None
+        mean_slot = float(np.mean(slots)) if slots else None
+        if self.active < self.max_sessions:
+            wait = 0.0
+        else:
+            # A new unit starts once the units ahead of it have freed a slot
+            wait = (self.waiting + 1) * (mean_slot or 0.0) / self.max_sessions
+        reasons = self._saturation(wait, rtf)
+        return {
+            "saturated": self.saturated,
+            "reasons": reasons,
+            "active": self.active,
+            "waiting": self.waiting,
+            "max_sessions": self.max_sessions,
+            "max_queue": self.max_queue,
+            "estimated_wait_seconds": round(wait, 3),
+            "recent": {
+                "window_seconds": LOAD_WINDOW_S,
+                "generations": len(generations),
+                "slots": len(slots),
+                "real_time_factor": round(rtf, 3) if rtf is not None else None,
+                "mean_slot_seconds": round(mean_slot, 3) if mean_slot is not None else None,
+            },
+            "thresholds": {
+                "max_waiting": self.ready_max_waiting,
+                "max_wait_seconds": self.ready_max_wait_s,
+                "max_real_time_factor": self.ready_max_rtf,
+                "recover": RECOVER,
+            },
+        }
+
+    def _saturation(self, wait: float, rtf: Optional[float]) -> List[str]:
+        """Update `saturated`; once saturated, every value must drop below RECOVER of its threshold"""
+        values = [
+            ("waiting", self.waiting, self.ready_max_waiting),
+            ("estimated wait", wait, self.ready_max_wait_s),
+            ("real-time factor", rtf or 0.0, self.ready_max_rtf),
+        ]
+        scale = RECOVER if self.saturated else 1.0
+        reasons = [
+            f"{name} {value:.2f} > {limit * scale:.2f}"
+            for name, value, limit in values
+            if limit and value > limit * scale
+        ]
+        self.saturated = bool(reasons)
+        return reasons
+
+    def stats(self) -> dict:
+        ttfa = np.array(self.ttfa) * 1000 if self.ttfa else None
+        stop_latency = np.array(self.stop_latency) * 1000 if self.stop_latency else None
+        return {
+            "max_sessions": self.max_sessions,
+            "max_queue": self.max_queue,
+            "interleave_steps": self.interleave,
+            "active": self.active,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+            "served": self.served,
+            "failed": self.failed,
+            "audio_seconds": round(self.audio_seconds, 2),
+            # Generation slot time per second of generated audio, summed over units
+            "real_time_factor": round(self.generation_seconds / self.audio_seconds, 3) if self.audio_seconds else None,
+            "ttfa_ms": {
+                "p50": round(float(np.percentile(ttfa, 50)), 1),
+                "p95": round(float(np.percentile(ttfa, 95)), 1),
+            } if ttfa is not None else None,
+            "cancelled": dict(self.cancelled),
+            # Model time spent on sessions the client abandoned, and audio produced after they left
+            "cancelled_generation_seconds": round(self.cancelled_generation_seconds, 2),
+            "discarded_audio_seconds": round(self.discarded_audio_seconds, 2),
+            "stop_latency_ms": {
+                "p50": round(float(np.percentile(stop_latency, 50)), 1),
+                "p95": round(float(np.percentile(stop_latency, 95)), 1),
+            } if stop_latency is not None else None,
+        }
@@ -1,12 +1,15 @@
 import asyncio
+import logging
 import os
 import threading
+import time
 from pathlib import Path
 from typing import Iterator, Optional
 
 import numpy as np
 import torch
-from fastapi import FastAPI, WebSocket
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse
 from starlette.websockets import WebSocketState
 
 from vibevoice.modular.modeling_vibevoice_streaming_inference import (
@@ -17,45 +20,69 @@ from vibevoice.processor.vibevoice_streaming_processor import (
 )
 from vibevoice.modular.streamer import AudioStreamer
 
-import copy
-
 import json
 import base64
 from allosaurus.app import read_recognizer
 
-import tempfile
 import io
-import scipy.io.wavfile as wavfile
 
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
 
+from engine import GenerationFailed, GenerationScheduler, SessionLimitReached, TTSSession
+from phrasecache import Phrase, PhraseCache, PhraseRecorder, phrase_key
+from protocol import FramedOutput, JSONOutput, make_encoder
+from startup import StartupTracker
+from textstream import TextSegmenter
+from visemes import CONTEXT_S, PhonemeRecognizer, to_viseme_events
+from voices import VoiceCache
+
+logger = logging.getLogger(__name__)
+
 executor = ThreadPoolExecutor(max_workers=4)
 model_path = os.environ.get('MODEL_PATH', '/opt/app/model/VibeVoice-Realtime-0.5B')
 voice_path = os.environ.get('VOICE_PATH', '/opt/VibeVoice/demo/voices/streaming_model')
 voice_file = os.environ.get('VOICE_FILE', 'en-Emma_woman.pt')
+default_voice = Path(voice_file).stem
+# Presets are loaded on first use and evicted least-recently-used beyond this size
+voice_cache_mb = int(os.environ.get('VOICE_CACHE_MB', '1024'))
+# Give every request its own copy of the preset tensors instead of sharing them once the warmup showed
+# that generation leaves them unchanged (without a warmup they are always copied)
+voice_clone_tensors = os.environ.get('VOICE_CLONE_TENSORS', '0') == '1'
 SAMPLE_RATE = 24_000
 
-# Comprehensive map for Allosaurus English symbols
-IPA_MAP = {
-    # aa (Open Mouth)
-    'a': 'aa', 'ɑ': 'aa', 'æ': 'aa', 'ʌ': 'aa', 'ə': 'aa', 
-    'ŋ': 'aa', 'k': 'aa', 'ɡ': 'aa', 'ɹ': 'aa', 'ɻ': 'aa', 'ɻ̩': 'aa',
-    
-    # ih (Teeth/Smile)
-    'i': 'ih', 'ɪ': 'ih', 'j': 'ih', 'θ': 'ih', 'ð': 'ih',
-    's': 'ih', 'z': 'ih', 't': 'ih', 'd': 'ih', 'n': 'ih', 'l': 'ih',
-    
-    # ou (Pursed Lips)
-    'u': 'ou', 'ʊ': 'ou', 'w': 'ou', 'p': 'ou', 'b': 'ou', 'm': 'ou',
-    
-    # ee (Mid-Open Smile)
-    'e': 'ee', 'ɛ': 'ee',
-    
-    # oh (Rounded Open)
-    'o': 'oh', 'ɔ': 'oh'
-}
+# Concurrent generations; further units of text queue for a slot, up to TTS_MAX_QUEUED_SESSIONS of them
+max_sessions = int(os.environ.get('TTS_MAX_SESSIONS', '4'))
+max_queued_sessions = int(os.environ.get('TTS_MAX_QUEUED_SESSIONS', '16'))
+interleave_steps = os.environ.get('TTS_INTERLEAVE_STEPS', '1') == '1'
+# /readyz reports not-ready above these (0 disables): sessions queued, estimated wait of a new
+# session, and generation time per second of audio (above 1 playback outruns generation)
+ready_max_waiting = int(os.environ.get('TTS_READY_MAX_WAITING', str(max_queued_sessions // 2)))
+ready_max_wait_s = float(os.environ.get('TTS_READY_MAX_WAIT_S', '10'))
+ready_max_rtf = float(os.environ.get('TTS_READY_MAX_RTF', '1.0'))
+
+# Incremental text input: below this much unplayed audio, units may end at a clause instead of a sentence
+eager_lead_s = float(os.environ.get('TTS_EAGER_LEAD_S', '1.0'))
+max_unit_chars = int(os.environ.get('TTS_MAX_UNIT_CHARS', '300'))
+
+# Synthesized phrase cache, for short texts that are spoken again and again
+phrase_cache_mb = int(os.environ.get('PHRASE_CACHE_MB', '64'))
+phrase_cache_dir = os.environ.get('PHRASE_CACHE_DIR', '')
+phrase_cache_disk_mb = int(os.environ.get('PHRASE_CACHE_DISK_MB', '1024'))
+phrase_cache_max_chars = int(os.environ.get('PHRASE_CACHE_MAX_CHARS', '200'))
 
+# Bit rate of ?protocol=binary&codec=opus output
+opus_bit_rate = int(os.environ.get('TTS_OPUS_BITRATE', '32000'))
+phrase_cache = PhraseCache(
+    max_bytes=phrase_cache_mb * 1024 * 1024,
+    directory=phrase_cache_dir or None,
+    disk_max_bytes=phrase_cache_disk_mb * 1024 * 1024,
+)
+
+# Voices loaded at startup besides the default ("all" for every preset), and the warmup synthesis
+preload_voices = [v.strip() for v in os.environ.get('TTS_PRELOAD_VOICES', '').split(',') if v.strip()]
+warmup_text = os.environ.get('TTS_WARMUP_TEXT', 'Hello! This is a short sentence to warm up the model.')
+warmup_runs = int(os.environ.get('TTS_WARMUP_RUNS', '1'))
 
 class StreamingTTSService:
     def __init__(self, inference_steps: int = 5):
@@ -64,11 +91,24 @@ class StreamingTTSService:
         self.device = torch.device("cuda")
         self.processor: Optional[VibeVoiceStreamingProcessor] = None
         self.model: Optional[VibeVoiceStreamingForConditionalGenerationInference] = None
-        self.default_voice = None
+        self.voices = VoiceCache(
+            voice_path,
+            self.device,
+            budget_bytes=voice_cache_mb * 2**20,
+            clone_tensors=voice_clone_tensors,
+        )
         self.allo_model = None
-        self.state = None
+        self.phoneme_recognizer: Optional[PhonemeRecognizer] = None
+        self.scheduler = GenerationScheduler(
+            max_sessions=max_sessions,
+            max_queue=max_queued_sessions,
+            interleave=interleave_steps,
+            ready_max_waiting=ready_max_waiting,
+            ready_max_wait_s=ready_max_wait_s,
+            ready_max_rtf=ready_max_rtf,
+        )
 
-    def load(self):
+    def load_model(self):
         self.processor = VibeVoiceStreamingProcessor.from_pretrained(self.model_path)
         
         self.model = VibeVoiceStreamingForConditionalGenerationInference.from_pretrained(
@@ -85,17 +125,27 @@ class StreamingTTSService:
             beta_schedule="squaredcos_cap_v2",
         )
         self.model.set_ddpm_inference_steps(num_steps=self.inference_steps)
-        
-        # Load default voice preset
-        self.default_voice = torch.load(f"{voice_path}/{voice_file}", map_location=self.device, weights_only=False)
-        
+
+    def load_voices(self):
+        # Load the default voice preset and TTS_PRELOAD_VOICES, others are loaded on first request
+        names = self.voices.names() if preload_voices == ["all"] else preload_voices
+        for name in [default_voice, *names]:
+            self.voices.get(name)
+
+    def load_recognizer(self):
         self.allo_model = read_recognizer()
+        self.phoneme_recognizer = PhonemeRecognizer(self.allo_model)
 
-    def stream(self, text: str, cfg_scale: float = 1.5) -> Iterator[np.ndarray]:
+    def stream(self, session: TTSSession, text: Optional[str] = None, trial_share: bool = False) -> Iterator[np.ndarray]:
+        """
+        Synthesize `text` (the session's text by default); a session may call this once per text unit.
+        `trial_share` generates on the voice preset's own tensors even before sharing them is verified.
+        """
+        voice = self.voices.get(session.voice)
         # Prepare inputs
         processed = self.processor.process_input_with_cached_prompt(
-            text=text.strip(),
-            cached_prompt=self.default_voice,
+            text=(session.text if text is None else text).strip(),
+            cached_prompt=voice.prompt,
             padding=True,
             return_tensors="pt",
             return_attention_mask=True,
@@ -104,174 +154,450 @@ class StreamingTTSService:
         
         # Setup streaming
         audio_streamer = AudioStreamer(batch_size=1, stop_signal=None, timeout=None)
-        stop_event = threading.Event()
         
-        # Run generation in thread
+        # Run generation in thread, taking turns with other sessions at every step
+        prefilled_outputs = self.voices.fork(voice, trial=trial_share)
+        finished = threading.Event()
+        # An exception of generate(), raised to the consumer once the audio before it is drained
+        failure = []
+        turn = self.scheduler.stop_check(session)
+
+        def stop_check():
+            return turn() or finished.is_set()
+
         def generate():
-            self.model.generate(
-                **inputs,
-                max_new_tokens=None,
-                cfg_scale=cfg_scale,
-                tokenizer=self.processor.tokenizer,
-                generation_config={"do_sample": False, "temperature": 1.0, "top_p": 1.0},
-                audio_streamer=audio_streamer,
-                stop_check_fn=stop_event.is_set,
-                verbose=False,
-                refresh_negative=True,
-                all_prefilled_outputs=copy.deepcopy(self.default_voice),
-            )
+            try:
+                with self.scheduler.generation_turn():
+                    self.model.generate(
+                        **inputs,
+                        max_new_tokens=None,
+                        cfg_scale=session.cfg_scale,
+                        tokenizer=self.processor.tokenizer,
+                        generation_config={"do_sample": False, "temperature": 1.0, "top_p": 1.0},
+                        audio_streamer=audio_streamer,
+                        stop_check_fn=stop_check,
+                        verbose=False,
+                        refresh_negative=True,
+                        all_prefilled_outputs=prefilled_outputs,
+                    )
+            except Exception as e:
+                failure.append(e)
+                return
+            finally:
+                # However generate() ended, the consumer must not wait for more audio
+                audio_streamer.end()
+            self.voices.check(voice)
         
         thread = threading.Thread(target=generate, daemon=True)
         thread.start()
         
         # Yield audio chunks
-        for audio_chunk in audio_streamer.get_stream(0):
-            if torch.is_tensor(audio_chunk):
-                audio_chunk = audio_chunk.detach().cpu().to(torch.float32).numpy()
-            else:
-                audio_chunk = np.asarray(audio_chunk, dtype=np.float32)
-            
-            audio_chunk = audio_chunk.reshape(-1)
-            peak = np.max(np.abs(audio_chunk)) if audio_chunk.size else 0.0
-            if peak > 1.0:
-                audio_chunk = audio_chunk / peak
-            
-            yield audio_chunk.astype(np.float32, copy=False)
-        
-        stop_event.set()
-        thread.join()
+        exhausted = False
+        try:
+            for audio_chunk in audio_streamer.get_stream(0):
+                if torch.is_tensor(audio_chunk):
+                    audio_chunk = audio_chunk.detach().cpu().to(torch.float32).numpy()
+                else:
+                    audio_chunk = np.asarray(audio_chunk, dtype=np.float32)
+                
+                audio_chunk = audio_chunk.reshape(-1)
+                peak = np.max(np.abs(audio_chunk)) if audio_chunk.size else 0.0
+                if peak > 1.0:
+                    audio_chunk = audio_chunk / peak
+                
+                yield audio_chunk.astype(np.float32, copy=False)
+            exhausted = True
+        finally:
+            # Also runs when the consumer closes the iterator early: stop at the next step,
+            # drain what is produced until then and wait for the generation thread to exit
+            finished.set()
+            if not exhausted:
+                for audio_chunk in audio_streamer.get_stream(0):
+                    session.discarded_samples += audio_chunk.numel() if torch.is_tensor(audio_chunk) else np.size(audio_chunk)
+            thread.join()
+        if failure:
+            # Not a normal end of stream: the unit is truncated and must not be cached or counted
+            raise GenerationFailed(f"{type(failure[0]).__name__}: {failure[0]}") from failure[0]
 
-    def chunk_to_pcm16(self, chunk: np.ndarray) -> bytes:
+    def warmup(self, text: str):
+        """
+        Synthesize `text` and run viseme recognition on it, outside of the session scheduler's stats.
+        Generates on the shared preset tensors and, if it left them unchanged, lets requests share them.
+        """
+        session = TTSSession(text=text, voice=default_voice)
+        voice = self.voices.get(default_voice)
+        for chunk in self.stream(session, trial_share=True):
+            self.get_visemes_with_context(advance_viseme_context(session, chunk))
+            session.add_audio(chunk.size)
+        # The stream is drained, so generate() has returned
+        self.voices.verify_sharing(voice)
+        return session.audio_samples / SAMPLE_RATE
+
+    def chunk_to_pcm16(self, chunk: np.ndarray) -> np.ndarray:
         chunk = np.clip(chunk, -1.0, 1.0)
-        pcm = (chunk * 32767.0).astype(np.int16)
-        return pcm.tobytes()
+        return (chunk * 32767.0).astype(np.int16)
 
     def get_visemes_with_context(self, current_chunk):
-        pcm16_audio = (current_chunk * 32767).astype(np.int16)
-        with tempfile.NamedTemporaryFile(suffix=".wav", dir="/dev/shm", delete=True) as temp_wav:
-            wavfile.write(temp_wav.name, 16000, pcm16_audio)
-            raw_str = self.allo_model.recognize(temp_wav.name, timestamp=True)
-        current_visemes = []
-        lines = raw_str.strip().split('\n')
-        for line in lines:
-            parts = line.split()
-            if len(parts) >= 3:
-                start_time = float(parts[0])
-                # Only keep phonemes that actually belong to the NEW part of the audio
-                if start_time >= 0.100:
-                    adjusted_time = start_time - 0.100 # Normalize back to 0.0
-                    symbol = parts[2][0]
-
-                    # get phoneme audio level
-                    duration = float(parts[1])
-                    audio_start = int(start_time * 16000)
-                    audio_end = int((start_time + duration) * 16000)
-                    audio_slice = current_chunk[audio_start:audio_end]
-                    level = 0.0
-                    if len(audio_slice) > 0:
-                        # Root Mean Square calculation
-                        rms = np.sqrt(np.mean(np.square(audio_slice)))
-                        # 3. Normalize to 0.0 - 1.0
-                        # Note: Speech RMS rarely hits 1.0. 
-                        # A value of 0.2 is usually quite loud.
-                        level = np.clip(rms, 0.0, 1.0)
-
-                    current_visemes.append({
-                        "t": round(adjusted_time, 3),
-                        "d": duration,
-                        "l": level,
-                        "v": IPA_MAP.get(symbol, 'aa')
-                    })
-        return current_visemes
-
-    def get_visemes_from_chunk(self, audio_bytes):
-        pcm16_audio = (audio_bytes * 32767).astype(np.int16)
-        # Convert PCM16 bytes to float32 numpy (Allosaurus requirement)
-        visemes = []
-        with tempfile.NamedTemporaryFile(suffix=".wav", dir="/dev/shm", delete=True) as temp_wav:
-            wavfile.write(temp_wav.name, 16000, pcm16_audio)
-    
-            # Run inference (Allosaurus expects 16kHz)
-            # Output format: "start_time duration phoneme"
-            results = self.allo_model.recognize(temp_wav.name, timestamp=True)
-    
-            for line in results.split('\n'):
-                parts = line.split()
-                if len(parts) >= 3:
-                    start_time = float(parts[0])
-                    end_time = float(parts[1])
-                    phoneme = parts[2]
-                    v_shape = IPA_MAP.get(phoneme, IPA_MAP.get(phoneme[0], 'aa'))
-                    visemes.append({
-                        "t1": start_time,
-                        "t2": end_time,
-                        "v": v_shape
-                    })
-        return visemes
+        phonemes = self.phoneme_recognizer.recognize(current_chunk)
+        # Only keep phonemes that actually belong to the NEW part of the audio
+        return to_viseme_events(self.phoneme_recognizer, phonemes, current_chunk, skip_s=CONTEXT_S)
+
+    def get_visemes_from_chunk(self, audio):
+        phonemes = self.phoneme_recognizer.recognize(audio)
+        visemes = self.phoneme_recognizer.visemes(phonemes)
+        return [
+            {"t1": round(t, 3), "t2": round(d, 3), "v": v}
+            for t, d, v in zip(phonemes["start"].tolist(), phonemes["duration"].tolist(), visemes)
+        ]
 
 
 app = FastAPI()
 
 
 
+startup = StartupTracker()
+
+
 @app.on_event("startup")
 async def _startup():
     service = StreamingTTSService()
-    service.load()
     app.state.tts_service = service
+    app.state.startup_task = asyncio.create_task(start_service(service))
+
+
+async def start_service(service: StreamingTTSService):
+    """Load model, voices and recognizer in parallel, then warm up before reporting ready"""
+    try:
+        await asyncio.gather(
+            startup.run("load_model", service.load_model),
+            startup.run("load_voices", service.load_voices),
+            startup.run("load_recognizer", service.load_recognizer),
+        )
+    except Exception as e:
+        startup.mark("failed", e)
+        return
+    if warmup_runs > 0 and warmup_text.strip():
+        startup.mark("warming")
+        try:
+            for run in range(warmup_runs):
+                seconds = await startup.run(f"warmup_{run + 1}", service.warmup, warmup_text)
+                logger.info(f"Warmup run {run + 1} synthesized {seconds:.2f}s of audio")
+        except Exception as e:
+            # The model is loaded; a failed warmup only means the first request is slower
+            logger.warning(f"Warmup failed: {e}")
+    startup.mark("ready")
 
 
 @app.get("/health")
 async def health_check():
-    """Check if the API and model are ready"""
-    if app.state.tts_service.model is None:
-        raise HTTPException(status_code=503, detail="Model not loaded")
+    """Check if the API and model are ready (loaded and warmed up)"""
+    if not startup.ready:
+        raise HTTPException(status_code=503, detail=f"Model not loaded (startup {startup.state})")
     return {"status": "healthy", "model_loaded": True}
 
 
+@app.get("/livez")
+async def liveness():
+    """Alive unless startup failed; a hung event loop fails this probe by not answering"""
+    if startup.state == "failed":
+        raise HTTPException(status_code=503, detail=f"Startup failed: {startup.error}")
+    return {"status": "alive", "startup": startup.state}
+
+
+@app.get("/readyz")
+async def readiness():
+    """Ready once warmed up and while below the saturation thresholds"""
+    load = current_load()
+    return JSONResponse(load, status_code=200 if load["ready"] else 503)
+
+
+@app.get("/load")
+async def load_report():
+    """Active and queued sessions, recent real-time factor and the estimated wait of a new session"""
+    return current_load()
+
+
+def current_load() -> dict:
+    load = app.state.tts_service.scheduler.load()
+    if not startup.ready:
+        load["reasons"].insert(0, f"startup {startup.state}")
+    return {"ready": not load["reasons"], **load}
+
+
+@app.get("/startup")
+async def startup_status():
+    """Startup state and the duration of each phase"""
+    return startup.as_dict()
+
+
+@app.get("/session-stats")
+async def session_stats():
+    """Active/queued sessions, time-to-first-audio and real-time factor"""
+    return app.state.tts_service.scheduler.stats()
+
+
+@app.get("/voices")
+async def voices():
+    """Available voice presets and the preset cache"""
+    return {"default": default_voice, **app.state.tts_service.voices.stats()}
+
+
+@app.get("/cache-stats")
+async def cache_stats():
+    """Hit rate, size and saved model time of the phrase cache"""
+    return phrase_cache.stats()
+
+
 @app.websocket("/stream")
 async def websocket_stream(ws: WebSocket):
     await ws.accept()
     text = ws.query_params.get("text", "")
+    voice = ws.query_params.get("voice", default_voice)
+    # "incremental": the client sends {"text": "..."} messages and {"done": true} instead of ?text=
+    mode = ws.query_params.get("mode", "text")
+    # "binary": framed audio + visemes (see protocol.py), with codec "pcm16" or "opus"
+    protocol = ws.query_params.get("protocol", "json")
+    codec = ws.query_params.get("codec", "pcm16")
     
     service: StreamingTTSService = app.state.tts_service
-    iterator = service.stream(text)
-
-    service.state = {
-        "last_100ms": np.zeros(1600, dtype=np.int16), # 100ms at 16kHz
-        "global_time_offset": 0.0
-    }
+    if not startup.ready:
+        await ws.close(code=1013, reason="Model not loaded")
+        return
+    if voice not in service.voices.names():
+        await ws.close(code=1008, reason=f"Unknown voice: {voice}")
+        return
+    session = TTSSession(text=text, voice=voice)
+    if protocol == "binary":
+        output = FramedOutput(ws.send_bytes, ws.send_json, make_encoder(codec, opus_bit_rate))
+    else:
+        output = JSONOutput(ws.send_bytes, ws.send_json)
+    segmenter = TextSegmenter(max_chars=max_unit_chars) if mode == "incremental" else None
+    changed = asyncio.Event()
+    # Listens for the whole session, so a disconnect or "stop" ends generation at the next step
+    reader = asyncio.create_task(receive_messages(ws, session, segmenter, changed))
+    reader.add_done_callback(lambda task: reader_done(task, ws, session, changed))
     
     try:
-        while ws.client_state == WebSocketState.CONNECTED:
-            chunk = await asyncio.to_thread(next, iterator, None)
-            if chunk is None:
-                break
-            # chunk_visemes = service.get_visemes_with_context(chunk)
-            # pcm16_chunk = service.chunk_to_pcm16(chunk)
-            payload = service.chunk_to_pcm16(chunk)
-            await ws.send_bytes(payload)
-            combined_audio = np.concatenate([service.state["last_100ms"], chunk])
-            service.state["last_100ms"] = chunk[-1600:]
-            asyncio.create_task(process_and_send_visemes(ws, combined_audio, service))
-            # chunk_visemes = service.get_visemes_with_context(chunk)
-            # payload = json.dumps({
-            #     "audio": base64.b64encode(pcm16_chunk).decode('utf-8'),
-            #     "visemes": chunk_visemes
-            # })
-            # await ws.send_text(payload)
+        async with service.scheduler.session(session):
+            await output.start()
+            if segmenter is not None:
+                await stream_incremental(ws, service, session, output, segmenter, changed)
+            else:
+                await stream_unit(ws, service, session, output)
+            if connected(ws):
+                await output.finish()
+    except SessionLimitReached:
+        await ws.close(code=1013, reason="Too many sessions")
+    except WebSocketDisconnect:
+        session.stop("disconnect")
+    except GenerationFailed as e:
+        logger.error(f"Session {session.id}: generation failed: {e}")
+        if connected(ws):
+            await send_error(ws, f"Generation failed: {e}")
+            await ws.close(code=1011, reason="Generation failed")
     finally:
-        if ws.client_state == WebSocketState.CONNECTED:
+        # Nothing may be sent after the socket is gone
+        reader.cancel()
+        output.cancel()
+        session.stop()
+        session.worker.shutdown(wait=False)
+        if connected(ws):
             await ws.close()
 
-async def process_and_send_visemes(websocket, chunk, service):
+
+def connected(ws: WebSocket) -> bool:
+    """Neither side has closed the socket"""
+    return ws.client_state == WebSocketState.CONNECTED and ws.application_state == WebSocketState.CONNECTED
+
+
+def reader_done(task: asyncio.Task, ws: WebSocket, session: TTSSession, changed: asyncio.Event):
+    """A reader that failed would leave the session generating (or waiting for text) unattended"""
+    if task.cancelled() or task.exception() is None:
+        return
+    error = task.exception()
+    if isinstance(error, WebSocketDisconnect):
+        session.stop("disconnect")
+    else:
+        logger.warning(f"Session {session.id}: reading client messages failed: {error!r}")
+        session.stop("client")
+    changed.set()
+    if connected(ws):
+        if isinstance(error, (ValueError, TypeError, AttributeError, KeyError)):
+            asyncio.ensure_future(close_quietly(ws, 1007, "Invalid message"))
+        else:
+            asyncio.ensure_future(close_quietly(ws, 1011, "Internal error"))
+
+
+async def close_quietly(ws: WebSocket, code: int, reason: str):
+    try:
+        await ws.close(code=code, reason=reason)
+    except RuntimeError:
+        # The handler closed it first
+        pass
+
+
+async def send_error(ws: WebSocket, message: str):
+    if connected(ws):
+        await ws.send_json({"error": message})
+
+
+async def receive_messages(
+    ws: WebSocket, session: TTSSession, segmenter: Optional[TextSegmenter], changed: asyncio.Event
+):
+    """Client messages: {"text": ...}/{"done": true} in incremental mode, {"stop": true} in any mode"""
+    while True:
+        message = await ws.receive()
+        if message["type"] == "websocket.disconnect":
+            session.stop("disconnect")
+            changed.set()
+            return
+        try:
+            data = json.loads(message.get("text") or "{}")
+        except ValueError:
+            await send_error(ws, "Messages must be JSON")
+            continue
+        if not isinstance(data, dict):
+            await send_error(ws, "Messages must be JSON objects")
+            continue
+        if data.get("stop"):
+            session.stop("client")
+        elif segmenter is not None and not segmenter.closed:
+            delta = data.get("text", "")
+            if not isinstance(delta, str):
+                await send_error(ws, "\"text\" must be a string")
+                continue
+            if delta and not session.text:
+                # Time to first audio counts from the first text, not from the connection
+                session.created = time.monotonic()
+            session.text += delta
+            segmenter.push(delta)
+            if data.get("done"):
+                segmenter.close()
+        changed.set()
+
+
+async def stream_unit(
+    ws: WebSocket, service: StreamingTTSService, session: TTSSession, output, text: Optional[str] = None
+):
+    """Synthesize one piece of text, or replay it from the phrase cache, and send its audio and visemes"""
+    text = session.text if text is None else text
+    key = None
+    if phrase_cache_max_chars and len(text) <= phrase_cache_max_chars:
+        key = phrase_key(text, session.voice, session.cfg_scale, service.inference_steps)
+        phrase = await asyncio.to_thread(phrase_cache.get, key)
+        if phrase is not None:
+            await replay_phrase(ws, session, output, phrase)
+            return
+
+    recorder = PhraseRecorder() if key else None
+    viseme_tasks = []
+    completed = False
+    loop = asyncio.get_running_loop()
+    # Only generation takes a slot: a cached phrase above is replayed without one
+    async with service.scheduler.slot(session):
+        started = time.monotonic()
+        samples = 0
+        iterator = service.stream(session, text)
+        try:
+            while connected(ws) and not session.stop_event.is_set():
+                chunk = await loop.run_in_executor(session.worker, next, iterator, None)
+                if chunk is None:
+                    completed = True
+                    break
+                if session.stop_event.is_set():
+                    session.discarded_samples += chunk.size
+                    break
+                session.add_audio(chunk.size)
+                samples += chunk.size
+                pcm = service.chunk_to_pcm16(chunk)
+                index = recorder.add_chunk(pcm.tobytes()) if recorder else None
+                # Viseme context is per session, so concurrent streams don't mix.
+                # The recognizer and level computation run at 16 kHz, the model outputs 24 kHz.
+                combined_audio = advance_viseme_context(session, chunk)
+                visemes = asyncio.ensure_future(compute_visemes(combined_audio, service, recorder, index))
+                viseme_tasks.append(visemes)
+                await output.send(pcm, visemes)
+        except WebSocketDisconnect:
+            session.stop("disconnect")
+            raise
+        except GenerationFailed:
+            # Before the slot is released, so its time is not counted as a normal generation
+            session.stop("error")
+            raise
+        finally:
+            # Stops a generation that is still running, drains it and waits for its thread before the
+            # generation slot is released. Runs on the session's worker, after any next() still in flight.
+            await asyncio.shield(loop.run_in_executor(session.worker, iterator.close))
+
+    if completed:
+        service.scheduler.record_generation(time.monotonic() - started, samples)
+    if recorder and completed and not session.stop_event.is_set():
+        phrase = recorder.finish()
+        # Cached once every chunk's visemes are in (they are filled into the phrase as they complete)
+        await asyncio.gather(*viseme_tasks, return_exceptions=True)
+        await asyncio.to_thread(phrase_cache.put, key, phrase)
+
+
+def advance_viseme_context(session: TTSSession, chunk: np.ndarray) -> np.ndarray:
+    """Resample a chunk to 16 kHz and prepend the session's context; keeps the tail as the next context"""
+    speech = session.resampler.process(chunk)
+    combined_audio = np.concatenate([session.last_100ms, speech])
+    session.last_100ms = combined_audio[-session.last_100ms.size:]
+    return combined_audio
+
+
+async def replay_phrase(ws: WebSocket, session: TTSSession, output, phrase: Phrase):
+    """Send a cached phrase with the chunk sizes and pacing of its original stream"""
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    for at, pcm, visemes in phrase.chunks():
+        delay = start + at - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if not connected(ws) or session.stop_event.is_set():
+            return
+        session.add_audio(pcm.size)
+        ready = loop.create_future()
+        ready.set_result(visemes)
+        await output.send(np.asarray(pcm), ready)
+        # Keep the viseme context continuous for whatever is synthesized next in this session
+        advance_viseme_context(session, pcm.astype(np.float32) / 32767.0)
+
+
+async def stream_incremental(
+    ws: WebSocket,
+    service: StreamingTTSService,
+    session: TTSSession,
+    output,
+    segmenter: TextSegmenter,
+    changed: asyncio.Event,
+):
+    """Synthesize text as it arrives, one unit (sentences or a clause) at a time"""
+    while (
+        not segmenter.exhausted
+        and not session.stop_event.is_set()
+        and connected(ws)
+    ):
+        changed.clear()
+        unit = segmenter.pop(eager=session.audio_lead() < eager_lead_s)
+        if unit is None:
+            try:
+                await asyncio.wait_for(changed.wait(), 0.05)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        await ws.send_json({"unit": unit})
+        # stream_unit takes a slot per unit: a client still producing its text (e.g. an LLM) holds none
+        await stream_unit(ws, service, session, output, unit)
+
+
+async def compute_visemes(chunk, service, recorder=None, index=None):
     loop = asyncio.get_event_loop()
     # This runs your existing Allosaurus logic in the thread pool
     visemes = await loop.run_in_executor(executor, service.get_visemes_with_context, chunk)
-    # Send the visemes as soon as they are ready
-    await websocket.send_json({
-        "visemes": visemes
-    })
+    if recorder is not None:
+        recorder.set_visemes(index, visemes)
+    return visemes
 
 
 if __name__ == "__main__":
@@ -0,0 +1,239 @@
+"""
+Cache of synthesized phrases.
+
+Short phrases that are spoken over and over ("One moment please", greetings,
+error messages) are stored after their first synthesis: the PCM16 audio, the
+chunk boundaries and timing of the live stream, and the visemes computed for
+each chunk. Later requests for the same phrase are replayed from the cache
+without touching the model.
+
+Entries are keyed on the normalized text plus everything else that changes the
+audio (voice, cfg_scale, diffusion steps). They live in an in-memory LRU
+bounded by size and, optionally, in a directory on disk (raw PCM16 file plus
+JSON metadata per phrase) so they survive restarts. Disk hits are memory-mapped
+rather than read, and promoted to memory.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def phrase_key(text: str, voice: str, cfg_scale: float, inference_steps: int) -> str:
+    encoded = json.dumps(
+        {"text": normalize_text(text), "voice": voice, "cfg_scale": cfg_scale, "inference_steps": inference_steps},
+        sort_keys=True,
+    )
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+@dataclass
+class Phrase:
+    pcm: np.ndarray  # int16 samples, possibly memory-mapped
+    offsets: List[int]  # end sample of each chunk
+    times: List[float]  # when each chunk was sent, relative to the first one
+    visemes: List[list]  # viseme events of each chunk
+    generation_seconds: float  # time the model spent producing the phrase
+
+    @property
+    def nbytes(self) -> int:
+        return self.pcm.nbytes + 64 * len(self.offsets)
+
+    def metadata(self) -> dict:
+        return {
+            "offsets": self.offsets,
+            "times": self.times,
+            "visemes": self.visemes,
+            "generation_seconds": self.generation_seconds,
+        }
+
+    def chunks(self) -> Iterator[Tuple[float, np.ndarray, list]]:
+        """(send time, PCM16 samples, visemes) of each chunk"""
+        start = 0
+        for end, at, visemes in zip(self.offsets, self.times, self.visemes):
+            yield at, self.pcm[start:end], visemes
+            start = end
+
+
+@dataclass
+class PhraseRecorder:
+    """Collects a live stream so it can be cached once it completes"""
+
+    started: float = field(default_factory=time.monotonic)
+    first_chunk: Optional[float] = None
+    chunks: List[bytes] = field(default_factory=list)
+    times: List[float] = field(default_factory=list)
+    visemes: List[list] = field(default_factory=list)
+
+    def add_chunk(self, pcm16: bytes) -> int:
+        """Record a chunk as it is sent; returns its index for set_visemes"""
+        now = time.monotonic()
+        if self.first_chunk is None:
+            self.first_chunk = now
+        self.chunks.append(pcm16)
+        self.times.append(round(now - self.first_chunk, 4))
+        self.visemes.append([])
+        return len(self.chunks) - 1
+
+    def set_visemes(self, index: int, visemes: list):
+        self.visemes[index] = visemes
+
+    def finish(self) -> Phrase:
+        sizes = [len(chunk) // 2 for chunk in self.chunks]
+        return Phrase(
+            pcm=np.frombuffer(b"".join(self.chunks), dtype=np.int16),
+            offsets=np.cumsum(sizes).tolist(),
+            times=self.times,
+            visemes=self.visemes,
+            generation_seconds=time.monotonic() - self.started,
+        )
+
+
+class PhraseCache:
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, directory: Optional[str] = None, disk_max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.disk_max_bytes = disk_max_bytes
+        self._entries: "OrderedDict[str, Phrase]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            logger.info(f"Phrase cache persisted to {directory}")
+        # Stats
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    def get(self, key: str) -> Optional[Phrase]:
+        with self._lock:
+            phrase = self._entries.get(key)
+            if phrase is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                self.saved_seconds += phrase.generation_seconds
+                return phrase
+
+            if self.directory:
+                phrase = self._read(key)
+                if phrase is not None:
+                    self._store(key, phrase)
+                    self.disk_hits += 1
+                    self.saved_seconds += phrase.generation_seconds
+                    return phrase
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, phrase: Phrase):
+        with self._lock:
+            self._store(key, phrase)
+            if self.directory:
+                self._write(key, phrase)
+                self._prune_disk()
+
+    def _store(self, key: str, phrase: Phrase):
+        if phrase.nbytes > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old.nbytes
+        self._entries[key] = phrase
+        self._bytes += phrase.nbytes
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.nbytes
+
+    def _paths(self, key: str) -> Tuple[str, str]:
+        base = os.path.join(self.directory, key)
+        return base + ".pcm", base + ".json"
+
+    def _read(self, key: str) -> Optional[Phrase]:
+        pcm_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            pcm = np.memmap(pcm_path, dtype=np.int16, mode="r") if os.path.getsize(pcm_path) else np.zeros(0, np.int16)
+        except (FileNotFoundError, ValueError):
+            return None
+        os.utime(meta_path)
+        return Phrase(pcm=pcm, **meta)
+
+    def _write(self, key: str, phrase: Phrase):
+        pcm_path, meta_path = self._paths(key)
+        # The metadata file is written last: a phrase is on disk once it exists
+        with open(pcm_path + ".tmp", "wb") as f:
+            f.write(phrase.pcm.tobytes())
+        os.replace(pcm_path + ".tmp", pcm_path)
+        with open(meta_path + ".tmp", "w") as f:
+            json.dump(phrase.metadata(), f)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    def _disk_entries(self) -> List[Tuple[float, int, str]]:
+        """(last access, size, key) of every phrase on disk"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            key = name[:-len(".json")]
+            pcm_path, meta_path = self._paths(key)
+            try:
+                entries.append((
+                    os.path.getmtime(meta_path),
+                    os.path.getsize(meta_path) + os.path.getsize(pcm_path),
+                    key,
+                ))
+            except FileNotFoundError:
+                continue
+        return entries
+
+    def _prune_disk(self):
+        if not self.disk_max_bytes:
+            return
+        entries = sorted(self._disk_entries())
+        size = sum(entry[1] for entry in entries)
+        for _, entry_size, key in entries:
+            if size <= self.disk_max_bytes:
+                break
+            for path in self._paths(key):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            size -= entry_size
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        stats = {
+            "memory_entries": len(self._entries),
+            "memory_bytes": self._bytes,
+            "memory_max_bytes": self.max_bytes,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            # Model time the hits would have cost, measured when each phrase was first synthesized
+            "saved_gpu_seconds": round(self.saved_seconds, 2),
+            "disk_enabled": bool(self.directory),
+        }
+        if self.directory:
+            with self._lock:
+                entries = self._disk_entries()
+            stats.update({"disk_entries": len(entries), "disk_bytes": sum(entry[1] for entry in entries)})
+        return stats
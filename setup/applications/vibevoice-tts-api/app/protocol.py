@@ -0,0 +1,270 @@
+"""
+Output protocols for /stream.
+
+"json" (default) is the original protocol: every audio chunk is a binary
+message of raw PCM16, and its visemes follow later as a {"visemes": [...]}
+text message once recognition finishes.
+
+"binary" puts each chunk's audio and visemes into one binary frame, sent in
+order. After a {"format": {...}} text message describing the stream, every
+frame is (little-endian):
+
+    header   28 bytes   version u8, codec u8, flags u8, reserved u8,
+                        sequence u32, sample offset u64, sample count u32,
+                        audio length u32, viseme count u16, reserved u16
+    audio    audio length bytes
+    visemes  viseme count x 8 bytes: start ms u32 (from the start of the
+             stream), duration ms u16, level u8 (0-255), viseme id u8 (index
+             into the "visemes" list of the format message)
+
+Sample offset and count are in 24 kHz samples. With codec "pcm16" the audio
+is raw PCM16; with codec "opus" it is a sequence of 20 ms Opus packets, each
+prefixed with its length as u16 (pre-skip as in the format message's
+OpusHead). The last frame of a stream has the FINAL flag set.
+
+Frames wait for their chunk's visemes, which run on a thread pool while
+generation continues, so ordering costs one recognition (a few ms) of
+latency per chunk rather than a stall of the generator. At most
+MAX_QUEUED_CHUNKS chunks wait for their frame to be sent; beyond that send()
+waits too, so a slow client holds generation back instead of piling up audio.
+"""
+
+import asyncio
+import struct
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+import numpy as np
+
+from visemes import VISEMES
+
+try:
+    import av
+except ImportError:  # Opus output is unavailable without PyAV
+    av = None
+
+SAMPLE_RATE = 24_000
+VERSION = 1
+HEADER = struct.Struct("<BBBBIQIIHH")
+VISEME_ENTRY = np.dtype([("start_ms", "<u4"), ("duration_ms", "<u2"), ("level", "u1"), ("viseme", "u1")])
+CODECS = {"pcm16": 0, "opus": 1}
+FLAG_FINAL = 1
+OPUS_FRAME = 480  # 20 ms at 24 kHz
+MAX_QUEUED_CHUNKS = 8  # about a second of audio at the model's chunk size
+
+Send = Callable[[bytes], Awaitable[None]]
+
+
+class PCM16Encoder:
+    name = "pcm16"
+
+    def encode(self, pcm: np.ndarray) -> Tuple[bytes, int]:
+        return pcm.tobytes(), pcm.size
+
+    def flush(self) -> Tuple[bytes, int]:
+        return b"", 0
+
+    def info(self) -> dict:
+        return {}
+
+
+class OpusEncoder:
+    """Re-frames the stream into 20 ms Opus packets; leftover samples wait for the next chunk"""
+    name = "opus"
+
+    def __init__(self, bit_rate: int = 32_000):
+        self.codec = av.codec.CodecContext.create("libopus", "w")
+        self.codec.sample_rate = SAMPLE_RATE
+        self.codec.layout = "mono"
+        self.codec.format = "s16"
+        self.codec.bit_rate = bit_rate
+        self.codec.open()
+        self.pending = np.zeros(0, dtype=np.int16)
+        self.pts = 0
+
+    def encode(self, pcm: np.ndarray) -> Tuple[bytes, int]:
+        self.pending = np.concatenate([self.pending, pcm])
+        whole = self.pending.size - self.pending.size % OPUS_FRAME
+        packets = []
+        for start in range(0, whole, OPUS_FRAME):
+            frame = av.AudioFrame.from_ndarray(self.pending[None, start:start + OPUS_FRAME], format="s16", layout="mono")
+            frame.sample_rate = SAMPLE_RATE
+            frame.pts = self.pts
+            self.pts += OPUS_FRAME
+            packets += self.codec.encode(frame)
+        self.pending = self.pending[whole:]
+        return self._pack(packets)
+
+    def flush(self) -> Tuple[bytes, int]:
+        packets = []
+        if self.pending.size:
+            tail = np.zeros(OPUS_FRAME, dtype=np.int16)
+            tail[:self.pending.size] = self.pending
+            self.pending = self.pending[:0]
+            frame = av.AudioFrame.from_ndarray(tail[None, :], format="s16", layout="mono")
+            frame.sample_rate = SAMPLE_RATE
+            frame.pts = self.pts
+            self.pts += OPUS_FRAME
+            packets += self.codec.encode(frame)
+        packets += self.codec.encode(None)
+        return self._pack(packets)
+
+    def _pack(self, packets) -> Tuple[bytes, int]:
+        payload = b"".join(struct.pack("<H", packet.size) + bytes(packet) for packet in packets)
+        return payload, OPUS_FRAME * len(packets)
+
+    def info(self) -> dict:
+        return {"opus_head": bytes(self.codec.extradata).hex()}
+
+
+def make_encoder(codec: str, opus_bit_rate: int = 32_000):
+    """Encoder for the requested codec; falls back to PCM16 when Opus is unavailable"""
+    if codec == "opus" and av is not None:
+        return OpusEncoder(opus_bit_rate)
+    return PCM16Encoder()
+
+
+def pack_visemes(events: List[dict], chunk_start_s: float) -> np.ndarray:
+    """Viseme events of one chunk (times relative to the chunk) as a VISEME_ENTRY table"""
+    table = np.empty(len(events), dtype=VISEME_ENTRY)
+    for i, event in enumerate(events):
+        table[i] = (
+            round((chunk_start_s + event["t"]) * 1000),
+            min(round(event["d"] * 1000), 0xFFFF),
+            min(round(event["l"] * 255), 255),
+            VISEMES.index(event["v"]),
+        )
+    return table
+
+
+def unpack_frame(frame: bytes) -> Tuple[dict, bytes, np.ndarray]:
+    """Client-side parsing of a binary frame: (header, audio payload, viseme table)"""
+    version, codec, flags, _, sequence, offset, count, audio_len, viseme_count, _ = HEADER.unpack_from(frame)
+    audio_end = HEADER.size + audio_len
+    header = {
+        "version": version,
+        "codec": codec,
+        "final": bool(flags & FLAG_FINAL),
+        "sequence": sequence,
+        "sample_offset": offset,
+        "sample_count": count,
+    }
+    visemes = np.frombuffer(frame, dtype=VISEME_ENTRY, count=viseme_count, offset=audio_end)
+    return header, frame[HEADER.size:audio_end], visemes
+
+
+class JSONOutput:
+    """Original protocol: audio right away, visemes as separate text messages when ready"""
+
+    def __init__(self, send_bytes: Send, send_json: Callable[[dict], Awaitable[None]]):
+        self.send_bytes = send_bytes
+        self.send_json = send_json
+        self.pending = set()
+
+    async def start(self):
+        pass
+
+    async def send(self, pcm: np.ndarray, visemes: Awaitable[list]):
+        await self.send_bytes(pcm.tobytes())
+        task = asyncio.ensure_future(self._send_visemes(visemes))
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+
+    async def _send_visemes(self, visemes: Awaitable[list]):
+        await self.send_json({"visemes": await visemes})
+
+    async def finish(self):
+        await asyncio.gather(*self.pending, return_exceptions=True)
+
+    def cancel(self):
+        for task in self.pending:
+            task.cancel()
+
+
+class FramedOutput:
+    """Binary protocol: one frame per chunk with its visemes, sent strictly in order"""
+
+    def __init__(
+        self,
+        send_bytes: Send,
+        send_json: Callable[[dict], Awaitable[None]],
+        encoder,
+        max_queued: int = MAX_QUEUED_CHUNKS,
+    ):
+        self.send_bytes = send_bytes
+        self.send_json = send_json
+        self.encoder = encoder
+        self.codec = CODECS[encoder.name]
+        self.sequence = 0
+        self.sample_offset = 0  # of the next encoded audio
+        self.chunk_offset = 0  # of the next chunk received, for viseme times
+        self.queue: "asyncio.Queue[Optional[Tuple[np.ndarray, int, asyncio.Future]]]" = asyncio.Queue(max_queued)
+        self.sender: Optional[asyncio.Task] = None
+
+    async def start(self):
+        await self.send_json({"format": {
+            "protocol": "binary",
+            "version": VERSION,
+            "codec": self.encoder.name,
+            "sample_rate": SAMPLE_RATE,
+            "visemes": list(VISEMES),
+            **self.encoder.info(),
+        }})
+        self.sender = asyncio.create_task(self._send_frames())
+
+    async def send(self, pcm: np.ndarray, visemes: Awaitable[list]):
+        """Queue a chunk for its frame, waiting while the queue is full"""
+        visemes = asyncio.ensure_future(visemes)
+        try:
+            await self._put((pcm, self.chunk_offset, visemes))
+        except BaseException:
+            visemes.cancel()
+            raise
+        self.chunk_offset += pcm.size
+
+    async def _put(self, item):
+        """Queue an item; raises the sender's error instead of waiting forever when the sender has stopped"""
+        if not self.queue.full():
+            self.queue.put_nowait(item)
+            return
+        put = asyncio.ensure_future(self.queue.put(item))
+        try:
+            await asyncio.wait({put, self.sender}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            if not put.done():
+                put.cancel()
+        if not put.done() or put.cancelled():
+            self.sender.result()
+            raise ConnectionError("Frame sender stopped")
+
+    async def _send_frames(self):
+        while (item := await self.queue.get()) is not None:
+            pcm, chunk_offset, visemes = item
+            try:
+                events = await visemes
+            except Exception:
+                events = []
+            payload, count = self.encoder.encode(pcm)
+            await self.send_bytes(self._frame(payload, count, pack_visemes(events, chunk_offset / SAMPLE_RATE)))
+        payload, count = self.encoder.flush()
+        await self.send_bytes(self._frame(payload, count, np.zeros(0, dtype=VISEME_ENTRY), FLAG_FINAL))
+
+    def _frame(self, payload: bytes, count: int, visemes: np.ndarray, flags: int = 0) -> bytes:
+        header = HEADER.pack(
+            VERSION, self.codec, flags, 0, self.sequence, self.sample_offset, count, len(payload), visemes.size, 0
+        )
+        self.sequence += 1
+        self.sample_offset += count
+        return header + payload + visemes.tobytes()
+
+    async def finish(self):
+        """Send everything queued plus the final frame"""
+        await self._put(None)
+        await self.sender
+
+    def cancel(self):
+        if self.sender is not None:
+            self.sender.cancel()
+        while not self.queue.empty():
+            item = self.queue.get_nowait()
+            if item is not None:
+                item[2].cancel()
@@ -0,0 +1,76 @@
+"""
+Streaming polyphase resampler.
+
+The TTS model produces 24 kHz audio while the phoneme recognizer expects 16 kHz.
+Resampling each chunk on its own would reset the filter at every chunk edge
+(clicks, and a shifted time base), so the resampler carries the tail of the
+previous input between calls. The anti-aliasing filter is a Kaiser-windowed
+sinc evaluated in polyphase form: only the taps that hit real input samples are
+computed. The filter is centred, so output sample n lines up exactly with time
+n / target_rate; the price is holding back a few input samples of look-ahead
+until the next chunk (or flush()) arrives.
+"""
+
+from math import gcd
+
+import numpy as np
+
+
+class StreamingResampler:
+    def __init__(self, orig_rate: int = 24_000, target_rate: int = 16_000, taps_per_phase: int = 32,
+                 rolloff: float = 0.9, beta: float = 8.0):
+        divisor = gcd(orig_rate, target_rate)
+        self.up = target_rate // divisor
+        self.down = orig_rate // divisor
+        self.target_rate = target_rate
+
+        # Low-pass just below the lower of the two Nyquist frequencies, designed at the upsampled rate.
+        # Odd length so the centre tap is an exact sample, zero-padded to a whole number of phases.
+        length = taps_per_phase * self.up
+        odd = length - 1 if length % 2 == 0 else length
+        self.centre = (odd - 1) // 2
+        cutoff = rolloff / max(self.up, self.down)
+        t = np.arange(odd) - self.centre
+        taps = np.zeros(length)
+        taps[:odd] = self.up * cutoff * np.sinc(cutoff * t) * np.kaiser(odd, beta)
+        # phases[p][j] = taps[p + j * up]
+        self.phases = taps.reshape(taps_per_phase, self.up).T.astype(np.float32)
+        self.taps_per_phase = taps_per_phase
+
+        self.history = np.zeros(taps_per_phase - 1, dtype=np.float32)
+        self.consumed = 0  # input samples received so far
+        self.produced = 0  # output samples emitted so far
+
+    def process(self, chunk: np.ndarray) -> np.ndarray:
+        """Resample the next chunk of the stream"""
+        chunk = np.asarray(chunk, dtype=np.float32).reshape(-1)
+        buffer = np.concatenate([self.history, chunk])
+        buffer_start = self.consumed - self.history.size  # stream index of buffer[0]
+        self.consumed += chunk.size
+        self.history = buffer[-(self.taps_per_phase - 1):] if self.taps_per_phase > 1 else buffer[:0]
+        return self._emit(buffer, buffer_start, self.consumed)
+
+    def flush(self) -> np.ndarray:
+        """Emit the samples still held back for look-ahead, as if the stream were followed by silence"""
+        available = self.consumed
+        lookahead = self.centre // self.up + 1
+        buffer = np.concatenate([self.history, np.zeros(lookahead, dtype=np.float32)])
+        buffer_start = self.consumed - self.history.size
+        total = -(-available * self.up // self.down)  # ceil: every input sample's time span is covered
+        return self._emit(buffer, buffer_start, available + lookahead, limit=total)
+
+    def _emit(self, buffer: np.ndarray, buffer_start: int, available: int, limit: int = None) -> np.ndarray:
+        # Output n needs input up to index (n * down + centre) // up
+        end = max((available * self.up - 1 - self.centre) // self.down + 1, 0)
+        if limit is not None:
+            end = min(end, limit)
+        if end <= self.produced:
+            return np.zeros(0, dtype=np.float32)
+        n = np.arange(self.produced, end)
+        position = n * self.down + self.centre
+        newest = position // self.up - buffer_start
+        phase = position % self.up
+        window = buffer[newest[:, None] - np.arange(self.taps_per_phase)[None, :]]
+        output = np.einsum("ij,ij->i", window, self.phases[phase])
+        self.produced = end
+        return output.astype(np.float32, copy=False)
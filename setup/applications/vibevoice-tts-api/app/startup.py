@@ -0,0 +1,60 @@
+"""
+Timed startup phases.
+
+The service starts loading in the background so /health and /startup answer
+from the first second. Phases that do not depend on each other (model and
+processor, voice presets, the Allosaurus recognizer) load in parallel threads;
+a warmup synthesis then runs before the service reports ready, so the first
+client does not pay for CUDA kernel selection and allocator growth.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTracker:
+    def __init__(self):
+        self.state = "starting"  # then "warming", "ready" or "failed"
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+        self.error: Optional[str] = None
+        self.phases: Dict[str, dict] = {}
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    async def run(self, name: str, fn: Callable, *args) -> Any:
+        """Run a blocking phase in a thread, recording its duration"""
+        self.phases[name] = {"state": "running", "seconds": None}
+        started = time.monotonic()
+        try:
+            result = await asyncio.to_thread(fn, *args)
+        except Exception:
+            self.phases[name] = {"state": "failed", "seconds": round(time.monotonic() - started, 3)}
+            raise
+        seconds = time.monotonic() - started
+        self.phases[name] = {"state": "done", "seconds": round(seconds, 3)}
+        logger.info(f"Startup phase {name} took {seconds:.2f}s")
+        return result
+
+    def mark(self, state: str, error: Optional[Exception] = None):
+        self.state = state
+        if error is not None:
+            self.error = str(error)
+            logger.error(f"Startup failed: {error}")
+        if state in ("ready", "failed"):
+            self.finished = time.monotonic()
+            logger.info(f"Startup {state} after {self.finished - self.started:.2f}s")
+
+    def as_dict(self) -> dict:
+        return {
+            "state": self.state,
+            "error": self.error,
+            "elapsed_seconds": round((self.finished or time.monotonic()) - self.started, 3),
+            "phases": self.phases,
+        }
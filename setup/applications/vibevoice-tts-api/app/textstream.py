@@ -0,0 +1,80 @@
+"""
+Incremental text input for /stream.
+
+When the text comes from an LLM token by token, waiting for the whole reply
+delays the first sample by the full generation time of the LLM. Instead the
+client pushes text increments and TextSegmenter cuts the buffered text into
+units that can be synthesized on their own:
+
+- Normally a unit is every complete sentence buffered so far. While one unit
+  is being synthesized, text keeps arriving; whatever sentences completed in
+  the meantime are merged into the next unit, so the model sees the longest
+  span it can and intonation across sentences stays natural.
+- When the listener is about to run out of audio (`eager`), a unit may end at
+  a clause boundary instead (comma, semicolon, colon, dash), keeping its
+  punctuation so the clause is spoken with continuing rather than final
+  intonation.
+- Text without any boundary is cut at a word boundary once it reaches
+  `max_chars`.
+"""
+
+import re
+from typing import Optional
+
+SENTENCE_END = re.compile(r"[.!?…]+[\"')\]]*(?=\s)|\n")
+CLAUSE_END = re.compile(r"[,;:—–]+(?=\s)")
+# Periods after these are not sentence ends
+ABBREVIATIONS = {"mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "vs", "etc", "e.g", "i.e", "no", "fig"}
+
+
+class TextSegmenter:
+    def __init__(self, min_clause_chars: int = 20, max_chars: int = 300):
+        self.min_clause_chars = min_clause_chars
+        self.max_chars = max_chars
+        self.buffer = ""
+        self.closed = False
+
+    def push(self, text: str):
+        self.buffer += text
+
+    def close(self):
+        """No more text will arrive; the remainder becomes the last unit"""
+        self.closed = True
+
+    @property
+    def exhausted(self) -> bool:
+        return self.closed and not self.buffer.strip()
+
+    def pop(self, eager: bool = False) -> Optional[str]:
+        """The next unit to synthesize, or None if more text is needed first"""
+        end = self._last_boundary(SENTENCE_END, limit=self.max_chars) or self._last_boundary(SENTENCE_END)
+        if end is None and eager:
+            end = self._last_boundary(CLAUSE_END, min_chars=self.min_clause_chars)
+        if end is None and len(self.buffer) >= self.max_chars:
+            end = self.buffer.rfind(" ", 0, self.max_chars)
+            if end <= 0:
+                end = self.max_chars
+        if end is None and self.closed:
+            end = len(self.buffer)
+        if end is None:
+            return None
+        unit, self.buffer = self.buffer[:end].strip(), self.buffer[end:]
+        if not unit:
+            return self.pop(eager) if self.buffer.strip() else None
+        return unit
+
+    def _last_boundary(self, pattern: re.Pattern, min_chars: int = 1, limit: Optional[int] = None) -> Optional[int]:
+        end = None
+        for match in pattern.finditer(self.buffer):
+            if limit is not None and match.end() > limit:
+                break
+            if match.end() < min_chars or self._is_abbreviation(match.start()):
+                continue
+            end = match.end()
+        return end
+
+    def _is_abbreviation(self, position: int) -> bool:
+        if self.buffer[position] != ".":
+            return False
+        word = self.buffer[:position].rsplit(None, 1)[-1].lower() if self.buffer[:position].strip() else ""
+        return word in ABBREVIATIONS or (len(word) == 1 and word.isalpha())
@@ -0,0 +1,128 @@
+"""
+In-process phoneme recognition for viseme extraction.
+
+Allosaurus' Recognizer.recognize only accepts a WAV path and returns one text
+line per phoneme, so every chunk used to be written to /dev/shm, read back and
+parsed with split(). PhonemeRecognizer runs the same three stages (feature
+extraction, acoustic model, greedy CTC decoding) directly on a numpy waveform
+and returns a structured array of (start, duration, phoneme id). The unit mask
+and the phoneme -> viseme table are built once instead of on every call, and
+decoding and per-phoneme RMS levels are vectorized with numpy.
+"""
+
+from typing import List
+
+import numpy as np
+import torch
+from allosaurus.am.utils import move_to_tensor
+from allosaurus.audio import Audio
+
+RECOGNIZER_RATE = 16_000
+CONTEXT_S = 0.100  # audio from the previous chunk prepended for recognizer context
+
+# Comprehensive map for Allosaurus English symbols
+IPA_MAP = {
+    # aa (Open Mouth)
+    'a': 'aa', 'ɑ': 'aa', 'æ': 'aa', 'ʌ': 'aa', 'ə': 'aa',
+    'ŋ': 'aa', 'k': 'aa', 'ɡ': 'aa', 'ɹ': 'aa', 'ɻ': 'aa', 'ɻ̩': 'aa',
+
+    # ih (Teeth/Smile)
+    'i': 'ih', 'ɪ': 'ih', 'j': 'ih', 'θ': 'ih', 'ð': 'ih',
+    's': 'ih', 'z': 'ih', 't': 'ih', 'd': 'ih', 'n': 'ih', 'l': 'ih',
+
+    # ou (Pursed Lips)
+    'u': 'ou', 'ʊ': 'ou', 'w': 'ou', 'p': 'ou', 'b': 'ou', 'm': 'ou',
+
+    # ee (Mid-Open Smile)
+    'e': 'ee', 'ɛ': 'ee',
+
+    # oh (Rounded Open)
+    'o': 'oh', 'ɔ': 'oh'
+}
+
+VISEMES = ('aa', 'ih', 'ou', 'ee', 'oh')
+
+PHONEME_DTYPE = np.dtype([("start", np.float32), ("duration", np.float32), ("phoneme", np.int16)])
+
+
+def viseme_for(phoneme: str) -> str:
+    return IPA_MAP.get(phoneme, IPA_MAP.get(phoneme[:1], 'aa'))
+
+
+class PhonemeRecognizer:
+    def __init__(self, recognizer, lang_id: str = 'ipa'):
+        self.pm = recognizer.pm
+        self.am = recognizer.am
+        self.device_id = recognizer.config.device_id
+        self.mask = recognizer.lm.inventory.get_mask(lang_id, approximation=recognizer.config.approximate)
+        # Set on the inference config by allosaurus' read_lm
+        self.window_shift = recognizer.config.window_shift
+        self.window_size = recognizer.config.window_size
+
+        # Acoustic model output index -> phoneme string / viseme id
+        size = len(self.mask.domain_unit)
+        self.phonemes = [
+            self.mask.target_unit.get_unit(self.mask.unit_map[i]) if i in self.mask.unit_map else ''
+            for i in range(size)
+        ]
+        self.viseme_ids = np.array([VISEMES.index(viseme_for(p)) for p in self.phonemes], dtype=np.uint8)
+
+    def recognize(self, audio: np.ndarray) -> np.ndarray:
+        """Phonemes in a float32 waveform at RECOGNIZER_RATE, as a PHONEME_DTYPE array (blocking)"""
+        pcm16 = (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16)
+        feat = self.pm.compute(Audio(pcm16, RECOGNIZER_RATE))
+        feats, feat_len = move_to_tensor(
+            [np.expand_dims(feat, 0), np.array([feat.shape[0]], dtype=np.int32)], self.device_id
+        )
+        with torch.inference_mode():
+            logits = self.am(feats, feat_len)[0].cpu().numpy()
+        logits = self.mask.mask_logits(logits)
+
+        # Greedy CTC: a frame emits when its best unit is not blank and differs from the last emitted one
+        best = logits.argmax(axis=1)
+        voiced = np.flatnonzero(best)
+        units = best[voiced]
+        emitted = np.ones(units.size, dtype=bool)
+        emitted[1:] = units[1:] != units[:-1]
+        frames = voiced[emitted]
+
+        phonemes = np.empty(frames.size, dtype=PHONEME_DTYPE)
+        phonemes["start"] = frames * self.window_shift
+        phonemes["duration"] = self.window_size
+        phonemes["phoneme"] = best[frames]
+        return phonemes
+
+    def visemes(self, phonemes: np.ndarray) -> List[str]:
+        return [VISEMES[v] for v in self.viseme_ids[phonemes["phoneme"]].tolist()]
+
+
+def rms_levels(audio: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """RMS of audio[start:end] for many ranges at once, via a cumulative sum of squares"""
+    energy = np.zeros(audio.size + 1, dtype=np.float32)
+    np.cumsum(np.square(audio, dtype=np.float32), out=energy[1:])
+    starts = np.clip(starts, 0, audio.size)
+    ends = np.clip(ends, starts, audio.size)
+    lengths = ends - starts
+    levels = np.zeros(starts.size, dtype=np.float32)
+    nonempty = lengths > 0
+    levels[nonempty] = np.sqrt((energy[ends[nonempty]] - energy[starts[nonempty]]) / lengths[nonempty])
+    return np.clip(levels, 0.0, 1.0)
+
+
+def to_viseme_events(recognizer: PhonemeRecognizer, phonemes: np.ndarray, audio: np.ndarray,
+                     skip_s: float = 0.0) -> List[dict]:
+    """JSON viseme events for phonemes starting after `skip_s`, timed relative to it"""
+    phonemes = phonemes[phonemes["start"] >= skip_s - 1e-6]
+    starts = phonemes["start"].astype(np.float64)
+    durations = phonemes["duration"].astype(np.float64)
+    levels = rms_levels(
+        audio,
+        (starts * RECOGNIZER_RATE).astype(np.int64),
+        ((starts + durations) * RECOGNIZER_RATE).astype(np.int64),
+    )
+    return [
+        {"t": round(t, 3), "d": round(d, 3), "l": l, "v": v}
+        for t, d, l, v in zip(
+            (starts - skip_s).tolist(), durations.tolist(), levels.tolist(), recognizer.visemes(phonemes)
+        )
+    ]
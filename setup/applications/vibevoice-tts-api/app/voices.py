@@ -0,0 +1,219 @@
+"""
+Voice preset cache.
+
+A voice preset is the model's prefilled output for the voice prompt (hidden
+states and KV caches for the LM and TTS LM, positive and negative), saved as a
+.pt file. Presets are loaded on first use and kept in an LRU cache bounded by
+the total size of their tensors.
+
+generate() extends the KV caches it is given, so each request used to get a
+copy.deepcopy of the whole preset. The KV caches only ever grow by
+concatenation into new tensors, so a request only needs its own containers
+(dicts, lists, cache objects); the tensors themselves can be shared
+(copy-on-write). Sharing is only switched on once it has been seen to be
+safe: requests get cloned tensors until a warmup generation on shared ones
+(`fork(trial=True)`, then `verify_sharing()`) leaves their version counters
+unchanged. The counters are still checked after every generation; if anything
+was written in place, the preset is dropped from the cache and the cache goes
+back to cloning tensors for good.
+"""
+
+import copy
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+PRESET_SUFFIX = ".pt"
+_ATOMIC = (str, bytes, int, float, bool, type(None), torch.dtype, torch.device)
+
+
+class UnknownVoice(Exception):
+    """Raised for a voice name that has no preset file"""
+
+
+def _fork(obj: Any, clone: bool) -> Any:
+    """Copy the containers of a preset; tensors are cloned or shared"""
+    if torch.is_tensor(obj):
+        return obj.clone() if clone else obj
+    if isinstance(obj, _ATOMIC):
+        return obj
+    if isinstance(obj, dict):  # also transformers' ModelOutput
+        forked = copy.copy(obj)
+        for key, value in obj.items():
+            forked[key] = _fork(value, clone)
+        return forked
+    if isinstance(obj, list):
+        return [_fork(value, clone) for value in obj]
+    if isinstance(obj, tuple):
+        values = (_fork(value, clone) for value in obj)
+        return type(obj)(*values) if hasattr(obj, "_fields") else type(obj)(values)
+    if hasattr(obj, "__dict__"):  # cache objects such as DynamicCache
+        forked = copy.copy(obj)
+        forked.__dict__.update({key: _fork(value, clone) for key, value in vars(obj).items()})
+        return forked
+    return copy.deepcopy(obj)
+
+
+def _tensors(obj: Any) -> List[torch.Tensor]:
+    found: Dict[int, torch.Tensor] = {}
+
+    def walk(value):
+        if torch.is_tensor(value):
+            found[id(value)] = value
+        elif isinstance(value, dict):
+            for item in value.values():
+                walk(item)
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                walk(item)
+        elif hasattr(value, "__dict__") and not isinstance(value, _ATOMIC):
+            for item in vars(value).values():
+                walk(item)
+
+    walk(obj)
+    return list(found.values())
+
+
+class VoicePreset:
+    def __init__(self, name: str, prompt: Any):
+        self.name = name
+        self.prompt = prompt
+        self.tensors = _tensors(prompt)
+        self.nbytes = sum(t.numel() * t.element_size() for t in self.tensors)
+        self._versions = [t._version for t in self.tensors]
+
+    def fork(self, clone: bool = False) -> Any:
+        """A per-request copy of the prompt to hand to generate()"""
+        return _fork(self.prompt, clone)
+
+    def modified(self) -> bool:
+        """Whether any of the preset's tensors was written in place since loading"""
+        return any(t._version != v for t, v in zip(self.tensors, self._versions))
+
+
+class VoiceCache:
+    def __init__(self, directory: str, device: torch.device, budget_bytes: int, clone_tensors: bool = False):
+        self.directory = directory
+        self.device = device
+        self.budget_bytes = budget_bytes
+        # Whether tensors may be shared at all, and whether they are cloned for now (until verify_sharing())
+        self.share_tensors = not clone_tensors
+        self.clone_tensors = True
+        self._presets: "OrderedDict[str, VoicePreset]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading: Dict[str, threading.Lock] = {}
+        # Stats
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_seconds = 0.0
+
+    def names(self) -> List[str]:
+        try:
+            files = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(f[:-len(PRESET_SUFFIX)] for f in files if f.endswith(PRESET_SUFFIX))
+
+    def get(self, name: str) -> VoicePreset:
+        """The preset for `name`, loading it on first use (blocking)"""
+        with self._lock:
+            preset = self._presets.get(name)
+            if preset is not None:
+                self._presets.move_to_end(name)
+                self.hits += 1
+                return preset
+            loading = self._loading.setdefault(name, threading.Lock())
+        # One load per voice; concurrent requests for it wait for that load
+        with loading:
+            try:
+                with self._lock:
+                    preset = self._presets.get(name)
+                    if preset is not None:
+                        self._presets.move_to_end(name)
+                        self.hits += 1
+                        return preset
+                preset = self._load(name)
+                with self._lock:
+                    self.misses += 1
+                    self._presets[name] = preset
+                    self._evict(keep=name)
+            finally:
+                # Also when the load failed (unknown voice, I/O error): the next request tries afresh
+                with self._lock:
+                    if self._loading.get(name) is loading:
+                        del self._loading[name]
+        return preset
+
+    def fork(self, preset: VoicePreset, trial: bool = False) -> Any:
+        """A per-request copy of a preset; `trial` shares its tensors before sharing is verified"""
+        return preset.fork(clone=self.clone_tensors and not (trial and self.share_tensors))
+
+    def check(self, preset: VoicePreset):
+        """Call after generate(): drop a preset that was modified in place and stop sharing tensors"""
+        if not preset.modified():
+            return
+        if self.share_tensors:
+            logger.warning(f"Voice preset {preset.name} was modified in place during generation; cloning tensors from now on")
+        self.share_tensors = False
+        self.clone_tensors = True
+        with self._lock:
+            if self._presets.get(preset.name) is preset:
+                del self._presets[preset.name]
+
+    def verify_sharing(self, preset: VoicePreset) -> bool:
+        """Call after a generation on a trial fork: share tensors from now on if it left the preset unchanged"""
+        self.check(preset)
+        if self.share_tensors and self.clone_tensors:
+            self.clone_tensors = False
+            logger.info(f"Voice preset {preset.name} was left unchanged by a generation; sharing tensors between requests")
+        return not self.clone_tensors
+
+    def _load(self, name: str) -> VoicePreset:
+        if name not in self.names():
+            raise UnknownVoice(name)
+        started = time.perf_counter()
+        prompt = torch.load(
+            os.path.join(self.directory, name + PRESET_SUFFIX), map_location=self.device, weights_only=False
+        )
+        preset = VoicePreset(name, prompt)
+        elapsed = time.perf_counter() - started
+        self.load_seconds += elapsed
+        logger.info(f"Loaded voice {name} ({preset.nbytes / 2**20:.1f} MiB) in {elapsed:.2f}s")
+        return preset
+
+    def _evict(self, keep: str):
+        # Sessions still using an evicted preset keep their reference until they finish
+        while len(self._presets) > 1 and self.size_bytes() > self.budget_bytes:
+            name = next(iter(self._presets))
+            if name == keep:
+                self._presets.move_to_end(name)
+                continue
+            del self._presets[name]
+            self.evictions += 1
+            logger.info(f"Evicted voice {name}")
+
+    def size_bytes(self) -> int:
+        return sum(preset.nbytes for preset in self._presets.values())
+
+    def stats(self) -> dict:
+        with self._lock:
+            cached = {name: round(preset.nbytes / 2**20, 1) for name, preset in self._presets.items()}
+        return {
+            "available": self.names(),
+            "cached_mib": cached,
+            "budget_mib": round(self.budget_bytes / 2**20, 1),
+            "clone_tensors": self.clone_tensors,
+            "share_tensors": self.share_tensors,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "load_seconds": round(self.load_seconds, 2),
+        }
@@ -0,0 +1,172 @@
+"""
+Fixtures for the TTS app tests.
+
+The app is imported unchanged, with only the models swapped for stand-ins:
+StubModel emits one frame of audio per generation step and StubRecognizer
+reports a phoneme wherever the 16 kHz audio crosses a threshold, so /stream
+runs on CPU without model weights. Where the VibeVoice package itself is
+not installed, just the names main.py imports from it are provided.
+"""
+
+import os
+import queue
+import sys
+import time
+import types
+
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+sys.path.insert(0, os.path.normpath(APP_DIR))
+
+FRAME_SAMPLES = 2400  # 100 ms at 24 kHz
+
+
+class _AudioStreamer:
+    """The queue-per-sample behaviour of vibevoice.modular.streamer.AudioStreamer"""
+
+    def __init__(self, batch_size: int, stop_signal=None, timeout=None):
+        self.queues = [queue.Queue() for _ in range(batch_size)]
+        self.stop_signal = stop_signal
+        self.timeout = timeout
+
+    def put(self, audio_chunks, sample_indices):
+        for i, index in enumerate(sample_indices.tolist()):
+            self.queues[index].put(audio_chunks[i].detach().cpu())
+
+    def end(self, sample_indices=None):
+        for q in self.queues:
+            q.put(self.stop_signal)
+
+    def get_stream(self, index: int):
+        while (chunk := self.queues[index].get(timeout=self.timeout)) is not self.stop_signal:
+            yield chunk
+
+
+def _provide_vibevoice():
+    try:
+        import vibevoice.modular.streamer  # noqa: F401
+        return
+    except ImportError:
+        pass
+    names = {
+        "vibevoice.modular.modeling_vibevoice_streaming_inference": {
+            "VibeVoiceStreamingForConditionalGenerationInference": type(
+                "VibeVoiceStreamingForConditionalGenerationInference", (), {}
+            ),
+        },
+        "vibevoice.processor.vibevoice_streaming_processor": {
+            "VibeVoiceStreamingProcessor": type("VibeVoiceStreamingProcessor", (), {}),
+        },
+        "vibevoice.modular.streamer": {"AudioStreamer": _AudioStreamer},
+    }
+    for package in ("vibevoice", "vibevoice.modular", "vibevoice.processor"):
+        sys.modules.setdefault(package, types.ModuleType(package))
+    for name, attributes in names.items():
+        module = types.ModuleType(name)
+        module.__dict__.update(attributes)
+        sys.modules[name] = module
+
+
+class StubProcessor:
+    tokenizer = None
+
+    def process_input_with_cached_prompt(self, text: str, cached_prompt=None, **kwargs) -> dict:
+        return {"text": text}
+
+
+class StubModel:
+    """generate() puts a frame per step until stopped, after `frames` steps, or raising after `fail_after`"""
+
+    def __init__(self, step_s: float = 0.01, frames: int = None, fail_after: int = None):
+        self.step_s = step_s
+        self.frames = frames
+        self.fail_after = fail_after
+
+    def generate(self, text: str = "", audio_streamer=None, stop_check_fn=None, **kwargs):
+        step = 0
+        while self.frames is None or step < self.frames:
+            if stop_check_fn():
+                return
+            if self.fail_after is not None and step >= self.fail_after:
+                raise RuntimeError("CUDA out of memory")
+            time.sleep(self.step_s)
+            frame = torch.full((FRAME_SAMPLES,), 0.1 if step % 2 else -0.1)
+            audio_streamer.put(frame[None], torch.tensor([0]))
+            step += 1
+
+
+class StubRecognizer:
+    """A phoneme at every upward crossing of `threshold`, so event times follow the audio exactly"""
+
+    def __init__(self, threshold: float = 0.25):
+        from visemes import PHONEME_DTYPE, RECOGNIZER_RATE, VISEMES
+
+        self.threshold = threshold
+        self.dtype = PHONEME_DTYPE
+        self.rate = RECOGNIZER_RATE
+        self.names = VISEMES
+
+    def recognize(self, audio: np.ndarray) -> np.ndarray:
+        above = np.abs(audio) > self.threshold
+        onsets = np.flatnonzero(above[1:] & ~above[:-1]) + 1
+        phonemes = np.zeros(onsets.size, dtype=self.dtype)
+        phonemes["start"] = onsets / self.rate
+        phonemes["duration"] = 0.02
+        return phonemes
+
+    def visemes(self, phonemes: np.ndarray):
+        return [self.names[p] for p in phonemes["phoneme"].tolist()]
+
+
+@pytest.fixture(scope="session")
+def tts_main(tmp_path_factory):
+    """main.py imported with stub models, CPU voice presets and no phrase cache or warmup"""
+    voices = tmp_path_factory.mktemp("voices")
+    torch.save({"prompt": torch.zeros(4, 8)}, voices / "en-Test_voice.pt")
+    os.environ.update({
+        "VOICE_PATH": str(voices),
+        "VOICE_FILE": "en-Test_voice.pt",
+        "TTS_MAX_SESSIONS": "2",
+        "TTS_MAX_QUEUED_SESSIONS": "8",
+        "PHRASE_CACHE_MAX_CHARS": "0",
+        "TTS_WARMUP_RUNS": "0",
+    })
+    _provide_vibevoice()
+    import main
+
+    original_init = main.StreamingTTSService.__init__
+
+    def __init__(self, *args, **kwargs):
+        original_init(self, *args, **kwargs)
+        self.device = torch.device("cpu")
+        self.voices.device = self.device
+
+    def load_model(self):
+        self.processor = StubProcessor()
+        self.model = StubModel()
+
+    def load_recognizer(self):
+        self.phoneme_recognizer = StubRecognizer()
+
+    main.StreamingTTSService.__init__ = __init__
+    main.StreamingTTSService.load_model = load_model
+    main.StreamingTTSService.load_recognizer = load_recognizer
+    return main
+
+
+@pytest.fixture
+def client(tts_main, monkeypatch):
+    """A test client of the app once it reports ready; the service is new for every test"""
+    from fastapi.testclient import TestClient
+
+    monkeypatch.setattr(tts_main, "startup", tts_main.StartupTracker())
+    with TestClient(tts_main.app) as client:
+        deadline = time.monotonic() + 10
+        while not tts_main.startup.ready:
+            assert time.monotonic() < deadline, tts_main.startup.as_dict()
+            time.sleep(0.01)
+        yield client
@@ -0,0 +1,76 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from conftest import FRAME_SAMPLES, StubModel
+from protocol import FramedOutput, PCM16Encoder, unpack_frame
+
+
+async def ready(value):
+    return value
+
+
+def test_slow_client_holds_back_send():
+    async def run():
+        sent = []
+        release = asyncio.Event()
+
+        async def send_bytes(frame):
+            await release.wait()
+            sent.append(frame)
+
+        async def send_json(message):
+            pass
+
+        output = FramedOutput(send_bytes, send_json, PCM16Encoder(), max_queued=2)
+        await output.start()
+        pcm = np.zeros(100, dtype=np.int16)
+        # One frame is being sent and two are queued; the fourth chunk has to wait
+        for _ in range(3):
+            await output.send(pcm, ready([]))
+            await asyncio.sleep(0)
+        blocked = asyncio.ensure_future(output.send(pcm, ready([])))
+        await asyncio.sleep(0.05)
+        assert not blocked.done()
+        assert output.queue.qsize() == 2
+
+        release.set()
+        await blocked
+        await output.finish()
+        headers = [unpack_frame(frame)[0] for frame in sent]
+        assert [h["sequence"] for h in headers] == list(range(5))
+        assert headers[-1]["final"]
+
+    asyncio.run(run())
+
+
+def test_failed_sender_does_not_leave_send_waiting():
+    async def run():
+        async def send_bytes(frame):
+            await asyncio.sleep(0.01)
+            raise ConnectionResetError("client gone")
+
+        async def send_json(message):
+            pass
+
+        output = FramedOutput(send_bytes, send_json, PCM16Encoder(), max_queued=1)
+        await output.start()
+        with pytest.raises(ConnectionResetError):
+            for _ in range(10):
+                await asyncio.wait_for(output.send(np.zeros(100, dtype=np.int16), ready([])), 1)
+        output.cancel()
+
+    asyncio.run(run())
+
+
+def test_binary_stream_ends_with_the_final_frame(client, tts_main, monkeypatch):
+    monkeypatch.setattr(tts_main, "FramedOutput", lambda *args: FramedOutput(*args, max_queued=1))
+    tts_main.app.state.tts_service.model = StubModel(frames=12)
+    with client.websocket_connect("/stream?text=Hello&protocol=binary") as ws:
+        assert ws.receive_json()["format"]["protocol"] == "binary"
+        headers = []
+        while not (headers and headers[-1]["final"]):
+            headers.append(unpack_frame(ws.receive_bytes())[0])
+    assert [h["sequence"] for h in headers] == list(range(len(headers)))
+    assert sum(h["sample_count"] for h in headers) == 12 * FRAME_SAMPLES
@@ -0,0 +1,167 @@
+import threading
+import time
+
+import pytest
+
+from conftest import StubModel
+
+SESSIONS = 6
+
+
+def scheduler(tts_main):
+    return tts_main.app.state.tts_service.scheduler
+
+
+def wait_until(condition, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def receive_until_closed(ws):
+    """Messages up to the server's close, and its close code"""
+    messages = []
+    while (message := ws.receive())["type"] != "websocket.close":
+        messages.append(message)
+    return messages, message["code"]
+
+
+def test_abrupt_disconnects_release_slots(client, tts_main):
+    """More sessions than slots, each dropped mid-stream: every slot comes back and the stop is timed"""
+    received = []
+    errors = []
+
+    def listen():
+        try:
+            with client.websocket_connect("/stream?text=An+endless+text") as ws:
+                audio = 0
+                while audio < 3:
+                    audio += ws.receive().get("bytes") is not None
+                received.append(audio)
+            # Leaving the block disconnects without a stop message, like a dropped connection
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=listen) for _ in range(SESSIONS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+        assert not thread.is_alive()
+    assert not errors
+    assert len(received) == SESSIONS
+
+    stats = scheduler(tts_main)
+    wait_until(lambda: stats.served == SESSIONS)
+    assert stats.active == 0
+    assert stats.waiting == 0
+    assert stats.cancelled["disconnect"] == SESSIONS
+    assert len(stats.stop_latency) == SESSIONS
+    assert max(stats.stop_latency) < 1.0
+    assert stats.stats()["stop_latency_ms"] is not None
+    # The model never finished a unit, so none may count as a completed generation
+    assert len(stats.recent_generations) == 0
+    # A new session gets a slot right away
+    with client.websocket_connect("/stream?text=Again") as ws:
+        while ws.receive().get("bytes") is None:
+            pass
+
+
+@pytest.mark.parametrize("message", ["[1]", "not json", '{"text": 5}'])
+def test_invalid_message_gets_an_error(client, tts_main, message):
+    tts_main.app.state.tts_service.model = StubModel(frames=3)
+    with client.websocket_connect("/stream?mode=incremental") as ws:
+        ws.send_text(message)
+        assert "error" in ws.receive_json()
+        ws.send_json({"text": "Still here.", "done": True})
+        assert ws.receive_json() == {"unit": "Still here."}
+        assert ws.receive().get("bytes")
+    wait_until(lambda: scheduler(tts_main).active == 0)
+
+
+def test_failed_reader_stops_the_session(client, tts_main, monkeypatch):
+    def push(self, text):
+        raise TypeError("unexpected message")
+
+    monkeypatch.setattr(tts_main.TextSegmenter, "push", push)
+    with client.websocket_connect("/stream?mode=incremental") as ws:
+        ws.send_json({"text": "Hello."})
+        _, code = receive_until_closed(ws)
+    assert code == 1007
+    stats = scheduler(tts_main)
+    wait_until(lambda: stats.served == 1)
+    assert stats.active == 0
+    assert stats.cancelled["client"] == 1
+
+
+def test_failed_generation_is_reported_and_not_cached(client, tts_main, monkeypatch):
+    tts_main.app.state.tts_service.model = StubModel(fail_after=2)
+    monkeypatch.setattr(tts_main, "phrase_cache_max_chars", 200)
+    stored = []
+    monkeypatch.setattr(tts_main.phrase_cache, "put", lambda key, phrase: stored.append(key))
+
+    with client.websocket_connect("/stream?text=Short+phrase") as ws:
+        messages, code = receive_until_closed(ws)
+    assert code == 1011
+    errors = [m["text"] for m in messages if m.get("text") and '"error"' in m["text"]]
+    assert len(errors) == 1 and "CUDA out of memory" in errors[0]
+
+    stats = scheduler(tts_main)
+    wait_until(lambda: stats.served == 1)
+    assert stored == []
+    assert len(stats.recent_generations) == 0
+    assert stats.failed == 1
+    assert stats.active == 0
+
+
+def test_idle_incremental_sessions_hold_no_slot(client, tts_main):
+    """More incremental sessions than slots waiting for text: another client still gets audio right away"""
+    tts_main.app.state.tts_service.model = StubModel(frames=3)
+    stats = scheduler(tts_main)
+    idle = [client.websocket_connect("/stream?mode=incremental") for _ in range(stats.max_sessions + 1)]
+    sockets = [connection.__enter__() for connection in idle]
+    try:
+        time.sleep(0.1)
+        assert stats.active == 0
+        with client.websocket_connect("/stream?text=Meanwhile") as ws:
+            while ws.receive().get("bytes") is None:
+                pass
+        # The idle sessions still synthesize once their text arrives
+        for ws in sockets:
+            ws.send_json({"text": "Finally.", "done": True})
+            assert ws.receive_json() == {"unit": "Finally."}
+            assert ws.receive().get("bytes")
+    finally:
+        for connection in idle:
+            connection.__exit__(None, None, None)
+    wait_until(lambda: stats.active == 0 and stats.served == len(idle) + 1)
+
+
+def test_cached_phrase_replays_without_a_slot(client, tts_main, monkeypatch):
+    """With every slot busy generating, a cached phrase is still replayed right away"""
+    service = tts_main.app.state.tts_service
+    stats = scheduler(tts_main)
+    monkeypatch.setattr(tts_main, "phrase_cache_max_chars", 200)
+    service.model = StubModel(frames=3)
+    with client.websocket_connect("/stream?text=A+cached+phrase.") as ws:
+        receive_until_closed(ws)
+    wait_until(lambda: tts_main.phrase_cache.stats()["memory_entries"] > 0)
+
+    service.model = StubModel()  # generation without end, for the sessions holding the slots
+    busy = [client.websocket_connect(f"/stream?text=Busy+{i}") for i in range(stats.max_sessions)]
+    sockets = [connection.__enter__() for connection in busy]
+    try:
+        for ws in sockets:
+            while ws.receive().get("bytes") is None:
+                pass
+        assert stats.active == stats.max_sessions
+        with client.websocket_connect("/stream?text=A+cached+phrase.") as ws:
+            messages, code = receive_until_closed(ws)
+        assert code == 1000
+        assert sum(m.get("bytes") is not None for m in messages) == 3
+        assert stats.waiting == 0
+    finally:
+        for connection in busy:
+            connection.__exit__(None, None, None)
+    wait_until(lambda: stats.active == 0)
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from conftest import StubRecognizer
+from resample import StreamingResampler
+
+RATE = 24_000
+# Onsets of the bursts in the test audio, in seconds; several fall close to the chunk edges below
+BURSTS_S = [0.05, 0.2113, 0.3, 0.4, 0.65, 0.8011, 1.0, 1.237, 1.5, 1.74]
+BURST_S = 0.03
+
+
+def chunk_sizes(total: int, seed: int):
+    """Random chunk sizes covering `total` samples, from a single sample up to 200 ms"""
+    rng = np.random.default_rng(seed)
+    sizes = []
+    while sum(sizes) < total:
+        sizes.append(int(rng.choice([1, 7, rng.integers(2, 4800), 2400, 3200])))
+    sizes[-1] -= sum(sizes) - total
+    return sizes
+
+
+def split(audio: np.ndarray, sizes):
+    return np.split(audio, np.cumsum(sizes)[:-1])
+
+
+def bursts(seconds: float = 2.0) -> np.ndarray:
+    audio = np.zeros(int(seconds * RATE), dtype=np.float32)
+    for start in BURSTS_S:
+        audio[round(start * RATE):round((start + BURST_S) * RATE)] = 0.5
+    return audio
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_chunked_resampling_matches_one_shot(seed):
+    rng = np.random.default_rng(seed)
+    audio = rng.uniform(-1, 1, RATE).astype(np.float32)
+    whole = StreamingResampler()
+    expected = np.concatenate([whole.process(audio), whole.flush()])
+
+    resampler = StreamingResampler()
+    chunks = [resampler.process(chunk) for chunk in split(audio, chunk_sizes(audio.size, seed))]
+    chunked = np.concatenate(chunks + [resampler.flush()])
+    assert chunked.size == expected.size == audio.size * 2 // 3
+    np.testing.assert_allclose(chunked, expected, atol=1e-5)
+
+
+def test_resampling_keeps_the_time_base():
+    """Output sample n is the input signal at n / 16000: a sine comes out at the same phase"""
+    t = np.arange(RATE) / RATE
+    resampler = StreamingResampler()
+    output = np.concatenate([resampler.process(np.sin(2 * np.pi * 440 * t)), resampler.flush()])
+    t16 = np.arange(output.size) / 16_000
+    inner = slice(100, -100)  # away from the filter's start-up and the silence after the end
+    np.testing.assert_allclose(output[inner], np.sin(2 * np.pi * 440 * t16)[inner], atol=2e-3)
+
+
+def viseme_times(tts_main, audio: np.ndarray, sizes) -> list:
+    """Stream times of the viseme events, computed per chunk the way /stream does"""
+    from visemes import CONTEXT_S
+
+    recognizer = StubRecognizer()
+    session = tts_main.TTSSession(text="", voice="en-Test")
+    times = []
+    for chunk in split(audio, sizes):
+        chunk_start_s = session.audio_samples / RATE
+        combined = tts_main.advance_viseme_context(session, chunk)
+        events = tts_main.to_viseme_events(recognizer, recognizer.recognize(combined), combined, skip_s=CONTEXT_S)
+        times += [chunk_start_s + event["t"] for event in events]
+        session.add_audio(chunk.size)
+    return times
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_viseme_times_stay_aligned_across_chunks(tts_main, seed):
+    audio = bursts()
+    one_shot = viseme_times(tts_main, audio, [audio.size])
+    chunked = viseme_times(tts_main, audio, chunk_sizes(audio.size, seed))
+
+    # Every burst once, none lost or repeated at a chunk edge, at its true time
+    assert len(chunked) == len(one_shot) == len(BURSTS_S)
+    np.testing.assert_allclose(chunked, BURSTS_S, atol=0.002)
+    np.testing.assert_allclose(chunked, one_shot, atol=0.002)
@@ -0,0 +1,56 @@
+import pytest
+import torch
+
+from conftest import StubModel
+from voices import UnknownVoice, VoiceCache
+
+
+def test_failed_load_leaves_no_loading_lock(tmp_path):
+    cache = VoiceCache(str(tmp_path), torch.device("cpu"), budget_bytes=2**20)
+    for _ in range(2):
+        with pytest.raises(UnknownVoice):
+            cache.get("missing")
+    assert cache._loading == {}
+
+    (tmp_path / "corrupt.pt").write_bytes(b"not a preset")
+    with pytest.raises(Exception):
+        cache.get("corrupt")
+    assert cache._loading == {}
+
+
+def cache_with_voice(tmp_path, **kwargs):
+    torch.save({"prompt": torch.zeros(4, 8)}, tmp_path / "voice.pt")
+    cache = VoiceCache(str(tmp_path), torch.device("cpu"), budget_bytes=2**20, **kwargs)
+    return cache, cache.get("voice")
+
+
+def test_tensors_are_cloned_until_sharing_is_verified(tmp_path):
+    cache, preset = cache_with_voice(tmp_path)
+    assert cache.fork(preset)["prompt"] is not preset.prompt["prompt"]
+    assert cache.fork(preset, trial=True)["prompt"] is preset.prompt["prompt"]
+    assert cache.verify_sharing(preset)
+    assert cache.fork(preset)["prompt"] is preset.prompt["prompt"]
+
+
+def test_in_place_write_in_the_trial_keeps_cloning(tmp_path):
+    cache, preset = cache_with_voice(tmp_path)
+    cache.fork(preset, trial=True)["prompt"].add_(1)
+    assert not cache.verify_sharing(preset)
+    assert cache.stats()["cached_mib"] == {}
+    fresh = cache.get("voice")
+    assert cache.fork(fresh, trial=True)["prompt"] is not fresh.prompt["prompt"]
+    assert not cache.verify_sharing(fresh)
+
+
+def test_clone_tensors_never_shares(tmp_path):
+    cache, preset = cache_with_voice(tmp_path, clone_tensors=True)
+    assert cache.fork(preset, trial=True)["prompt"] is not preset.prompt["prompt"]
+    assert not cache.verify_sharing(preset)
+
+
+def test_warmup_enables_sharing(client):
+    service = client.app.state.tts_service
+    service.model = StubModel(frames=3)
+    assert service.voices.clone_tensors
+    assert service.warmup("Hello there.") > 0
+    assert not service.voices.clone_tensors